@@ -0,0 +1,69 @@
+"""Compare peak memory and throughput of reading a C4 shard with `readlines` and with the streaming json lines reader.
+
+A synthetic gzipped shard of `n_docs` documents of roughly `doc_size` characters is created. Each mode runs in a fresh
+interpreter and reports the documents per second and the growth of the peak RSS while reading the shard.
+
+Usage:
+    python benchmarks/c4_json.py main --n_docs 100000 --doc_size 2000
+"""
+import gzip
+import json
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+import fire
+import fsspec
+from squirrel.serialization import JsonSerializer
+
+from squirrel_datasets_core.datasets.allenai_c4 import C4DatasetDriver
+
+
+def _readlines(url: str) -> Iterator[Any]:
+    """C4DatasetDriver.get before streaming was introduced."""
+    ser = JsonSerializer()
+    with fsspec.open(url, compression="gzip", mode="r") as f:
+        for line in f.readlines():
+            yield ser.deserialize(line)
+
+
+def run(url: str, mode: str) -> None:
+    """Read the shard and print the statistics as json."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.perf_counter()
+    if mode == "readlines":
+        n = sum(1 for _ in _readlines(url))
+    elif mode == "stream":
+        n = sum(1 for _ in C4DatasetDriver.get(url))
+    else:
+        n = sum(len(batch) for batch in C4DatasetDriver.get(url, batch_size=1024))
+    duration = time.perf_counter() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print(json.dumps({"docs/s": round(n / duration), "peak RSS growth MB": round(peak / 2**10, 1)}))
+
+
+def main(n_docs: int = 100_000, doc_size: int = 2000, seed: int = 0) -> None:
+    """Print docs/s and peak RSS of reading a shard with each mode."""
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(5000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        url = str(Path(tmp) / "c4-train.00000-of-01024.json.gz")
+        with gzip.open(url, "wt", compresslevel=1) as f:
+            for i in range(n_docs):
+                text = " ".join(rng.choices(words, k=doc_size // 6))
+                doc = {"text": text, "timestamp": "2020-01-01T00:00:00Z", "url": f"https://example.com/{i}"}
+                f.write(json.dumps(doc) + "\n")
+
+        for mode in ("readlines", "stream", "batched"):
+            out = subprocess.check_output([sys.executable, __file__, "run", url, mode], text=True)
+            print(f"{mode:>10}: {out.strip()}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"main": main, "run": run})
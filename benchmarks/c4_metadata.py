@@ -0,0 +1,58 @@
+"""Measure the cost of the C4 shard metadata: import time, catalog loading and the pickled size of the driver.
+
+The shard urls are stored as url templates and numbers of shards, see `allenai_c4/constants.py`, and compared to the
+eagerly expanded lists of urls in `C4_MULTILINGUAL_CONFIG`. Every timing runs in a fresh interpreter.
+
+Usage:
+    python benchmarks/c4_metadata.py main --repeat 5
+"""
+import pickle
+import subprocess
+import sys
+import time
+
+import fire
+
+
+def run(mode: str) -> None:
+    """Print the seconds it takes to import the constants, expand all urls or load the plugin catalog."""
+    # the dependencies of the driver are imported beforehand, so that mostly the shard metadata is timed
+    import numpy  # noqa: F401
+    import squirrel.driver  # noqa: F401
+    import squirrel_datasets_core.io  # noqa: F401
+    from squirrel.catalog import Catalog
+
+    t = time.perf_counter()
+    if mode == "catalog":
+        Catalog.from_plugins()
+    else:
+        from squirrel_datasets_core.datasets.allenai_c4 import constants
+
+        if mode == "expanded":
+            constants.C4_MULTILINGUAL_CONFIG
+    print(time.perf_counter() - t)
+
+
+def _time(mode: str, repeat: int) -> float:
+    return min(float(subprocess.check_output([sys.executable, __file__, "run", mode])) for _ in range(repeat))
+
+
+def main(repeat: int = 5) -> None:
+    """Print the timings and the pickled size of the driver with url templates and with lists of urls."""
+    from squirrel_datasets_core.datasets.allenai_c4 import SOURCES, C4DatasetDriver
+    from squirrel_datasets_core.datasets.allenai_c4.constants import C4_MULTILINGUAL_CONFIG
+
+    templates = C4DatasetDriver(**SOURCES[0][1].driver_kwargs)
+    expanded = C4DatasetDriver(dict(C4_MULTILINGUAL_CONFIG))
+    print(f"{len(templates.select().keys())} shards")
+    for name, driver in (("templates", templates), ("url lists", expanded)):
+        size = len(pickle.dumps(driver.select()))
+        print(f"{name:>9}: pickled driver {size / 1e3:,.1f}kB")
+
+    print(f"import constants: {_time('import', repeat) * 1e3:.1f}ms")
+    print(f"import constants and expand all urls: {_time('expanded', repeat) * 1e3:.1f}ms")
+    print(f"Catalog.from_plugins: {_time('catalog', repeat) * 1e3:.1f}ms")
+
+
+if __name__ == "__main__":
+    fire.Fire({"main": main, "run": run})
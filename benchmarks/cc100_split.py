@@ -0,0 +1,63 @@
+"""Compare peak memory and throughput of splitting a CC100 shard after reading it completely and while streaming it.
+
+A synthetic xz shard with documents separated by blank lines is created. Each mode runs in a fresh interpreter and
+reports the documents per second and the growth of the peak RSS while reading the shard.
+
+Usage:
+    python benchmarks/cc100_split.py main --n_docs 300000 --doc_size 600
+"""
+import json
+import lzma
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import fire
+import fsspec
+
+from squirrel_datasets_core.datasets.cc100 import CC100Driver
+
+
+def _read_all(url: str) -> List[Dict[str, str]]:
+    """CC100Driver.get before streaming was introduced."""
+    with fsspec.open(url, "rb", compression="xz") as fp:
+        text = "".join([line.decode("utf-8") for line in fp.readlines()])
+
+    return [{"text": elem} for elem in text.split("\n\n")]
+
+
+def run(url: str, mode: str) -> None:
+    """Read the shard and print the statistics as json."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.perf_counter()
+    docs = _read_all(url) if mode == "read all" else CC100Driver.get(url, compression="xz")
+    n = sum(1 for _ in docs)
+    duration = time.perf_counter() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print(json.dumps({"docs/s": round(n / duration), "peak RSS growth MB": round(peak / 2**10, 1)}))
+
+
+def main(n_docs: int = 300_000, doc_size: int = 600, seed: int = 0) -> None:
+    """Print docs/s and peak RSS of reading a shard with each mode."""
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(5000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        url = str(Path(tmp) / "af.txt.xz")
+        with lzma.open(url, "wt", preset=0) as f:
+            for i in range(n_docs):
+                lines = [" ".join(rng.choices(words, k=doc_size // 60)) for _ in range(10)]
+                f.write(("\n\n" if i else "") + "\n".join(lines))
+
+        for mode in ("read all", "stream"):
+            out = subprocess.check_output([sys.executable, __file__, "run", url, mode], text=True)
+            print(f"{mode:>8}: {out.strip()}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"main": main, "run": run})
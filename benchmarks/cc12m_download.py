@@ -0,0 +1,129 @@
+"""Compare the throughput of downloading Conceptual Captions images with threads and with asyncio.
+
+A local aiohttp server stands in for the image hosts of the dataset. It listens on `n_hosts` ports, i.e. hosts, and
+serves an index of `n_images` urls and synthetic JPEG images with a random latency of up to `max_latency` seconds. A
+fraction `error_rate` of the urls fail with 404 and the same fraction fails once with 503. The server runs in its own
+process, each mode in a fresh interpreter that reports the samples per second and the number of samples.
+
+Modes:
+    urllib: blocking requests on a pool of `threads` threads, the default of :py:class:`CC12MDriver`.
+    aiohttp: :py:func:`squirrel_datasets_core.io.fetch_urls` with `concurrency` connections.
+    aiohttp+cache: two epochs with a :py:class:`squirrel_datasets_core.io.DownloadCache`, the second epoch reads the
+        images from the cache and skips the urls that were not found.
+    urllib+processes, aiohttp+processes: the threads or the event loop only download, the images are decoded by a
+        pool of one process per CPU with :py:func:`squirrel_datasets_core.io.decode_images`.
+
+Usage:
+    python benchmarks/cc12m_download.py main --n_images 5000 --max_latency 0.5
+"""
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+import fire
+import numpy as np
+from aiohttp import web
+from PIL import Image
+
+from squirrel_datasets_core.datasets.conceptual_captions.driver import CC12MDriver
+
+
+def serve(port: int, n_hosts: int, n_images: int, max_latency: float, error_rate: float, seed: int = 0) -> None:
+    """Serve the index on `port` and images on `port` to `port + n_hosts - 1`."""
+    rng = random.Random(seed)
+    images = []
+    for _ in range(16):
+        img = (np.random.default_rng(len(images)).random((256, 256, 3)) * 255).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(img).save(buf, format="JPEG")
+        images.append(buf.getvalue())
+    urls = [f"http://127.0.0.1:{port + i % n_hosts}/{i}.jpg" for i in range(n_images)]
+    index = "\n".join(f"{url}\tcaption {i}" for i, url in enumerate(urls)).encode()
+    missing = set(rng.sample(range(n_images), int(error_rate * n_images)))
+    flaky = set(rng.sample(range(n_images), int(error_rate * n_images))) - missing
+
+    async def handler(request: web.Request) -> web.Response:
+        path = request.match_info["path"]
+        if path == "index.tsv":
+            return web.Response(body=index)
+        i = int(path.split(".")[0])
+        await asyncio.sleep(rng.uniform(0, max_latency))
+        if i in missing:
+            return web.Response(status=404)
+        if i in flaky:
+            flaky.discard(i)
+            return web.Response(status=503)
+        return web.Response(body=images[i % len(images)], content_type="image/jpeg")
+
+    async def start() -> None:
+        app = web.Application()
+        app.router.add_get("/{path}", handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        for i in range(n_hosts):
+            await web.TCPSite(runner, "127.0.0.1", port + i, backlog=4096).start()
+        print("ready", flush=True)
+        await asyncio.Event().wait()
+
+    asyncio.run(start())
+
+
+def run(index_url: str, mode: str, threads: int, concurrency: int) -> None:
+    """Download all images of the index and print the statistics of every epoch as json."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        driver = CC12MDriver(index_url, cache_dir=cache_dir if mode == "aiohttp+cache" else None)
+        kwargs = dict(shuffle_key_buffer=1, shuffle_item_buffer=1)
+        if mode.endswith("+processes"):
+            kwargs.update(decode_workers=os.cpu_count(), decode_buffer=4 * os.cpu_count())
+        if mode.startswith("urllib"):
+            kwargs.update(prefetch_buffer=threads, max_workers=threads)
+        else:
+            fetch_kwargs = {"concurrency": concurrency, "limit_per_host": concurrency, "backoff": 0.1}
+            kwargs.update(downloader="aiohttp", fetch_kwargs=fetch_kwargs, max_workers=0)
+        stats = []
+        for _ in range(2 if mode == "aiohttp+cache" else 1):
+            t = time.perf_counter()
+            n = sum(1 for _ in driver.get_iter(**kwargs))
+            stats.append({"samples/s": round(n / (time.perf_counter() - t), 1), "samples": n})
+    print(json.dumps(stats))
+
+
+def main(
+    n_images: int = 5000,
+    n_hosts: int = 8,
+    max_latency: float = 0.5,
+    error_rate: float = 0.05,
+    threads: List[int] = (32, 128),
+    concurrency: List[int] = (256, 1024),
+    port: int = 18_800,
+) -> None:
+    """Print samples/s and downloaded samples of each mode."""
+    index_url = f"http://127.0.0.1:{port}/index.tsv"
+    modes = [("urllib", n, 0) for n in threads] + [("aiohttp", 0, n) for n in concurrency]
+    modes.append(("aiohttp+cache", 0, concurrency[-1]))
+    modes += [("urllib+processes", threads[-1], 0), ("aiohttp+processes", 0, concurrency[-1])]
+    for mode, n_threads, n_connections in modes:
+        # a fresh server for every mode, so that every mode sees the same failures
+        server_args = [str(port), str(n_hosts), str(n_images), str(max_latency), str(error_rate)]
+        server = subprocess.Popen([sys.executable, __file__, "serve", *server_args], stdout=subprocess.PIPE, text=True)
+        try:
+            server.stdout.readline()
+            args = [index_url, mode, str(n_threads), str(n_connections)]
+            out = subprocess.check_output([sys.executable, __file__, "run", *args], text=True)
+        finally:
+            server.kill()
+            server.wait()
+        name = f"{mode} ({n_threads or n_connections})"
+        # the driver logs failed downloads to stdout, the statistics are on the last line
+        print(f"{name:>21}: {out.strip().splitlines()[-1]}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"main": main, "run": run, "serve": serve})
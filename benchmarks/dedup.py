@@ -0,0 +1,75 @@
+"""Compare throughput and peak memory of deduplicating documents with a Python set and with the dedup stages.
+
+Synthetic documents of `n_words` words are generated, of which `dup_fraction` are exact copies of earlier documents.
+Each mode runs in a fresh interpreter and reports the documents per second, the number of kept documents and the growth
+of the peak RSS while deduplicating. The mode "none" only generates the documents.
+
+Usage:
+    python benchmarks/dedup.py main --n_docs 100000 --n_words 300
+"""
+import json
+import random
+import resource
+import string
+import subprocess
+import sys
+import time
+from typing import Iterator
+
+import fire
+
+from squirrel_datasets_core.preprocessing.dedup import ExactDedup, MinHashDedup, deduplicate
+
+
+def _documents(n_docs: int, n_words: int, dup_fraction: float, seed: int) -> Iterator[str]:
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(20000)]
+    docs = []
+    for _ in range(n_docs):
+        if docs and rng.random() < dup_fraction:
+            yield rng.choice(docs)
+        else:
+            docs.append(" ".join(rng.choices(words, k=n_words)))
+            yield docs[-1]
+            # only keep a window of documents to duplicate, so that the generator does not hold the whole corpus
+            docs = docs[-1000:]
+
+
+def _python_set(docs: Iterator[str]) -> Iterator[str]:
+    seen = set()
+    for doc in docs:
+        if doc not in seen:
+            seen.add(doc)
+            yield doc
+
+
+def run(mode: str, n_docs: int, n_words: int, dup_fraction: float, seed: int = 0) -> None:
+    """Deduplicate the documents and print the statistics as json."""
+    docs = _documents(n_docs, n_words, dup_fraction, seed)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.perf_counter()
+    if mode == "none":
+        kept = sum(1 for _ in docs)
+    elif mode == "set":
+        kept = sum(1 for _ in _python_set(docs))
+    elif mode == "exact":
+        kept = sum(1 for _ in deduplicate(docs, ExactDedup(capacity=n_docs)))
+    else:
+        kept = sum(1 for _ in deduplicate(docs, MinHashDedup(capacity=n_docs)))
+    duration = time.perf_counter() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print(
+        json.dumps({"docs/s": round(n_docs / duration), "kept": kept, "peak RSS growth MB": round(peak / 2**10, 1)})
+    )
+
+
+def main(n_docs: int = 100_000, n_words: int = 300, dup_fraction: float = 0.1) -> None:
+    """Print docs/s, kept documents and peak RSS of each mode."""
+    for mode in ("none", "set", "exact", "minhash"):
+        args = [mode, str(n_docs), str(n_words), str(dup_fraction)]
+        out = subprocess.check_output([sys.executable, __file__, "run", *args], text=True)
+        print(f"{mode:>8}: {out.strip()}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"main": main, "run": run})
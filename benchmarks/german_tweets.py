@@ -0,0 +1,117 @@
+"""Compare throughput and peak memory of parsing a Monthly German Tweets archive by splitting and with streaming.
+
+A synthetic gzipped archive with a json array of about `size_mb` MB of tweets is created, in the layout of the dataset
+with one tweet per line. Some tweets contain ",{" in their text, which the splitting parser cannot handle. Each mode
+runs in a fresh interpreter and reports the tweets per second, the number of parsed tweets and the growth of the peak
+RSS. The splitting parser needs about five times the size of the archive in memory. With `nested`, every tweet also
+holds a user object with 40 fields, like tweets from the Twitter API.
+
+Modes:
+    split: splitting the decoded archive at ",{", as before streaming was introduced.
+    raw_decode: streaming with :py:meth:`json.JSONDecoder.raw_decode` only.
+    stream: :py:meth:`MonthlyGermanTweetsDriver.get`, which parses the archive line by line.
+    fields: only the fields `FIELDS`, parsed lazily if pysimdjson is installed.
+    columns: only the fields `FIELDS`, as columns of 1024 tweets.
+
+Usage:
+    python benchmarks/german_tweets.py main --size_mb 2000 --nested
+"""
+import gzip
+import json
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator, List
+
+import fire
+import fsspec
+
+from squirrel_datasets_core.datasets.monthly_german_tweets import MonthlyGermanTweetsDriver
+from squirrel_datasets_core.io.text import DEFAULT_CHUNK_SIZE, _iter_json_array_raw
+
+FIELDS = ["id", "created_at", "text", "lang"]
+
+
+def _split(url: str) -> List[str]:
+    """MonthlyGermanTweetsDriver.parse_archive before streaming was introduced."""
+    with fsspec.open(url, "rb", compression="gzip") as f:
+        json_bytes = list(f)
+
+    dec = "".join([b.decode("utf-8").strip() for b in json_bytes])[1:-1]
+    return [(elem if elem.startswith("{") else "{" + elem) for elem in dec.split(",{")]
+
+
+def _split_tweets(url: str) -> Iterator[dict]:
+    for s in _split(url):
+        try:
+            yield json.loads(s)
+        except json.JSONDecodeError:
+            pass
+
+
+def run(url: str, mode: str) -> None:
+    """Parse the archive and print the statistics as json."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.perf_counter()
+    driver = MonthlyGermanTweetsDriver(Path(url).parent)
+    if mode == "split":
+        n = sum(1 for _ in _split_tweets(url))
+    elif mode == "raw_decode":
+        with fsspec.open(url, "rb", compression="gzip") as f:
+            n = sum(1 for _ in _iter_json_array_raw(f, DEFAULT_CHUNK_SIZE, b"", "["))
+    elif mode == "stream":
+        n = sum(1 for _ in driver.get(url))
+    elif mode == "fields":
+        n = sum(1 for _ in driver.get(url, fields=FIELDS))
+    else:
+        n = sum(len(batch["id"]) for batch in driver.get(url, fields=FIELDS, batch_size=1024))
+    duration = time.perf_counter() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print(json.dumps({"tweets/s": round(n / duration), "tweets": n, "peak RSS growth MB": round(peak / 2**10, 1)}))
+
+
+def main(size_mb: int = 2000, nested: bool = False, seed: int = 0) -> None:
+    """Print tweets/s, parsed tweets and peak RSS of each mode."""
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase + "äöüß", k=rng.randint(2, 10))) for _ in range(5000)]
+    n_tweets = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        url = str(Path(tmp) / "2020-01.json.gz")
+        with gzip.open(url, "wt", encoding="utf-8", compresslevel=1) as f:
+            f.write("[\n")
+            size = 0
+            while size < size_mb * 2**20:
+                text = " ".join(rng.choices(words, k=20))
+                if rng.random() < 0.01:
+                    text += ' ,{"quoted": true}'
+                tweet = {
+                    "type": "tweet",
+                    "id": str(10**18 + n_tweets),
+                    "user": f"user{rng.randint(0, 10**6)}",
+                    "created_at": "2020-01-01T00:00:00",
+                    "text": text,
+                    "retweets": rng.randint(0, 100),
+                    "favourites": rng.randint(0, 100),
+                    "lang": "de",
+                    "hashtags": rng.choices(words, k=2),
+                }
+                if nested:
+                    tweet["user"] = {f"field{i}": rng.choice(words) for i in range(40)}
+                line = ("," if n_tweets else "") + json.dumps(tweet, ensure_ascii=False) + "\n"
+                size += f.write(line)
+                n_tweets += 1
+            f.write("]\n")
+
+        print(f"{n_tweets} tweets, {size / 2**20:.0f}MB")
+        for mode in ("split", "raw_decode", "stream", "fields", "columns"):
+            out = subprocess.check_output([sys.executable, __file__, "run", url, mode], text=True)
+            print(f"{mode:>10}: {out.strip()}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"main": main, "run": run})
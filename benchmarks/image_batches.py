@@ -0,0 +1,46 @@
+"""Compare loading images one by one with :py:func:`squirrel_datasets_core.io.load_images`.
+
+Usage:
+    python benchmarks/image_batches.py --n 512 --batch_size 32 --resolution 512
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import fire
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "test" / "test_datasets"))
+
+from mock_utils import create_image_folder  # noqa: E402
+
+from squirrel_datasets_core.io import load_image, load_images  # noqa: E402
+
+
+def main(
+    n: int = 512, batch_size: int = 32, resolution: int = 512, max_workers: Optional[int] = None, repeat: int = 3
+) -> None:
+    """Print images/s of sequential and batched loading of `n` JPEGs, stacked into batches of `batch_size`."""
+    with tempfile.TemporaryDirectory() as tmp:
+        create_image_folder(Path(tmp), n, (resolution, resolution), format="JPEG")
+        paths = sorted(str(p) for p in Path(tmp).iterdir())
+        batches = [paths[i : i + batch_size] for i in range(0, n, batch_size)]
+
+        modes = {
+            "sequential": lambda batch: np.stack([load_image(p) for p in batch]),
+            "load_images": lambda batch: load_images(batch, max_workers=max_workers),
+        }
+        for name, load in modes.items():
+            best = float("inf")
+            for _ in range(repeat):
+                t = time.perf_counter()
+                for batch in batches:
+                    load(batch)
+                best = min(best, time.perf_counter() - t)
+            print(f"{name:>12}: {n / best:8.1f} images/s")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
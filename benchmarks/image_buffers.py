@@ -0,0 +1,68 @@
+"""Measure memory usage of :py:func:`squirrel_datasets_core.io.load_image` with fresh arrays and with a buffer pool.
+
+Images are consumed in batches (e.g. collated into a tensor) and released afterwards. Every mode runs in a fresh
+interpreter to get independent peak RSS values.
+
+Usage:
+    python benchmarks/image_buffers.py main --n 10000 --batch_size 32 --decoder simplejpeg
+"""
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+import fire
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "test" / "test_datasets"))
+
+from mock_utils import create_image_folder  # noqa: E402
+
+from squirrel_datasets_core.io import BufferPool, load_image  # noqa: E402
+
+
+def run(folder: str, mode: str, n: int, batch_size: int, decoder: Optional[str] = None) -> None:
+    """Decode `n` images from `folder` and print statistics as json."""
+    paths = sorted(str(p) for p in Path(folder).iterdir())
+    pool = BufferPool(max_buffers_per_shape=batch_size) if mode == "pool" else None
+
+    tracemalloc.start()
+    t = time.perf_counter()
+    batch = []
+    for i in range(n):
+        batch.append(load_image(paths[i % len(paths)], decoder=decoder, out=pool))
+        if len(batch) == batch_size:
+            if pool is not None:
+                for img in batch:
+                    pool.release(img)
+            batch = []
+    duration = time.perf_counter() - t
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = {
+        "images/s": round(n / duration, 1),
+        "array allocations": n if pool is None else pool.misses,
+        "traced peak MB": round(peak / 2**20, 1),
+        "max RSS MB": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10, 1),
+    }
+    print(json.dumps(stats))
+
+
+def main(n: int = 10_000, batch_size: int = 32, resolution: int = 512, decoder: Optional[str] = None) -> None:
+    """Print memory statistics for decoding `n` JPEGs into new arrays and into pooled buffers."""
+    with tempfile.TemporaryDirectory() as tmp:
+        create_image_folder(Path(tmp), 64, (resolution, resolution), format="JPEG")
+        for mode in ("new", "pool"):
+            cmd = [sys.executable, __file__, "run", tmp, mode, str(n), str(batch_size)]
+            if decoder is not None:
+                cmd += ["--decoder", decoder]
+            print(f"{mode:>4}: {subprocess.check_output(cmd, text=True).strip()}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"main": main, "run": run})
@@ -0,0 +1,47 @@
+"""Compare the throughput of the image decoders of :py:func:`squirrel_datasets_core.io.load_image`.
+
+The images are created like the fixtures of the unit tests: random JPEGs as in the ImageNet tests and random RGBA PNGs
+as in the CamVid tests.
+
+Usage:
+    python benchmarks/image_decoders.py --n 200 --resolution 512
+    python benchmarks/image_decoders.py --n 200 --resolution 1024 --target_size 224  # reduced-size JPEG decoding
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import fire
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "test" / "test_datasets"))
+
+from mock_utils import create_image_folder  # noqa: E402
+
+from squirrel_datasets_core.io import available_decoders, load_image  # noqa: E402
+from squirrel_datasets_core.io.decoders import DECODERS  # noqa: E402
+
+
+def main(n: int = 200, resolution: int = 512, repeat: int = 3, target_size: Optional[int] = None) -> None:
+    """Print images/s of every installed decoder for JPEG and PNG images, optionally decoded at `target_size`."""
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ("JPEG", "png"):
+            folder = Path(tmp) / fmt
+            create_image_folder(folder, n, (resolution, resolution), format=fmt)
+            paths = [str(p) for p in folder.iterdir()]
+
+            for name in available_decoders():
+                if not DECODERS[name].supports(fmt.lower()):
+                    continue
+                best = float("inf")
+                for _ in range(repeat):
+                    t = time.perf_counter()
+                    for p in paths:
+                        load_image(p, decoder=name, target_size=target_size)
+                    best = min(best, time.perf_counter() - t)
+                print(f"{fmt:>4} {name:>12}: {n / best:8.1f} images/s")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,100 @@
+"""Compare startup time and memory of a worker that loads the ImageNet bounding boxes from text and from the index.
+
+A synthetic LOC_train_solution.csv with the size of the real one is created. Each mode runs in a fresh interpreter,
+like a DataLoader worker, loads the bounding box mapping and looks up the boxes of all files. Memory is reported as the
+anonymous memory of the process, which every additional worker costs, and as RSS, which also counts the memory-mapped
+index pages that are backed by the page cache and shared between workers.
+
+Usage:
+    python benchmarks/imagenet_index.py --n_files 544546
+"""
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import fire
+
+from squirrel_datasets_core.datasets.imagenet.index import BboxIndex, load_index
+
+
+def _memory_mb() -> Dict[str, float]:
+    """Anonymous and resident (RSS) memory of the current process in MB."""
+    stats = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, value = line.split(":")
+            if key in ("Rss", "Anonymous"):
+                stats[key] = int(value.split()[0]) / 2**10
+    return stats
+
+
+def _parse_text(url: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Bounding box parsing of RawImageNetDriver.get_loc_mapper before the index was introduced."""
+    loc_map = dict()
+    with open(url) as f:
+        f.readline()
+        for row in f.readlines():
+            file_name, bboxes_raw = row.strip().split(",")
+            bboxes = []
+            for bbox_raw in bboxes_raw.split("n")[1:]:
+                class_id, *x = bbox_raw.strip().split(" ")
+                bboxes.append({"class_id": f"n{class_id}", "loc": [int(ax) for ax in x]})
+            loc_map[file_name] = bboxes
+    return loc_map
+
+
+def run(url: str, mode: str, index_dir: str) -> None:
+    """Load the bounding boxes in a worker and print the statistics as json."""
+    with open(url) as f:
+        names = [row.split(",", 1)[0] for row in f.readlines()[1:]]
+
+    before = _memory_mb()
+    t = time.perf_counter()
+    loc_map = _parse_text(url) if mode == "text" else BboxIndex(load_index(url, "loc", index_dir))
+    startup = time.perf_counter() - t
+    loaded = _memory_mb()
+
+    t = time.perf_counter()
+    n_boxes = sum(len(loc_map.get(name)) for name in names)
+    lookup = time.perf_counter() - t
+    after = _memory_mb()
+
+    stats = {
+        "startup s": round(startup, 2),
+        "lookup us/file": round(lookup / len(names) * 1e6, 2),
+        "boxes": n_boxes,
+        "anonymous after load MB": round(loaded["Anonymous"] - before["Anonymous"], 1),
+        "anonymous after lookups MB": round(after["Anonymous"] - before["Anonymous"], 1),
+        "RSS after lookups MB": round(after["Rss"] - before["Rss"], 1),
+    }
+    print(json.dumps(stats))
+
+
+def main(n_files: int = 544_546, n_classes: int = 1000, seed: int = 0) -> None:
+    """Print startup time and memory of a worker for the previous text parsing and for the index."""
+    rng = random.Random(seed)
+    classes = [f"n{rng.randrange(10**8):08d}" for _ in range(n_classes)]
+    with tempfile.TemporaryDirectory() as tmp:
+        url = str(Path(tmp) / "LOC_train_solution.csv")
+        with open(url, "w") as f:
+            f.write("ImageId,PredictionString\n")
+            for i in range(n_files):
+                cls = classes[i % n_classes]
+                boxes = " ".join(
+                    f"{cls} {' '.join(str(rng.randrange(500)) for _ in range(4))}"
+                    for _ in range(rng.choice((1, 1, 1, 2, 3)))
+                )
+                f.write(f"{cls}_{i},{boxes} \n")
+
+        for mode in ("text", "index (first worker, builds)", "index"):
+            cmd = [sys.executable, __file__, "run", url, mode.split()[0], str(Path(tmp) / "index")]
+            print(f"{mode:>28}: {subprocess.check_output(cmd, text=True).strip()}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"main": main, "run": run})
@@ -0,0 +1,56 @@
+"""Compare the throughput of attaching ImageNet labels and bounding boxes per sample and in chunks.
+
+A synthetic listing of 1.28M train paths is labeled with the per-sample stages of
+:py:class:`~squirrel_datasets_core.datasets.imagenet.RawImageNetDriver` and with
+:py:class:`~squirrel_datasets_core.datasets.imagenet.index.LabelIndex`. Bounding boxes exist for every other file, as
+in LOC_train_solution.csv.
+
+Usage:
+    python benchmarks/imagenet_labels.py --n_classes 1000 --n_per_class 1281 --chunk_size 1024
+"""
+import tempfile
+import time
+from pathlib import Path
+
+import fire
+
+from squirrel_datasets_core.datasets.imagenet import RawImageNetDriver
+from squirrel_datasets_core.datasets.imagenet.index import BboxIndex, LabelIndex, load_index
+
+
+def main(n_classes: int = 1000, n_per_class: int = 1281, chunk_size: int = 1024) -> None:
+    """Print samples/s of both ways of attaching labels."""
+    class_ids = [f"n{i:08d}" for i in range(n_classes)]
+    urls = [f"gs://bucket/train/{c}/{c}_{i}.JPEG" for c in class_ids for i in range(n_per_class)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cls_url, loc_url = Path(tmp) / "map_clsloc.txt", Path(tmp) / "LOC_train_solution.csv"
+        cls_url.write_text("".join(f"{c} {i + 1} name_{i}\n" for i, c in enumerate(class_ids)))
+        with open(loc_url, "w") as f:
+            f.write("ImageId,PredictionString\n")
+            for c in class_ids:
+                for i in range(0, n_per_class, 2):
+                    f.write(f"{c}_{i},{c} 10 20 110 120 \n")
+
+        cls = load_index(str(cls_url), "cls", tmp)
+        loc_map = BboxIndex(load_index(str(loc_url), "loc", tmp))
+        driver = RawImageNetDriver(url=tmp, cls_mapping_url=str(cls_url), index_dir=tmp)
+        cls_map = driver.get_id_to_idx_and_name_mapper()
+
+        def per_sample() -> int:
+            it = ({"url": url} for url in urls)
+            it = RawImageNetDriver.parse_gt_train(it, cls_map=cls_map)
+            return sum(1 for _ in RawImageNetDriver.parse_bbox(it, cls_map=cls_map, loc_map=loc_map))
+
+        def chunked() -> int:
+            labels = LabelIndex(cls, loc=loc_map)
+            return sum(1 for _ in labels.attach(({"url": url} for url in urls), "train", chunk_size=chunk_size))
+
+        for name, run in (("per sample", per_sample), (f"chunks of {chunk_size}", chunked)):
+            t = time.perf_counter()
+            n = run()
+            print(f"{name:>16}: {n / (time.perf_counter() - t):10.0f} samples/s")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
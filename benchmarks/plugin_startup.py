@@ -0,0 +1,48 @@
+"""Benchmark cold start of :py:meth:`Catalog.from_plugins` with the plugin manifest and with eager discovery of the
+dataset packages (the behaviour without manifest).
+
+Every measurement runs in a fresh interpreter so that no module is cached.
+
+Usage:
+    python benchmarks/plugin_startup.py --repeat 5
+"""
+import statistics
+import subprocess
+import sys
+
+import fire
+
+MANIFEST = """
+import time
+t = time.perf_counter()
+from squirrel.catalog import Catalog
+Catalog.from_plugins()
+print(time.perf_counter() - t)
+"""
+
+EAGER = """
+import time
+t = time.perf_counter()
+from squirrel.catalog import Catalog
+from squirrel_datasets_core.squirrel_plugin import discover_sources
+cat = Catalog()
+for key, source in discover_sources():
+    cat[key.identifier][key.version] = source
+print(time.perf_counter() - t)
+"""
+
+
+def _run(code: str, repeat: int) -> list:
+    """Run `code` in `repeat` fresh interpreters and return the printed timings."""
+    return [float(subprocess.check_output([sys.executable, "-c", code], text=True).split()[-1]) for _ in range(repeat)]
+
+
+def main(repeat: int = 5) -> None:
+    """Print median and min cold start time of `Catalog.from_plugins()` for both registration modes."""
+    for name, code in [("eager discovery", EAGER), ("manifest", MANIFEST)]:
+        times = _run(code, repeat)
+        print(f"{name:>16}: median {statistics.median(times):.3f}s, min {min(times):.3f}s")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,99 @@
+"""Measure loading images over http with and without read-ahead and prefetching.
+
+A local http server stands in for remote storage. It answers every request, including range requests, after an
+injected latency and counts the requests it receives.
+
+Usage:
+    python benchmarks/remote_images.py --n 200 --latency 0.02 --prefetch 16
+"""
+import functools
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import fire
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "test" / "test_datasets"))
+
+from mock_utils import create_image_folder  # noqa: E402
+
+from squirrel_datasets_core.io import decode_image, get_filesystem, load_image, prefetch_files  # noqa: E402
+
+
+class LatencyHandler(SimpleHTTPRequestHandler):
+    """Serve files after a delay, with support for single range requests."""
+
+    latency = 0.0
+    requests = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args) -> None:
+        """Silence logging."""
+
+    def _delay(self) -> None:
+        with LatencyHandler.lock:
+            LatencyHandler.requests += 1
+        time.sleep(self.latency)
+
+    def do_HEAD(self) -> None:
+        """Answer HEAD requests after the latency."""
+        self._delay()
+        super().do_HEAD()
+
+    def do_GET(self) -> None:
+        """Answer GET requests after the latency, serving byte ranges if requested."""
+        self._delay()
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().do_GET()
+
+        with open(path, "rb") as f:
+            data = f.read()
+        start, end = int(match[1]), int(match[2] or len(data) - 1)
+        chunk = data[start : end + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{start + len(chunk) - 1}/{len(data)}")
+        self.send_header("Content-Length", str(len(chunk)))
+        self.end_headers()
+        self.wfile.write(chunk)
+
+
+def main(n: int = 200, resolution: int = 256, latency: float = 0.02, prefetch: int = 16) -> None:
+    """Print images/s and requests per image for loading `n` JPEGs from a server with `latency` seconds delay."""
+    with tempfile.TemporaryDirectory() as tmp:
+        create_image_folder(Path(tmp), n, (resolution, resolution), format="JPEG")
+        names = sorted(os.listdir(tmp))
+
+        LatencyHandler.latency = latency
+        server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(LatencyHandler, directory=tmp))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        urls = [f"http://127.0.0.1:{server.server_address[1]}/{name}" for name in names]
+        fs = get_filesystem(urls[0])
+
+        modes = {
+            "streaming": lambda: [load_image(url, fs=fs, read_ahead=False) for url in urls],
+            "read-ahead": lambda: [load_image(url, fs=fs, read_ahead=True) for url in urls],
+            f"prefetch {prefetch}": lambda: prefetch_files(urls, size=prefetch, fs=fs)
+            .map(lambda x: decode_image(x[1], x[0]))
+            .collect(),
+        }
+        try:
+            for name, run in modes.items():
+                fs.invalidate_cache()
+                LatencyHandler.requests = 0
+                t = time.perf_counter()
+                run()
+                duration = time.perf_counter() - t
+                print(f"{name:>12}: {n / duration:8.1f} images/s, {LatencyHandler.requests / n:.1f} requests/image")
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,71 @@
+"""Measure docs/s of the C4 and CC100 drivers with decompression in the reading thread and in background threads.
+
+A synthetic CC100 shard is written as xz file with one block per `block_size` bytes, like `xz -T0` does, and a
+synthetic C4 shard as gzip file. Every combination of core count and `decompress_workers` runs in a fresh interpreter
+that is pinned to the given number of cores.
+
+Usage:
+    python benchmarks/text_decompression.py main --n_docs 100000 --block_size 4000000
+"""
+import gzip
+import json
+import lzma
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import fire
+
+from squirrel_datasets_core.datasets.allenai_c4 import C4DatasetDriver
+from squirrel_datasets_core.datasets.cc100 import CC100Driver
+
+
+def run(url: str, workers: int, cores: int) -> None:
+    """Read the shard pinned to `cores` cores and print the docs/s."""
+    os.sched_setaffinity(0, sorted(os.sched_getaffinity(0))[:cores])
+    t = time.perf_counter()
+    if url.endswith(".xz"):
+        n = len(CC100Driver.get(url, compression="xz", decompress_workers=workers))
+    else:
+        n = sum(len(b) for b in C4DatasetDriver.get(url, batch_size=1024, decompress_workers=workers))
+    print(round(n / (time.perf_counter() - t)))
+
+
+def main(
+    n_docs: int = 100_000, doc_size: int = 2000, block_size: int = 4_000_000, cores: Optional[List[int]] = None
+) -> None:
+    """Print docs/s for every core count and number of decompression workers."""
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(5000)]
+    docs = [" ".join(rng.choices(words, k=doc_size // 6)) for _ in range(n_docs)]
+    available = len(os.sched_getaffinity(0))
+    cores = cores or [c for c in (1, 2, 4, 8, 16) if c <= available]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xz_url, gz_url = str(Path(tmp) / "en.txt.xz"), str(Path(tmp) / "c4-train.json.gz")
+        text = "\n\n".join(docs).encode()
+        with open(xz_url, "wb") as f:
+            for start in range(0, len(text), block_size):
+                f.write(lzma.compress(text[start : start + block_size], preset=1))
+        with gzip.open(gz_url, "wt", compresslevel=6) as f:
+            for i, doc in enumerate(docs):
+                f.write(json.dumps({"text": doc, "url": f"https://example.com/{i}"}) + "\n")
+
+        print(f"{available} cores available")
+        for name, url in (("cc100 (xz)", xz_url), ("c4 (gzip)", gz_url)):
+            for n_cores in cores:
+                results = {}
+                for workers in sorted({0, 1, max(n_cores, 2)}):
+                    out = subprocess.check_output([sys.executable, __file__, "run", url, str(workers), str(n_cores)])
+                    results[f"workers={workers}"] = int(out)
+                print(f"{name:>10}, {n_cores:>2} cores: {json.dumps(results)} docs/s")
+
+
+if __name__ == "__main__":
+    fire.Fire({"main": main, "run": run})
@@ -0,0 +1,69 @@
+"""Compare the throughput of tokenizing and packing documents in pure Python and with `tokenize_and_pack`.
+
+Synthetic documents of roughly `doc_size` characters are tokenized with the dependency-free
+:py:class:`WhitespaceTokenizer`, so the benchmark runs offline and mostly measures the overhead around the tokenizer.
+The Python baseline tokenizes every document on its own, collects the tokens in a list and converts each batch of
+sequences with `np.array`. The packing alone is also measured on pre-tokenized documents.
+
+Usage:
+    python benchmarks/tokenize_pack.py main --n_docs 20000 --seq_len 2048 --batch_size 8
+"""
+import random
+import string
+import time
+from typing import Iterator, List
+
+import fire
+import numpy as np
+
+from squirrel_datasets_core.preprocessing.packing import WhitespaceTokenizer, pack_tokens, tokenize_and_pack
+
+
+def _tokenize_each(docs: List[str]) -> Iterator[List[int]]:
+    """Tokenize the documents one at a time."""
+    tokenizer = WhitespaceTokenizer()
+    for doc in docs:
+        yield tokenizer([doc])[0]
+
+
+def _python(ids: Iterator[List[int]], seq_len: int, batch_size: int) -> Iterator[np.ndarray]:
+    """Pack the tokens of every document into lists, as commonly done in training loops."""
+    tokens, sequences = [], []
+    for doc_ids in ids:
+        tokens.extend(doc_ids + [0])
+        while len(tokens) >= seq_len:
+            sequences.append(tokens[:seq_len])
+            tokens = tokens[seq_len:]
+            if len(sequences) == batch_size:
+                yield np.array(sequences, dtype=np.int32)
+                sequences = []
+
+
+def main(n_docs: int = 20_000, doc_size: int = 2000, seq_len: int = 2048, batch_size: int = 8, seed: int = 0) -> None:
+    """Print tokens/s and arrays/s of each mode."""
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(5000)]
+    docs = [" ".join(rng.choices(words, k=doc_size // 6)) for _ in range(n_docs)]
+
+    ids = WhitespaceTokenizer()(docs)
+    modes = {
+        "python": lambda: _python(_tokenize_each(docs), seq_len, batch_size),
+        "tokenize_and_pack": lambda: tokenize_and_pack(
+            docs, WhitespaceTokenizer(), seq_len=seq_len, batch_size=batch_size, eos_id=0, drop_last=True
+        ),
+        # pre-tokenized documents, only the packing is measured
+        "python (packing)": lambda: _python(iter(ids), seq_len, batch_size),
+        "pack_tokens": lambda: pack_tokens(
+            (ids[i : i + 1024] for i in range(0, len(ids), 1024)), seq_len, batch_size, eos_id=0, drop_last=True
+        ),
+    }
+    for name, run in modes.items():
+        t = time.perf_counter()
+        n = sum(1 for _ in run())
+        duration = time.perf_counter() - t
+        tokens = n * batch_size * seq_len
+        print(f"{name:>18}: {tokens / duration / 1e6:.2f}M tokens/s, {n / duration:.1f} arrays/s")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
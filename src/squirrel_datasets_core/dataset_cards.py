@@ -0,0 +1,92 @@
+"""Machine readable attributes of the dataset cards (README.rst) of the dataset packages.
+
+Parsing RST with docutils is slow, hence the attributes of all dataset cards are precompiled into
+`dataset_cards.json`, which is shipped with the package. Regenerate it with::
+
+    python -m squirrel_datasets_core.dataset_cards
+
+A dataset card is only parsed at runtime if it is missing from the index or if its content changed since the index was
+generated.
+"""
+import functools
+import hashlib
+import json
+import pkgutil
+from pathlib import Path
+from typing import Dict, Union
+
+INDEX_PATH = Path(__file__).parent / "dataset_cards.json"
+
+
+def readme_hash(content: bytes) -> str:
+    """Hash of the content of a dataset card, used to detect stale index entries."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def _parse_attributes(content: bytes) -> Dict[str, str]:
+    """Parse the machine readable attributes from a dataset card with docutils."""
+    from squirrel_datasets_core.parse_dataset_cards import MachineAttributesVisitor, parse_rst
+
+    doc = parse_rst(content.decode("utf-8"))
+    visitor = MachineAttributesVisitor(doc)
+    doc.walk(visitor)
+    return visitor.machine_readable_attributes()
+
+
+def build_index() -> Dict[str, Dict[str, Union[str, Dict[str, str]]]]:
+    """Parse the dataset cards of all dataset packages.
+
+    Returns:
+        Dict[str, Dict[str, Union[str, Dict[str, str]]]]: Map from package name to the hash of its dataset card and
+            the parsed attributes.
+    """
+    import squirrel_datasets_core.datasets as ds
+
+    index = {}
+    for m in pkgutil.iter_modules(ds.__path__):
+        readme = Path(m.module_finder.path) / m.name / "README.rst"
+        if not readme.exists():
+            continue
+        content = readme.read_bytes()
+        index[f"{ds.__name__}.{m.name}"] = {"hash": readme_hash(content), "attributes": _parse_attributes(content)}
+    return index
+
+
+def write_index(path: Union[str, Path] = INDEX_PATH) -> None:
+    """Parse all dataset cards and write the index to `path`."""
+    with open(path, "w") as f:
+        json.dump(build_index(), f, indent=1, sort_keys=True)
+        f.write("\n")
+
+
+@functools.lru_cache(maxsize=None)
+def load_index(path: Union[str, Path] = INDEX_PATH) -> Dict[str, Dict[str, Union[str, Dict[str, str]]]]:
+    """Load the precompiled dataset card index. Returns an empty index if it does not exist."""
+    try:
+        with open(path, "rb") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def parse_readme(name: str) -> Dict[str, str]:
+    """Get the machine readable attributes of the dataset card of a dataset package.
+
+    The attributes are read from the precompiled index. The dataset card is only parsed if the index has no entry for
+    the package or if the card changed since the index was built.
+
+    Args:
+        name (str): Name of the dataset package.
+
+    Returns:
+        Dict[str, str]: Machine readable summary of attributes.
+    """
+    content = pkgutil.get_data(name, "README.rst")
+    entry = load_index().get(name)
+    if entry is not None and entry["hash"] == readme_hash(content):
+        return dict(entry["attributes"])
+    return _parse_attributes(content)
+
+
+if __name__ == "__main__":
+    write_index()
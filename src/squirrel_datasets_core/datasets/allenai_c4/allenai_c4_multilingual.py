@@ -1,46 +1,66 @@
 from __future__ import annotations
 
+import json
 import typing as t
+from functools import partial
 from typing import TYPE_CHECKING
 
-import fsspec
-
+import numpy as np
 from squirrel.driver import MapDriver
-from squirrel.serialization import JsonSerializer
+from squirrel.iterstream import IterableSource
+
+from squirrel_datasets_core.datasets.utils import ShardUrls, interleave
+from squirrel_datasets_core.io import ShardIndex, iter_json_lines, load_shard_index, open_decompressed
+from squirrel_datasets_core.io.text import get_json_loads
 
 if TYPE_CHECKING:
     from squirrel.iterstream import Composable
 
 
+# (url, (first block, block after the last block)) of a part of a shard, see :py:class:`ShardIndex`
+SubShardKey = t.Tuple[str, t.Tuple[int, int]]
+
+
 class C4DatasetDriver(MapDriver):
 
     name = "c4"
 
     def __init__(
         self,
-        subsets: t.Dict[str, t.Dict[str, t.List]],
+        subsets: t.Dict[str, t.Dict[str, t.Union[int, t.List]]],
         deser_hook: t.Optional[t.Callable] = None,
         compression: t.Optional[str] = "gzip",
+        index_dir: t.Optional[str] = None,
+        url_templates: t.Optional[t.Dict[str, str]] = None,
         **kwargs,
     ) -> None:
         """Initialize the driver.
 
         Args:
-            subsets: Map of iso language string to dict containing a map of split to list of all shard urls.
+            subsets: Map of iso language string to dict containing a map of split to list of all shard urls, or to the
+                number of shards of the split, whose urls are generated from `url_templates`.
             deser_hook (Callable): Callable that is passed as `object_hook` to :py:class:`JsonDecoder` during json
                 deserialization. Defaults to None.
             compression (str, optional): Compression codec to use. Passed to :py:func:`fsspec.open` when opening files
                 to read. Defaults to "gzip".
+            index_dir (str, optional): Local directory to store the seek indices of the shards in, see
+                :py:func:`~squirrel_datasets_core.io.load_shard_index`. Defaults to None.
+            url_templates: Map of split to the url of a shard of the split, formatted with `iso`, `shard` and
+                `num_shards`, see :py:data:`constants.C4_URL_TEMPLATES`. Required if `subsets` holds numbers of shards.
+                Defaults to None.
             **kwargs: Other keyword arguments passed to super class initializer.
         """
         super().__init__(**kwargs)
         self._subsets = subsets
+        self._url_templates = url_templates or {}
         self._lang = list(self._subsets.keys())
         self._split = "train"
         self._source = None
+        self._mixture = None
 
         self.deser_hook = deser_hook
         self.compression = compression
+        self.index_dir = index_dir
 
     def _init_source(self, lang: t.List[str], split: str) -> None:
         """
@@ -57,14 +77,39 @@ class C4DatasetDriver(MapDriver):
             if split not in self._subsets[iso]:
                 raise ValueError(f"The split {split} does not exist")
 
-            self._source += self._subsets[iso][split]
+            self._source.append(self._shards(iso, split))
 
-    def select(self, lang: t.Optional[t.Union[str, t.List[str]]] = None, split: str = "train") -> C4DatasetDriver:
+    def _shards(self, iso: str, split: str) -> t.Sequence[str]:
+        """Urls of the shards of a language and split, which are generated lazily from the url template of the split."""
+        shards = self._subsets[iso][split]
+        if isinstance(shards, int):
+            return ShardUrls(self._url_templates[split], shards, iso=iso)
+        return shards
+
+    def select(
+        self,
+        lang: t.Optional[t.Union[str, t.List[str]]] = None,
+        split: str = "train",
+        weights: t.Optional[t.Dict[str, float]] = None,
+        temperature: t.Optional[float] = None,
+        seed: t.Optional[int] = None,
+        cycle: bool = False,
+    ) -> C4DatasetDriver:
         """Select a specific subset and/or split of the C4 dataset.
 
+        By default, :py:meth:`get_iter` visits the shards of the selected languages one after the other. If `weights` or
+        `temperature` is given, one stream per language is opened instead and every sample is drawn from a language at
+        random with the given probabilities, see :py:func:`~squirrel_datasets_core.datasets.utils.interleave`.
+
         Args:
             lang: list of iso strings for the languages to be selected.
             split: denotes the train or valid split of C4.
+            weights: sampling weight of every selected language. Defaults to None.
+            temperature: derive the sampling weights from the number of shards of each language, see
+                :py:meth:`temperature_weights`. Defaults to None.
+            seed: random seed for drawing the languages. Defaults to None.
+            cycle: if True, the streams of exhausted languages are restarted and the stream is infinite. Otherwise,
+                exhausted languages are dropped. Only used with `weights` or `temperature`. Defaults to False.
         """
         if lang is not None:
             if isinstance(lang, str):
@@ -76,38 +121,171 @@ class C4DatasetDriver(MapDriver):
 
         self._split = split
         self._init_source(self._lang, self._split)
+
+        if weights is not None and temperature is not None:
+            raise ValueError("Only one of weights and temperature can be given")
+        if temperature is not None:
+            weights = self.temperature_weights(temperature)
+        if weights is not None:
+            if set(weights) != set(self._lang):
+                raise ValueError(f"Expected weights for the languages {self._lang}, got {list(weights)}")
+            self._mixture = {"weights": [weights[iso] for iso in self._lang], "seed": seed, "cycle": cycle}
+        else:
+            self._mixture = None
         return self
 
+    def temperature_weights(self, temperature: float) -> t.Dict[str, float]:
+        """Sampling weights of the selected languages for temperature-based sampling.
+
+        The weight of a language is `p ** (1 / temperature)`, where `p` is its share of the shards of the selected
+        split, i.e. `num_shards` in :py:data:`constants.ALL_C4` for the public dataset. A temperature of 1 samples in
+        proportion to the size of the languages, higher temperatures sample smaller languages more often and an
+        infinite temperature samples uniformly.
+
+        Args:
+            temperature: positive sampling temperature.
+
+        Returns:
+            Normalized weight of every selected language.
+        """
+        if not temperature > 0:
+            raise ValueError(f"The temperature must be positive, got {temperature}")
+        sizes = np.array([len(self._shards(iso, self._split)) for iso in self._lang], dtype=np.float64)
+        weights = (sizes / sizes.sum()) ** (1 / temperature)
+        return dict(zip(self._lang, (weights / weights.sum()).tolist()))
+
     @property
     def available_languages(self) -> t.List[str]:
         """Returns a list of all available languages in the C4 corpus."""
         return list(self._subsets.keys())
 
-    def keys(self) -> t.List[str]:
-        """Returns the list of urls for the archive files for the selected subset and/or split."""
-        return self._source
+    def keys(self, blocks_per_key: t.Optional[int] = None) -> t.List[t.Union[str, SubShardKey]]:
+        """Returns the list of urls for the archive files for the selected subset and/or split.
+
+        Args:
+            blocks_per_key (int, optional): If provided, the archive files are split into keys `(url, (start, stop))`
+                of `blocks_per_key` independently compressed blocks each, so that several workers can read a single
+                file. Requires the seek index of every file, which is built on first use by decompressing the file
+                once. Only multi-block xz files are split, e.g. files recompressed with `xz -T0` and read with
+                `compression="xz"`. The published `.json.gz` files are gzip files of a single member, so each of them
+                is a single key, whatever `blocks_per_key` is. Pass it with
+                `get_iter(keys_kwargs={"blocks_per_key": n})`. Defaults to None.
+        """
+        return self._split_keys([url for shards in self._source for url in shards], blocks_per_key)
+
+    def _split_keys(
+        self, urls: t.Sequence[str], blocks_per_key: t.Optional[int] = None
+    ) -> t.List[t.Union[str, SubShardKey]]:
+        """Split the archive files into sub-shard keys if `blocks_per_key` is provided."""
+        if blocks_per_key is None:
+            return list(urls)
+        return [
+            (str(url), block_range) for url in urls for block_range in self.get_shard_index(url).ranges(blocks_per_key)
+        ]
+
+    def get_shard_index(self, url: str) -> ShardIndex:
+        """Get the seek index of an archive file, see :py:func:`~squirrel_datasets_core.io.load_shard_index`."""
+        return load_shard_index(url, separator=b"\n", compression=self.compression, cache_dir=self.index_dir)
 
     @staticmethod
-    def get(url: str, compression: t.Optional[str] = "gzip") -> t.Iterator:
+    def get(
+        url: t.Union[str, SubShardKey],
+        compression: t.Optional[str] = "gzip",
+        batch_size: t.Optional[int] = None,
+        deser_hook: t.Optional[t.Callable] = None,
+        decompress_workers: int = 0,
+        doc_id: t.Optional[int] = None,
+        index_dir: t.Optional[str] = None,
+    ) -> t.Union[t.Iterator, t.Dict]:
         """Yields samples from a C4 dataset archive file.
 
+        The decompressed file is read incrementally, so memory usage does not grow with the size of the file. Lines are
+        parsed with `orjson` if it is installed.
+
         Args:
-            url (str): Path to the archive file.
+            url (Union[str, Tuple[str, Tuple[int, int]]]): Path to the archive file, or a key `(url, (start, stop))` of
+                a part of an archive file, see :py:meth:`keys`.
             compression (str, optional): Compression codec to use. Passed to :py:func:`fsspec.open` when opening files
                 to read. Defaults to "gzip".
+            batch_size (int, optional): If provided, lists of `batch_size` samples are yielded instead of single
+                samples. Defaults to None.
+            deser_hook (Callable, optional): Callable that is passed as `object_hook` to :py:func:`json.loads`. If
+                provided, samples are parsed with the standard library instead of `orjson`. Defaults to None.
+            decompress_workers (int, optional): Number of background threads that decompress the file ahead of
+                parsing, see :py:func:`~squirrel_datasets_core.io.open_decompressed`. With 0, the file is decompressed
+                while parsing. Parts of archive files are always decompressed in the background. Defaults to 0.
+            doc_id (int, optional): If provided, only the sample on line `doc_id` (counting from 0) of the archive file
+                is returned, using the seek index of the file. Raises IndexError if there is no sample on that line.
+                Defaults to None.
+            index_dir (str, optional): Local directory of the seek indices. Defaults to None.
 
-        Yields:
-            Samples from selected subset and/or splits.
+        Returns:
+            Iterator over the samples from selected subset and/or splits, or the single sample on line `doc_id`.
         """
-        ser = JsonSerializer()
+        loads = partial(json.loads, object_hook=deser_hook) if deser_hook is not None else None
+        if doc_id is not None:
+            index = load_shard_index(url, separator=b"\n", compression=compression, cache_dir=index_dir)
+            line = index.document(doc_id)
+            if not line.strip():
+                # e.g. the empty line after the trailing newline of the file, which is not a sample
+                raise IndexError(f"No sample on line {doc_id} of {url}")
+            return (loads or get_json_loads())(line)
+        return C4DatasetDriver._iter_samples(url, compression, batch_size, loads, decompress_workers, index_dir)
+
+    @staticmethod
+    def _iter_samples(
+        key: t.Union[str, SubShardKey],
+        compression: t.Optional[str],
+        batch_size: t.Optional[int],
+        loads: t.Optional[t.Callable],
+        decompress_workers: int,
+        index_dir: t.Optional[str],
+    ) -> t.Iterator:
+        """Yield the samples of an archive file or of a part of an archive file."""
+        if isinstance(key, tuple):
+            url, (start, stop) = key
+            index = load_shard_index(url, separator=b"\n", compression=compression, cache_dir=index_dir)
+            f = index.open(start, stop, workers=max(decompress_workers, 1))
+        else:
+            f = open_decompressed(key, compression=compression, workers=decompress_workers)
 
-        with fsspec.open(url, compression=compression, mode="r") as f:
-            for line in f.readlines():
-                yield ser.deserialize(line)
+        with f:
+            yield from iter_json_lines(f, batch_size=batch_size, loads=loads)
 
-    def get_iter(self, **kwargs) -> Composable:
+    def get_iter(self, batch_size: t.Optional[int] = None, decompress_workers: int = 0, **kwargs) -> Composable:
         """Returns an iterable of items in the form of a :py:class:`squirrel.iterstream.Composable`, which allows
         various stream manipulation functionalities. Only sets the compression method by default. For available keyword
         arguments, refer to :py:meth:`MapDriver.get_iter`.
+
+        Args:
+            batch_size (int, optional): If provided, the items are lists of up to `batch_size` samples from the same
+                archive file. Defaults to None.
+            decompress_workers (int, optional): Number of background threads that decompress each archive file ahead
+                of parsing. Defaults to 0.
+            **kwargs: Keyword arguments passed to :py:meth:`MapDriver.get_iter`. If languages are interleaved (see
+                :py:meth:`select`), they apply to the stream of each language.
         """
-        return super().get_iter(flatten=True, get_kwargs={"compression": self.compression}, **kwargs)
+        get_kwargs = {
+            "compression": self.compression,
+            "batch_size": batch_size,
+            "deser_hook": self.deser_hook,
+            "decompress_workers": decompress_workers,
+            "index_dir": self.index_dir,
+        }
+        if self._mixture is None:
+            return super().get_iter(flatten=True, get_kwargs=get_kwargs, **kwargs)
+
+        # one stream per language, which are interleaved as configured in select
+        keys_kwargs = kwargs.pop("keys_kwargs", None) or {}
+        get_iter = super().get_iter
+        streams = [
+            partial(
+                get_iter,
+                keys_iterable=self._split_keys(self._shards(iso, self._split), **keys_kwargs),
+                flatten=True,
+                get_kwargs=get_kwargs,
+                **kwargs,
+            )
+            for iso in self._lang
+        ]
+        return IterableSource(partial(interleave, streams, **self._mixture))
@@ -1,4 +1,5 @@
 from collections import namedtuple, defaultdict
+from typing import Dict, List
 
 cfg = namedtuple("cfg", ["iso", "split", "num_shards"])
 
@@ -220,21 +221,33 @@ ALL_C4 = [
     cfg(iso="zu", split="valid", num_shards=1),
 ]
 
-C4_MULTILINGUAL_CONFIG = defaultdict(dict)
 GIT_LFS_SHA = "607bd4c8450a42878aa9ddc051a65a055450ef87"
 BASE_URL = f"https://huggingface.co/datasets/allenai/c4/resolve/{GIT_LFS_SHA}/multilingual"
+# url of every shard of a split, formatted with `iso`, `shard` and `num_shards`
+C4_URL_TEMPLATES = {
+    "train": f"{BASE_URL}/c4-{{iso}}.tfrecord-{{shard:05d}}-of-{{num_shards:05d}}.json.gz",
+    "valid": f"{BASE_URL}/c4-{{iso}}-validation.tfrecord-{{shard:05d}}-of-{{num_shards:05d}}.json.gz",
+}
+
+# number of shards of every language and split, the urls are only generated from the templates when they are needed
+C4_MULTILINGUAL_SHARDS = defaultdict(dict)
 for conf in ALL_C4:
-    if conf.split == "valid":
-        files = [
-            f"{BASE_URL}/c4-{conf.iso}-validation.tfrecord-{idx:05d}-of-{conf.num_shards:05d}.json.gz"
-            for idx in range(conf.num_shards)
-        ]
-    elif conf.split == "train":
-        files = [
-            f"{BASE_URL}/c4-{conf.iso}.tfrecord-{idx:05d}-of-{conf.num_shards:05d}.json.gz"
-            for idx in range(conf.num_shards)
-        ]
-    else:
+    if conf.split not in C4_URL_TEMPLATES:
         raise ValueError("no such split")
 
-    C4_MULTILINGUAL_CONFIG[conf.iso][conf.split] = files
+    C4_MULTILINGUAL_SHARDS[conf.iso][conf.split] = conf.num_shards
+
+
+def __getattr__(name: str) -> Dict[str, Dict[str, List[str]]]:
+    """Expand `C4_MULTILINGUAL_CONFIG`, the urls of all shards of every language and split, on first access."""
+    if name != "C4_MULTILINGUAL_CONFIG":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    config = defaultdict(dict)
+    for iso, splits in C4_MULTILINGUAL_SHARDS.items():
+        for split, num_shards in splits.items():
+            template = C4_URL_TEMPLATES[split]
+            config[iso][split] = [
+                template.format(iso=iso, shard=idx, num_shards=num_shards) for idx in range(num_shards)
+            ]
+    globals()[name] = config
+    return config
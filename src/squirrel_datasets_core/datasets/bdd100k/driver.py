@@ -5,15 +5,19 @@ from __future__ import annotations
 import os
 from functools import partial
 from pathlib import Path
-from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
 
 from squirrel.driver import IterDriver
-from squirrel.iterstream import FilePathGenerator, IterableSource
+from squirrel.iterstream import IterableSource
 
 if TYPE_CHECKING:
+    import fsspec
     from squirrel.iterstream import Composable
 
-from squirrel_datasets_core.io.io import load_image
+from squirrel_datasets_core.datasets.utils import collate_samples
+from squirrel_datasets_core.io.fs import get_filesystem
+from squirrel_datasets_core.io.io import load_image, load_images
+from squirrel_datasets_core.io.listing import list_files
 
 
 class BDD100KDriver(IterDriver):
@@ -56,16 +60,37 @@ class BDD100KDriver(IterDriver):
         self.url = url
 
     @staticmethod
-    def load_sample(sample: Dict, parse_image: bool = True, parse_label: bool = True) -> Dict:
+    def load_sample(
+        sample: Dict, parse_image: bool = True, parse_label: bool = True, fs: Optional[fsspec.AbstractFileSystem] = None
+    ) -> Dict:
         """Parse and load image and/or label into the sample dictionary.
         Image and label are stored under the keys "image" and "label", respectively.
+        `fs` is the filesystem to open the files with, by default the cached filesystem of their protocol is used.
         """
         if parse_image:
-            sample["image"] = load_image(sample["image_url"])
+            sample["image"] = load_image(sample["image_url"], fs=fs)
         if parse_label and "label_url" in sample:
-            sample["label"] = load_image(sample["label_url"])
+            sample["label"] = load_image(sample["label_url"], fs=fs)
         return sample
 
+    @staticmethod
+    def load_batch(
+        samples: List[Dict],
+        parse_image: bool = True,
+        parse_label: bool = True,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> Dict[str, Any]:
+        """Collate samples into a dictionary of lists and load their images and/or labels concurrently.
+        Images and labels are stored under the keys "image" and "label", stacked into one array each if their shapes
+        match.
+        """
+        batch = collate_samples(samples)
+        if parse_image:
+            batch["image"] = load_images(batch["image_url"], fs=fs)
+        if parse_label and "label_url" in batch:
+            batch["label"] = load_images(batch["label_url"], fs=fs)
+        return batch
+
     def get_iter(
         self,
         split: str,
@@ -74,6 +99,9 @@ class BDD100KDriver(IterDriver):
         parse_label: bool = True,
         shuffle_size: int = 800,
         shuffle_initial: int = 800,
+        batch_decode: Optional[int] = None,
+        cache_listing: bool = False,
+        refresh_listing: bool = False,
     ) -> Composable:
         """Create iterstream for the given split.
 
@@ -87,6 +115,15 @@ class BDD100KDriver(IterDriver):
                 the key "label". Defaults to True.
             shuffle_size (int, optional): Buffer size used for shuffling. Defaults to 800.
             shuffle_initial (int, optional): Initial buffer size before starting to iterate. Defaults to 800.
+            batch_decode (int, optional): If given, samples are batched into dictionaries of lists of this size (the
+                last batch may be smaller) and the images of a batch are loaded concurrently with
+                :py:func:`~squirrel_datasets_core.io.load_images`. Images of the same shape are stacked into one array.
+                Defaults to None.
+            cache_listing (bool, optional): Whether to keep the file listing in a persistent manifest and reuse it
+                in later calls, see :py:class:`~squirrel_datasets_core.io.listing.CachedFilePathGenerator`. Defaults to
+                False.
+            refresh_listing (bool, optional): Whether to rebuild the manifest of the file listing. Only used if
+                `cache_listing` is True. Defaults to False.
 
         Returns:
             Composable: Composable containing the samples.
@@ -98,10 +135,12 @@ class BDD100KDriver(IterDriver):
         imgs_dir = os.path.join(self.url, "images/10k", split)
 
         if split == "test":
-            gen = FilePathGenerator(imgs_dir).map(lambda x: dict(image_url=x, split=split))
+            gen = list_files(imgs_dir, cache=cache_listing, refresh=refresh_listing).map(
+                lambda x: dict(image_url=x, split=split)
+            )
         else:
             labels_dir = os.path.join(self.url, "labels/sem_seg/masks", split)
-            gen = FilePathGenerator(imgs_dir).map(
+            gen = list_files(imgs_dir, cache=cache_listing, refresh=refresh_listing).map(
                 lambda x: dict(image_url=x, label_url=os.path.join(labels_dir, Path(x).stem + ".png"), split=split)
             )
 
@@ -110,5 +149,9 @@ class BDD100KDriver(IterDriver):
         for h in hooks:
             it = it.to(h)
 
-        load = partial(self.load_sample, parse_image=parse_image, parse_label=parse_label)
+        fs = get_filesystem(self.url)
+        if batch_decode is not None:
+            load = partial(self.load_batch, parse_image=parse_image, parse_label=parse_label, fs=fs)
+            return it.batched(batch_decode, drop_last_if_not_full=False).map(load)
+        load = partial(self.load_sample, parse_image=parse_image, parse_label=parse_label, fs=fs)
         return it.map(load)
@@ -3,14 +3,18 @@ from __future__ import annotations
 
 import os
 from functools import partial
-from typing import Callable, Dict, List, Optional, TYPE_CHECKING
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
 
 from squirrel.driver import IterDriver
-from squirrel.iterstream import FilePathGenerator, IterableSource
+from squirrel.iterstream import IterableSource
 
-from squirrel_datasets_core.io.io import load_image
+from squirrel_datasets_core.datasets.utils import collate_samples
+from squirrel_datasets_core.io.fs import get_filesystem
+from squirrel_datasets_core.io.io import load_image, load_images
+from squirrel_datasets_core.io.listing import list_files
 
 if TYPE_CHECKING:
+    import fsspec
     from squirrel.iterstream import Composable
 
 _CLASSES = [
@@ -55,16 +59,37 @@ class CamvidDriver(IterDriver):
         self.url = url
 
     @staticmethod
-    def load_sample(sample: Dict, parse_image: bool = True, parse_label: bool = True) -> Dict:
+    def load_sample(
+        sample: Dict, parse_image: bool = True, parse_label: bool = True, fs: Optional[fsspec.AbstractFileSystem] = None
+    ) -> Dict:
         """Parse and load image and/or label into the sample dictionary.
         Image and label are stored under the keys "image" and "label", respectively.
+        `fs` is the filesystem to open the files with, by default the cached filesystem of their protocol is used.
         """
         if parse_image:
-            sample["image"] = load_image(sample["image_url"])
+            sample["image"] = load_image(sample["image_url"], fs=fs)
         if parse_label:
-            sample["label"] = load_image(sample["label_url"])
+            sample["label"] = load_image(sample["label_url"], fs=fs)
         return sample
 
+    @staticmethod
+    def load_batch(
+        samples: List[Dict],
+        parse_image: bool = True,
+        parse_label: bool = True,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> Dict[str, Any]:
+        """Collate samples into a dictionary of lists and load their images and/or labels concurrently.
+        Images and labels are stored under the keys "image" and "label", stacked into one array each if their shapes
+        match.
+        """
+        batch = collate_samples(samples)
+        if parse_image:
+            batch["image"] = load_images(batch["image_url"], fs=fs)
+        if parse_label:
+            batch["label"] = load_images(batch["label_url"], fs=fs)
+        return batch
+
     def get_iter(
         self,
         split: str,
@@ -73,6 +98,9 @@ class CamvidDriver(IterDriver):
         parse_label: bool = True,
         shuffle_size: int = 800,
         shuffle_initial: int = 800,
+        batch_decode: Optional[int] = None,
+        cache_listing: bool = False,
+        refresh_listing: bool = False,
     ) -> Composable:
         """Create iterstream for the given split.
 
@@ -86,6 +114,15 @@ class CamvidDriver(IterDriver):
                 the key "label". Defaults to True.
             shuffle_size (int, optional): Buffer size used for shuffling. Defaults to 800.
             shuffle_initial (int, optional): Initial buffer size before starting to iterate. Defaults to 800.
+            batch_decode (int, optional): If given, samples are batched into dictionaries of lists of this size (the
+                last batch may be smaller) and the images of a batch are loaded concurrently with
+                :py:func:`~squirrel_datasets_core.io.load_images`. Images of the same shape are stacked into one array.
+                Defaults to None.
+            cache_listing (bool, optional): Whether to keep the file listing in a persistent manifest and reuse it
+                in later calls, see :py:class:`~squirrel_datasets_core.io.listing.CachedFilePathGenerator`. Defaults to
+                False.
+            refresh_listing (bool, optional): Whether to rebuild the manifest of the file listing. Only used if
+                `cache_listing` is True. Defaults to False.
 
         Returns:
             Composable: Composable containing the samples.
@@ -96,7 +133,7 @@ class CamvidDriver(IterDriver):
 
         imgs_dir = os.path.join(self.url, split)
         labels_dir = os.path.join(self.url, f"{split}annot")
-        gen = FilePathGenerator(imgs_dir).map(
+        gen = list_files(imgs_dir, cache=cache_listing, refresh=refresh_listing).map(
             lambda x: dict(image_url=x, label_url=os.path.join(labels_dir, os.path.basename(x)), split=split)
         )
         it = IterableSource(gen).shuffle(size=shuffle_size, initial=shuffle_initial)
@@ -104,5 +141,9 @@ class CamvidDriver(IterDriver):
         for h in hooks:
             it = it.to(h)
 
-        load = partial(self.load_sample, parse_image=parse_image, parse_label=parse_label)
+        fs = get_filesystem(self.url)
+        if batch_decode is not None:
+            load = partial(self.load_batch, parse_image=parse_image, parse_label=parse_label, fs=fs)
+            return it.batched(batch_decode, drop_last_if_not_full=False).map(load)
+        load = partial(self.load_sample, parse_image=parse_image, parse_label=parse_label, fs=fs)
         return it.map(load)
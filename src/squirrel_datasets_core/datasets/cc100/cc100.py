@@ -3,21 +3,30 @@ from __future__ import annotations
 import typing as t
 from typing import TYPE_CHECKING
 
-import fsspec
-
 from squirrel.driver import MapDriver
 from squirrel.iterstream import Composable
 
+from squirrel_datasets_core.io import ShardIndex, iter_documents, load_shard_index, open_decompressed
+
 if TYPE_CHECKING:
     from squirrel.catalog import Catalog
 
 
+# (url, (first block, block after the last block)) of a part of a shard, see :py:class:`ShardIndex`
+SubShardKey = t.Tuple[str, t.Tuple[int, int]]
+
+
 class CC100Driver(MapDriver):
 
     name = "cc100"
 
     def __init__(
-        self, subsets: t.Dict[str, str], catalog: t.Optional[Catalog] = None, compression: str = "xz", **kwargs
+        self,
+        subsets: t.Dict[str, str],
+        catalog: t.Optional[Catalog] = None,
+        compression: str = "xz",
+        index_dir: t.Optional[str] = None,
+        **kwargs,
     ):
         """
         Initialize the store
@@ -25,6 +34,8 @@ class CC100Driver(MapDriver):
             subsets: a mapping of iso language string to the corresponding url where the data is found
             catalog: a `squirrel.catalog.Catalog` that contains configuration for custom dataset locations.
             compression: the default compression for the files. Defaults to `xz`.
+            index_dir: local directory to store the seek indices of the shards in, see
+                :py:func:`~squirrel_datasets_core.io.load_shard_index`. Defaults to None.
         """
         super().__init__(catalog=catalog, **kwargs)
         self._subsets = subsets
@@ -32,6 +43,7 @@ class CC100Driver(MapDriver):
         self._source = None
 
         self.compression = compression
+        self.index_dir = index_dir
 
     def _init_source(self, lang: t.List[str]) -> None:
         """
@@ -60,30 +72,99 @@ class CC100Driver(MapDriver):
         self._init_source(self._lang)
         return self
 
-    def keys(self, **kwargs) -> t.List[str]:
-        """Returns the list of urls for the archive file of the selected language(s)."""
-        return self._source
+    def keys(self, blocks_per_key: t.Optional[int] = None, **kwargs) -> t.List[t.Union[str, SubShardKey]]:
+        """
+        Returns the list of urls for the archive file of the selected language(s).
+
+        Args:
+            blocks_per_key: if provided, the shards are split into keys `(url, (start, stop))` of `blocks_per_key`
+                independently compressed blocks each, so that several workers can read a single shard. Requires the
+                seek index of every shard, which is built on first use by decompressing the shard once. Only
+                multi-block xz files (e.g. compressed with `xz -T0`) consist of more than one block. Pass it with
+                `get_iter(keys_kwargs={"blocks_per_key": n})`. Defaults to None.
+        """
+        if blocks_per_key is None:
+            return self._source
+        return [
+            (str(url), block_range)
+            for url in self._source
+            for block_range in self.get_shard_index(url).ranges(blocks_per_key)
+        ]
+
+    def get_shard_index(self, url: str) -> ShardIndex:
+        """Get the seek index of a shard, see :py:func:`~squirrel_datasets_core.io.load_shard_index`."""
+        return load_shard_index(url, separator=b"\n\n", compression=self.compression, cache_dir=self.index_dir)
 
     @staticmethod
-    def get(url: str, compression: t.Optional[str] = None) -> t.List:
+    def get(
+        url: t.Union[str, SubShardKey],
+        compression: t.Optional[str] = None,
+        decompress_workers: int = 0,
+        doc_id: t.Optional[int] = None,
+        index_dir: t.Optional[str] = None,
+    ) -> t.Union[t.Iterator[t.Dict], t.Dict]:
         """
-        Read a single record in the CC100 dataset. Takes into account the special formatting of the data.
+        Read the records of a shard of the CC100 dataset. Takes into account the special formatting of the data, where
+        documents are separated by blank lines. The shard is split while it is read, so that memory usage does not
+        grow with the size of the shard.
 
         Args:
-            url: str that points to the web-location of the dataset shard
+            url: str that points to the web-location of the dataset shard, or a key `(url, (start, stop))` of a part of
+                a shard, see :py:meth:`keys`.
             compression: specifies the compression algorithm of the dataset.
+            decompress_workers: number of background threads that decompress the shard ahead of reading, blocks of xz
+                files are decompressed concurrently. See :py:func:`~squirrel_datasets_core.io.open_decompressed`. With
+                0, the shard is decompressed while reading. Parts of shards are always decompressed in the background.
+                Defaults to 0.
+            doc_id: if provided, only the record of the `doc_id`-th document of the shard is returned, using the seek
+                index of the shard. Defaults to None.
+            index_dir: local directory of the seek indices. Defaults to None.
+
+        Returns:
+            Iterator over the records, or the single record with id `doc_id`.
         """
-        with fsspec.open(url, "rb", compression=compression) as fp:
-            text = "".join([line.decode("utf-8") for line in fp.readlines()])
+        if doc_id is not None:
+            index = load_shard_index(url, separator=b"\n\n", compression=compression, cache_dir=index_dir)
+            return {"text": index.document(doc_id).decode("utf-8")}
+        return CC100Driver._iter_records(url, compression, decompress_workers, index_dir)
+
+    @staticmethod
+    def _iter_records(
+        key: t.Union[str, SubShardKey],
+        compression: t.Optional[str],
+        decompress_workers: int,
+        index_dir: t.Optional[str],
+    ) -> t.Iterator[t.Dict]:
+        """Yield the records of a shard or of a part of a shard."""
+        if isinstance(key, tuple):
+            url, (start, stop) = key
+            index = load_shard_index(url, separator=b"\n\n", compression=compression, cache_dir=index_dir)
+            if index.count(start, stop) == 0:
+                return
+            fp = index.open(start, stop, workers=max(decompress_workers, 1))
+        else:
+            fp = open_decompressed(key, compression=compression, workers=decompress_workers)
 
-        return [{"text": elem} for elem in text.split("\n\n")]
+        with fp:
+            for doc in iter_documents(fp):
+                yield {"text": doc.decode("utf-8")}
 
-    def get_iter(self, **kwargs) -> Composable:
+    def get_iter(self, decompress_workers: int = 0, **kwargs) -> Composable:
         """Returns an iterable of items in the form of a :py:class:`squirrel.iterstream.Composable`, which allows
         various stream manipulation functionalities. Only sets the compression method by default. For available keyword
         arguments, refer to :py:meth:`MapDriver.get_iter`.
+
+        Args:
+            decompress_workers: number of background threads that decompress each shard ahead of reading. Defaults
+                to 0.
+            **kwargs: Keyword arguments passed to :py:meth:`MapDriver.get_iter`.
         """
-        return super().get_iter(flatten=True, get_kwargs={"compression": self.compression}, **kwargs)
+        get_kwargs = {
+            "compression": self.compression,
+            "decompress_workers": decompress_workers,
+            "index_dir": self.index_dir,
+        }
+        return super().get_iter(flatten=True, get_kwargs=get_kwargs, **kwargs)
 
     @property
     def available_languages(self) -> t.List[str]:
@@ -1,18 +1,25 @@
 from __future__ import annotations
 
 import logging
+import os
+import socket
 import sys
 import typing as t
 import urllib
+from functools import partial
+from operator import itemgetter
 from typing import TYPE_CHECKING
 from urllib.request import Request
 
 import numpy as np
 import requests
-from PIL import Image, UnidentifiedImageError
+from PIL import UnidentifiedImageError
 from squirrel.driver import IterDriver
 from squirrel.iterstream.source import IterableSource
 
+from squirrel_datasets_core.io import DownloadCache, decode_image, decode_images, fetch_urls, resize_image
+from squirrel_datasets_core.io.download_cache import DOWNLOAD_CACHE_ENV_VAR
+
 if TYPE_CHECKING:
     from squirrel.catalog import Catalog
     from squirrel.iterstream import Composable
@@ -32,16 +39,30 @@ class CC12MDriver(IterDriver):
 
     name = "conceptual-captions-12m"
 
-    def __init__(self, index_url: str, catalog: t.Optional[Catalog] = None, **kwargs) -> None:
+    def __init__(
+        self,
+        index_url: str,
+        catalog: t.Optional[Catalog] = None,
+        cache_dir: t.Optional[str] = None,
+        cache_size: int = 100 * 2**30,
+        **kwargs,
+    ) -> None:
         """
         Initialize the ConceptualCaptions driver:
         Args:
             index_url: url to the index file containing the captions and URLs to the image file locations.
             catalog: a `squirrel.catalog.Catalog` that contains configuration for custom dataset locations.
+            cache_dir: local directory of a :py:class:`~squirrel_datasets_core.io.DownloadCache`, which stores the
+                downloaded images for later epochs and skips urls that failed with 404 or an undecodable image. It can
+                be shared by the processes of a node. If not provided, the environment variable
+                `SQUIRREL_DOWNLOAD_CACHE` is used, or nothing is cached.
+            cache_size: maximum size of the cached images in bytes, least recently used images are evicted.
         """
 
         super().__init__(catalog, **kwargs)
         self._index_url = index_url
+        self._cache_dir = cache_dir or os.environ.get(DOWNLOAD_CACHE_ENV_VAR)
+        self._cache_size = cache_size
 
     @property
     def _index_iterator(self) -> t.Iterable:
@@ -52,35 +73,121 @@ class CC12MDriver(IterDriver):
                 yield {"caption": caption, "url": url}
 
     @staticmethod
-    def _download_image(url: str) -> np.ndarray:
+    def _download(url: str) -> bytes:
         """
-        Download an individual image from the given URL.
+        Download the content of the given URL.
 
         Args:
             url: location of the image
         """
         req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-        resp = urllib.request.urlopen(req, timeout=1)
-        return np.array(Image.open(resp))
+        return urllib.request.urlopen(req, timeout=1).read()
 
     @staticmethod
-    def _map_fn(record: t.Dict[str, str]) -> t.Dict[str, t.Union[str, np.ndarray]]:
+    def _fetch_fn(
+        record: t.Dict[str, str], cache: t.Optional[DownloadCache] = None
+    ) -> t.Tuple[t.Dict[str, str], t.Optional[bytes], t.Optional[Exception]]:
         """
-        Map function over all index elements.
+        Download the image of an index element.
 
         Args:
             record: dict containing the url under the key `url`
+            cache: cache that images are read from and stored in, urls that are not found are added to its negative
+                cache
+
+        Returns:
+            (record, content, error) tuple, `content` is None if the download failed with `error`
         """
         url = record["url"]
-        record["error"] = False
         try:
-            record["image"] = CC12MDriver._download_image(url)
-        except (urllib.error.HTTPError, urllib.error.URLError) as e:
-            logger.info(f"Cannot access url {url} due to Error {e}")
+            content = cache.get(url) if cache is not None else None
+            if content is None:
+                content = CC12MDriver._download(url)
+                if cache is not None:
+                    cache.put(url, content)
+        except (urllib.error.HTTPError, urllib.error.URLError, socket.timeout, ConnectionError) as e:
+            if cache is not None and getattr(e, "code", None) in cache.negative_statuses:
+                cache.add_failed(url)
+            return record, None, e
+        return record, content, None
+
+    @staticmethod
+    def _map_fn(
+        record: t.Dict[str, str],
+        cache: t.Optional[DownloadCache] = None,
+        size: t.Optional[t.Tuple[int, int]] = None,
+    ) -> t.Dict[str, t.Union[str, np.ndarray]]:
+        """
+        Map function over all index elements, which downloads and decodes in the same thread.
+
+        Args:
+            record: dict containing the url under the key `url`
+            cache: cache that images are read from and stored in, urls that fail permanently are added to its
+                negative cache
+            size: (height, width) that the image is resized to
+        """
+        return CC12MDriver._decode_fn(CC12MDriver._fetch_fn(record, cache), cache, size)
+
+    @staticmethod
+    def _decode_fn(
+        result: t.Tuple[t.Dict[str, str], t.Optional[bytes], t.Optional[Exception]],
+        cache: t.Optional[DownloadCache] = None,
+        size: t.Optional[t.Tuple[int, int]] = None,
+    ) -> t.Dict[str, t.Union[str, np.ndarray]]:
+        """
+        Decode a downloaded image.
+
+        Args:
+            result: (record, content, error) tuple of the download of the url under the key `url` of the record
+            cache: cache whose negative cache undecodable images are added to
+            size: (height, width) that the image is resized to
+        """
+        record, content, error = result
+        image, decode_error = None, None
+        if error is None:
+            try:
+                image = decode_image(content, target_size=size)
+                image = image if size is None else resize_image(image, size)
+            except (UnidentifiedImageError, OSError, ValueError) as e:
+                decode_error = e
+        return CC12MDriver._set_image(record, image, error, decode_error, cache)
+
+    @staticmethod
+    def _decoded_fn(
+        result: t.Tuple[t.Tuple, t.Optional[np.ndarray], t.Optional[Exception]],
+        cache: t.Optional[DownloadCache] = None,
+    ) -> t.Dict[str, t.Union[str, np.ndarray]]:
+        """
+        Set the image decoded by :py:func:`~squirrel_datasets_core.io.decode_images`.
+
+        Args:
+            result: ((record, content, error), image, error) tuple of the download and the decoding
+            cache: cache whose negative cache undecodable images are added to
+        """
+        (record, _, error), image, decode_error = result
+        return CC12MDriver._set_image(record, image, error, decode_error, cache)
+
+    @staticmethod
+    def _set_image(
+        record: t.Dict[str, str],
+        image: t.Optional[np.ndarray],
+        error: t.Optional[Exception],
+        decode_error: t.Optional[Exception],
+        cache: t.Optional[DownloadCache],
+    ) -> t.Dict[str, t.Union[str, np.ndarray]]:
+        """Set the image of an index element, or its error flag if downloading or decoding failed."""
+        url = record["url"]
+        record["error"] = False
+        if error is not None:
+            logger.info(f"Cannot access url {url} due to Error {error!r}")
             record["error"] = True
-        except UnidentifiedImageError as e:
-            logger.info(f"Cannot open image at {url} due to Error {e}")
+        elif decode_error is not None:
+            logger.info(f"Cannot open image at {url} due to Error {decode_error!r}")
             record["error"] = True
+            if cache is not None and isinstance(decode_error, UnidentifiedImageError):
+                cache.add_failed(url)
+        else:
+            record["image"] = image
 
         return record
 
@@ -89,12 +196,22 @@ class CC12MDriver(IterDriver):
         """Filter to remove erroneous downloads."""
         return not record["error"]
 
+    @staticmethod
+    def _has_not_failed(record: t.Dict[str, str], cache: DownloadCache) -> bool:
+        """Filter to remove urls in the negative cache."""
+        return not cache.is_failed(record["url"])
+
     def get_iter(
         self,
         shuffle_key_buffer: int = 1000,
         shuffle_item_buffer: int = 100,
         prefetch_buffer: int = 2,
         max_workers: t.Optional[int] = None,
+        downloader: str = "urllib",
+        fetch_kwargs: t.Optional[t.Dict[str, t.Any]] = None,
+        decode_workers: int = 0,
+        decode_buffer: int = 16,
+        image_size: t.Optional[t.Tuple[int, int]] = None,
         **kwargs,
     ) -> Composable:
         """
@@ -107,12 +224,52 @@ class CC12MDriver(IterDriver):
             shuffle_item_buffer (int): the size of the buffer used to shuffle samples after being fetched. Please note
                 the memory footprint of samples
             max_workers: number of workers in the ThreadPoolExecutor. If set to 0 runs a sequential map.
+                Note that `prefetch_buffer` bounds the number of images that the ThreadPoolExecutor processes at a time.
+            downloader (str): "urllib" downloads each image with a blocking request in the ThreadPoolExecutor.
+                "aiohttp" downloads thousands of images concurrently with
+                :py:func:`~squirrel_datasets_core.io.fetch_urls`, the ThreadPoolExecutor then only decodes them.
+                Samples are yielded in the order in which their downloads complete.
+            fetch_kwargs (Dict[str, Any]): keyword arguments of :py:func:`~squirrel_datasets_core.io.fetch_urls`
+                when `downloader` is "aiohttp", e.g. `concurrency`, `limit_per_host`, `timeout` or `retries`.
+            decode_workers (int): number of processes that decode the downloaded images with
+                :py:func:`~squirrel_datasets_core.io.decode_images`. The downloading threads then only download, and
+                decoded images are returned through shared memory. If set to 0, images are decoded in the
+                ThreadPoolExecutor.
+            decode_buffer (int): number of images that are decoded at a time by the `decode_workers`. Downloads are
+                paused while all of them are busy. The decoded images are returned through `decode_buffer` slots of
+                shared memory in `/dev/shm`, of 4 bytes per pixel of `image_size` each, or 1MB if it is not provided.
+                That is 16MB with the defaults, docker containers have 64MB of shared memory unless `--shm-size` is
+                set. Images that do not fit into a slot, or all images if there is not enough shared memory, are
+                returned by pickling instead.
+            image_size (Tuple[int, int]): (height, width) that all images are resized to. If not provided, images keep
+                their size.
 
         Returns:
             (squirrel.iterstream.Composable)
         """
-        it = IterableSource(self._index_iterator).shuffle(size=shuffle_key_buffer)
+        if downloader not in ("urllib", "aiohttp"):
+            raise ValueError(f"Unknown downloader {downloader}, use 'urllib' or 'aiohttp'.")
+        cache = DownloadCache(self._cache_dir, max_size=self._cache_size) if self._cache_dir else None
+        it = IterableSource(self._index_iterator)
+        if cache is not None:
+            it = it.filter(partial(CC12MDriver._has_not_failed, cache=cache))
+        it = it.shuffle(size=shuffle_key_buffer)
+
+        # the downloads and the decoding are either done in the same threads, or in two stages
+        map_fn = partial(CC12MDriver._decode_fn, cache=cache, size=image_size)
+        if downloader == "aiohttp":
+            fetch_kwargs = {"headers": {"User-Agent": "Mozilla/5.0"}, "cache": cache, **(fetch_kwargs or {})}
+            it = fetch_urls(it, get_url=itemgetter("url"), **fetch_kwargs)
+        elif decode_workers > 0:
+            fetch_fn = partial(CC12MDriver._fetch_fn, cache=cache)
+            it = it.map(fetch_fn) if max_workers == 0 else it.async_map(fetch_fn, prefetch_buffer, max_workers)
+        else:
+            map_fn = partial(CC12MDriver._map_fn, cache=cache, size=image_size)
 
-        map_fn = CC12MDriver._map_fn
-        _map = it.map(map_fn) if max_workers == 0 else it.async_map(map_fn, prefetch_buffer, max_workers)
+        if decode_workers > 0:
+            decode_kwargs = dict(workers=decode_workers, buffer=decode_buffer, size=image_size)
+            _map = decode_images(it, get_data=itemgetter(1), **decode_kwargs)
+            _map = _map.map(partial(CC12MDriver._decoded_fn, cache=cache))
+        else:
+            _map = it.map(map_fn) if max_workers == 0 else it.async_map(map_fn, prefetch_buffer, max_workers)
         return _map.filter(CC12MDriver._has_no_error).shuffle(size=shuffle_item_buffer)
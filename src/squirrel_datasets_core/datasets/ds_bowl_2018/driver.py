@@ -3,14 +3,18 @@ from __future__ import annotations
 
 import os
 from functools import partial
-from typing import Callable, Dict, List, Optional, TYPE_CHECKING
+from itertools import chain
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
 
 from squirrel.driver import IterDriver
 from squirrel.iterstream import FilePathGenerator, IterableSource
 
-from squirrel_datasets_core.io import load_image
+from squirrel_datasets_core.datasets.utils import collate_samples
+from squirrel_datasets_core.io import get_filesystem, load_image, load_images
+from squirrel_datasets_core.io.listing import list_files
 
 if TYPE_CHECKING:
+    import fsspec
     from squirrel.iterstream import Composable
 
 
@@ -35,23 +39,55 @@ class DataScienceBowl2018Driver(IterDriver):
         self.url = url
 
     @staticmethod
-    def load_sample(sample: Dict, parse_image: bool = True, parse_mask: bool = True) -> Dict:
+    def load_sample(
+        sample: Dict, parse_image: bool = True, parse_mask: bool = True, fs: Optional[fsspec.AbstractFileSystem] = None
+    ) -> Dict:
         """Parse and load image and/or groundtruth mask into the sample dictionary.
         Image and masks are stored under the keys "image" and "masks", respectively.
+        `fs` is the filesystem to open the files with, by default the cached filesystem of their protocol is used.
         """
         # labels are list of arrays (masks) and list of bbox coordinates
         sample_url = sample["sample_url"]
         if parse_image:
             stem = os.path.splitext(os.path.basename(sample_url))[0]
             url = os.path.join(sample_url, "images", f"{stem}.png")
-            sample["image"] = load_image(url)
+            sample["image"] = load_image(url, fs=fs)
 
         if sample["split"] == "stage1_train" and parse_mask:
             gen = FilePathGenerator(os.path.join(sample_url, "masks"))
-            sample["masks"] = [load_image(url).astype("bool") for url in gen]
+            sample["masks"] = [load_image(url, fs=fs).astype("bool") for url in gen]
 
         return sample
 
+    @staticmethod
+    def load_batch(
+        samples: List[Dict],
+        parse_image: bool = True,
+        parse_mask: bool = True,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> Dict[str, Any]:
+        """Collate samples into a dictionary of lists and load their images and/or groundtruth masks concurrently.
+        Images and masks are stored under the keys "image" and "masks", respectively. Images are stacked into one array
+        if their shapes match, masks are stored as a list of masks per sample.
+        """
+        batch = collate_samples(samples)
+        if parse_image:
+            urls = []
+            for sample_url in batch["sample_url"]:
+                stem = os.path.splitext(os.path.basename(sample_url))[0]
+                urls.append(os.path.join(sample_url, "images", f"{stem}.png"))
+            batch["image"] = load_images(urls, fs=fs)
+
+        if parse_mask and "stage1_train" in batch["split"]:
+            mask_urls = [
+                list(FilePathGenerator(os.path.join(sample_url, "masks"))) if split == "stage1_train" else []
+                for sample_url, split in zip(batch["sample_url"], batch["split"])
+            ]
+            masks = iter(load_images(list(chain.from_iterable(mask_urls)), fs=fs, stack=False))
+            batch["masks"] = [[next(masks).astype("bool") for _ in urls] for urls in mask_urls]
+
+        return batch
+
     def get_iter(
         self,
         split: str,
@@ -60,6 +96,9 @@ class DataScienceBowl2018Driver(IterDriver):
         parse_mask: bool = True,
         shuffle_size: int = 800,
         shuffle_initial: int = 800,
+        batch_decode: Optional[int] = None,
+        cache_listing: bool = False,
+        refresh_listing: bool = False,
     ) -> Composable:
         """Create iterstream for the given split.
 
@@ -73,6 +112,15 @@ class DataScienceBowl2018Driver(IterDriver):
                 stored under the key "masks". Only in effect for split="stage1_train". Defaults to True.
             shuffle_size (int, optional): Buffer size used for shuffling. Defaults to 800.
             shuffle_initial (int, optional): Initial buffer size before starting to iterate. Defaults to 800.
+            batch_decode (int, optional): If given, samples are batched into dictionaries of lists of this size (the
+                last batch may be smaller) and the images of a batch are loaded concurrently with
+                :py:func:`~squirrel_datasets_core.io.load_images`. Images of the same shape are stacked into one array.
+                Defaults to None.
+            cache_listing (bool, optional): Whether to keep the file listing in a persistent manifest and reuse it
+                in later calls, see :py:class:`~squirrel_datasets_core.io.listing.CachedFilePathGenerator`. Defaults to
+                False.
+            refresh_listing (bool, optional): Whether to rebuild the manifest of the file listing. Only used if
+                `cache_listing` is True. Defaults to False.
 
         Returns:
             Composable: Composable containing the samples.
@@ -81,11 +129,17 @@ class DataScienceBowl2018Driver(IterDriver):
         if hooks is None:
             hooks = []
 
-        gen = FilePathGenerator(os.path.join(self.url, split)).map(lambda x: dict(sample_url=x, split=split))
+        gen = list_files(os.path.join(self.url, split), cache=cache_listing, refresh=refresh_listing).map(
+            lambda x: dict(sample_url=x, split=split)
+        )
         it = IterableSource(gen).shuffle(size=shuffle_size, initial=shuffle_initial)
 
         for h in hooks:
             it = it.to(h)
 
-        load = partial(self.load_sample, parse_image=parse_image, parse_mask=parse_mask)
+        fs = get_filesystem(self.url)
+        if batch_decode is not None:
+            load = partial(self.load_batch, parse_image=parse_image, parse_mask=parse_mask, fs=fs)
+            return it.batched(batch_decode, drop_last_if_not_full=False).map(load)
+        load = partial(self.load_sample, parse_image=parse_image, parse_mask=parse_mask, fs=fs)
         return it.map(load)
@@ -1,15 +1,20 @@
 from __future__ import annotations
 
 import os
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, Generator, Iterable, List, Optional, Set, TYPE_CHECKING, Tuple
+from typing import Any, Dict, Generator, Iterable, List, Mapping, Optional, Sequence, Set, TYPE_CHECKING, Tuple, Union
 
-from squirrel.driver import FileDriver, IterDriver
-from squirrel.iterstream import FilePathGenerator
+import numpy as np
+from squirrel.driver import IterDriver
 
-from squirrel_datasets_core.io import load_image
+from squirrel_datasets_core.datasets.imagenet.index import BboxIndex, LabelIndex, load_index
+from squirrel_datasets_core.datasets.utils import collate_samples
+from squirrel_datasets_core.io import get_filesystem, load_image, load_images
+from squirrel_datasets_core.io.listing import list_files
 
 if TYPE_CHECKING:
+    import fsspec
     from squirrel.iterstream import Composable
 
 
@@ -24,6 +29,7 @@ class RawImageNetDriver(IterDriver):
         loc_val_mapping_url: Optional[str] = None,
         cls_val_mapping_url: Optional[str] = None,
         val_blacklist_url: Optional[str] = None,
+        index_dir: Optional[str] = None,
         **kwargs,
     ) -> None:
         """Init RawImageNetDriver.
@@ -43,6 +49,10 @@ class RawImageNetDriver(IterDriver):
             val_blacklist_url (str, optional): Path to the text file that contains the blacklisted validation samples
                 Each line of this file should contain a sample index. If not provided, validation samples will not be
                 filtered. Defaults to None.
+            index_dir (str, optional): Local directory in which the mapping files are stored as memory-mapped arrays
+                after parsing them once, see :py:mod:`squirrel_datasets_core.datasets.imagenet.index`. If not provided,
+                the environment variable `SQUIRREL_IMAGENET_INDEX` or `~/.cache/squirrel_datasets_core/imagenet` is
+                used. Defaults to None.
         """
         self.path = url
         self.cls_mapping_path = cls_mapping_url
@@ -50,6 +60,18 @@ class RawImageNetDriver(IterDriver):
         self.loc_val_mapping_path = loc_val_mapping_url
         self.cls_val_mapping_path = cls_val_mapping_url
         self.val_blacklist_path = val_blacklist_url
+        self.index_dir = index_dir
+
+    @staticmethod
+    def global_shuffle(paths: Iterable[str], seed: Optional[int] = None, offset: int = 0) -> Generator[str, None, None]:
+        """Yield all paths in the order of a random permutation, which is determined by `seed`.
+        The paths are sorted before permuting them, so that the order does not depend on the listing. The first
+        `offset` paths of the permutation are skipped, which allows to resume an epoch.
+        """
+        paths = sorted(paths)
+        order = np.random.default_rng(seed).permutation(len(paths)).astype(np.int32)
+        for idx in order[offset:].tolist():
+            yield paths[idx]
 
     @staticmethod
     def parse_gt_train(
@@ -69,7 +91,9 @@ class RawImageNetDriver(IterDriver):
 
     @staticmethod
     def parse_bbox(
-        samples: Iterable[Dict[str, Any]], cls_map: Dict[str, Tuple[int, str]], loc_map: Dict[str, List[Dict[str, Any]]]
+        samples: Iterable[Dict[str, Any]],
+        cls_map: Dict[str, Tuple[int, str]],
+        loc_map: Mapping[str, List[Dict[str, Any]]],
     ) -> Generator[Dict[str, Any], None, None]:
         """Add bounding boxes to samples.
         The list of bounding box dictionaries are stored under the key "bboxes".
@@ -78,8 +102,8 @@ class RawImageNetDriver(IterDriver):
             # split after last / and before last .
             filename = Path(sample["url"]).stem
             sample["bboxes"] = []
-            if filename in loc_map:
-                a_bboxes = loc_map[filename]
+            a_bboxes = loc_map.get(filename)
+            if a_bboxes is not None:
                 for bbox in a_bboxes:
                     label, label_name = cls_map[bbox["class_id"]]
                     bbox["classification_label"] = label
@@ -89,7 +113,7 @@ class RawImageNetDriver(IterDriver):
 
     @staticmethod
     def parse_gt_val(
-        samples: Iterable[Dict[str, Any]], clsidx_map: Dict[int, Tuple[str, str]], clsidx_val_list: List[int]
+        samples: Iterable[Dict[str, Any]], clsidx_map: Dict[int, Tuple[str, str]], clsidx_val_list: Sequence[int]
     ) -> Generator[Dict[str, Any], None, None]:
         """Add class id, class index, and class label to validation set samples.
         The class id, index, and label are stored under the keys "class_id", "classification_label",
@@ -100,7 +124,7 @@ class RawImageNetDriver(IterDriver):
             filename = Path(sample["url"]).stem
             # extract label id from filename
             a_id = int(filename.split("_")[-1]) - 1
-            label = clsidx_val_list[a_id]
+            label = int(clsidx_val_list[a_id])
             class_id, label_name = clsidx_map[label]
             sample["class_id"] = class_id
             sample["classification_label_name"] = label_name
@@ -117,45 +141,27 @@ class RawImageNetDriver(IterDriver):
             if a_id not in idx_blacklist:
                 yield sample
 
-    def get_loc_mapper(self, url: str) -> Dict[str, List[Dict[str, Any]]]:
-        """Get dict that maps from an imagenet filename to a list of bbox dicts."""
-        loc_map = dict()
-        with FileDriver(url).open(mode="rt") as f:
-            f.readline()  # skip the header
-            for row in f.readlines():
-                file_name, bboxes_raw = row.strip().split(",")
-                bboxes = []
-                for bbox_raw in bboxes_raw.split("n")[1:]:
-                    class_id, *x = bbox_raw.strip().split(" ")
-                    assert len(x) == 4
-                    class_id = f"n{class_id}"
-                    bboxes.append({"class_id": class_id, "loc": [int(ax) for ax in x]})
-                loc_map[file_name] = bboxes
-        return loc_map
-
-    def get_val_clsidx_list(self) -> List[int]:
-        """Get list of class indices for validation samples."""
-        with FileDriver(self.cls_val_mapping_path).open(mode="rt") as f:
-            val_clsidx = [int(row.strip()) - 1 for row in f.readlines()]
-        return val_clsidx
+    def get_loc_mapper(self, url: str) -> Mapping[str, List[Dict[str, Any]]]:
+        """Get mapping from an imagenet filename to a list of bbox dicts, backed by memory-mapped index arrays."""
+        return BboxIndex(load_index(url, "loc", self.index_dir))
+
+    def get_val_clsidx_list(self) -> Sequence[int]:
+        """Get memory-mapped array of class indices for validation samples."""
+        return load_index(self.cls_val_mapping_path, "int", self.index_dir)["values"]
 
     def get_val_blacklist_indices(self) -> Set[int]:
         """Get a set of blacklisted validation sample indices."""
-        with FileDriver(self.val_blacklist_path).open(mode="rt") as f:
-            blacklist_idx = {int(row.strip()) - 1 for row in f.readlines()}
-        return blacklist_idx
+        return set(load_index(self.val_blacklist_path, "int", self.index_dir)["values"].tolist())
 
     def get_id_to_idx_and_name_mapper(self) -> Dict[str, Tuple[int, str]]:
         """Get dict that maps from an imagenet foldername (i.e. class id) to a (class index, class name) tuple.
         WARNING: Imagenet idx start from 1. Here we start from 0.
         """
-        gt_map = dict()
-        with FileDriver(self.cls_mapping_path).open(mode="rt") as f:
-            for row in f.readlines():
-                row = row.strip()
-                class_id, class_idx, class_name = row.split(" ")
-                gt_map[class_id] = (int(class_idx) - 1, class_name)
-        return gt_map
+        arrays = load_index(self.cls_mapping_path, "cls", self.index_dir)
+        return {
+            class_id.decode(): (class_idx, str(class_name))
+            for class_id, class_idx, class_name in zip(arrays["ids"], arrays["idx"].tolist(), arrays["names"])
+        }
 
     def get_idx_to_id_and_name_mapper(self) -> Dict[int, Tuple[str, str]]:
         """Get dict that maps from an imagenet class index to a (class id, class name) tuple.
@@ -165,18 +171,42 @@ class RawImageNetDriver(IterDriver):
         return {class_idx: (class_id, class_name) for class_id, (class_idx, class_name) in cls_map.items()}
 
     @staticmethod
-    def load_sample(sample: Dict[str, Any]) -> Dict[str, Any]:
-        """Load sample from dict containing url to sample."""
-        sample["image"] = load_image(sample["url"])
+    def load_sample(
+        sample: Dict[str, Any],
+        target_size: Optional[Union[int, Tuple[int, int]]] = None,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> Dict[str, Any]:
+        """Load sample from dict containing url to sample. See :py:func:`load_image` for `target_size` and `fs`."""
+        sample["image"] = load_image(sample["url"], fs=fs, target_size=target_size)
         return sample
 
+    @staticmethod
+    def load_batch(
+        samples: List[Dict],
+        target_size: Optional[Union[int, Tuple[int, int]]] = None,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> Dict[str, Any]:
+        """Collate samples into a dictionary of lists and load their images concurrently under the key "image". The
+        images are stacked into one array if their shapes match. See :py:func:`load_images`.
+        """
+        batch = collate_samples(samples)
+        batch["image"] = load_images(batch["url"], fs=fs, target_size=target_size)
+        return batch
+
     def get_iter(
         self,
         split: str,
         hooks: Optional[List[Iterable]] = None,
         parse: bool = True,
-        shuffle: bool = True,
+        shuffle: Union[bool, str] = True,
         buffer_size: int = 100_000,
+        seed: Optional[int] = None,
+        offset: int = 0,
+        label_chunk_size: int = 1024,
+        target_size: Optional[Union[int, Tuple[int, int]]] = None,
+        batch_decode: Optional[int] = None,
+        cache_listing: bool = False,
+        refresh_listing: bool = False,
         **kwargs,
     ) -> Composable:
         """Create iterstream for the given split.
@@ -187,8 +217,29 @@ class RawImageNetDriver(IterDriver):
                 None.
             parse (bool, optional): Whether to load the image into sample dictionary. Image will be stored under the
                 key "image". Defaults to True.
-            shuffle (bool, optional): Whether to shuffle the samples. Defaults to True.
+            shuffle (Union[bool, str], optional): Whether to shuffle the samples. True shuffles approximately with a
+                buffer of `buffer_size` samples. "global" lists all files first and yields them in the order of a
+                random permutation, which is exact and only needs an int32 per file, see :py:meth:`global_shuffle`.
+                Defaults to True.
             buffer_size (int, optional): Buffer size used for shuffling. Defaults to 100_000.
+            seed (int, optional): Seed of the permutation if `shuffle` is "global". Pass the same seed to get the same
+                order in every worker and when resuming. Defaults to None.
+            offset (int, optional): Number of samples of the permutation to skip if `shuffle` is "global", e.g. the
+                number of samples already consumed in an interrupted epoch. Defaults to 0.
+            label_chunk_size (int, optional): Number of samples whose labels and bounding boxes are looked up at once,
+                see :py:class:`~squirrel_datasets_core.datasets.imagenet.index.LabelIndex`. Defaults to 1024.
+            target_size (Union[int, Tuple[int, int]], optional): Minimum (height, width) of the loaded images. If
+                given, images are decoded at reduced size as long as they stay at least as large, e.g. pass 256 if
+                images are resized to 256 right after loading. See :py:func:`load_image`. Defaults to None.
+            batch_decode (int, optional): If given, samples are batched into dictionaries of lists of this size (the
+                last batch may be smaller) and the images of a batch are loaded concurrently with
+                :py:func:`~squirrel_datasets_core.io.load_images`. Images of the same shape are stacked into one array.
+                Defaults to None.
+            cache_listing (bool, optional): Whether to keep the file listing in a persistent manifest and reuse it
+                in later calls, see :py:class:`~squirrel_datasets_core.io.listing.CachedFilePathGenerator`. Defaults to
+                False.
+            refresh_listing (bool, optional): Whether to rebuild the manifest of the file listing. Only used if
+                `cache_listing` is True. Defaults to False.
 
         Returns:
             Composable: Composable containing the samples.
@@ -198,39 +249,38 @@ class RawImageNetDriver(IterDriver):
         if hooks is None:
             hooks = []
 
-        it = FilePathGenerator(url, nested=True)
+        it = list_files(url, nested=True, cache=cache_listing, refresh=refresh_listing)
 
-        if shuffle:
+        if shuffle == "global":
+            it = it.to(RawImageNetDriver.global_shuffle, seed=seed, offset=offset)
+        elif isinstance(shuffle, str):
+            raise ValueError(f"shuffle must be True, False or 'global', got {shuffle!r}.")
+        elif shuffle:
             it = it.shuffle(size=buffer_size, initial=buffer_size)
 
         it = it.map(lambda x: {"url": x})
         if self.cls_mapping_path is not None and split != "test":
-            cls_map = self.get_id_to_idx_and_name_mapper()
-
+            cls = load_index(self.cls_mapping_path, "cls", self.index_dir)
+            val_labels = blacklist = None
             if split == "train":
-                it = it.to(RawImageNetDriver.parse_gt_train, cls_map=cls_map)
-
-                if self.loc_train_mapping_path is not None:
-                    loc_map = self.get_loc_mapper(self.loc_train_mapping_path)
-                    it = it.to(RawImageNetDriver.parse_bbox, cls_map=cls_map, loc_map=loc_map)
-
-            elif split == "val":
-                if self.val_blacklist_path is not None:
-                    val_blacklist = self.get_val_blacklist_indices()
-                    it = it.to(RawImageNetDriver.filter_val_samples_by_idx, idx_blacklist=val_blacklist)
-
+                loc_url = self.loc_train_mapping_path
+            else:
+                loc_url = self.loc_val_mapping_path
                 if self.cls_val_mapping_path is not None:
-                    val_clsidx_map = self.get_val_clsidx_list()
-                    clsidx_map = self.get_idx_to_id_and_name_mapper()
-                    it = it.to(RawImageNetDriver.parse_gt_val, clsidx_map=clsidx_map, clsidx_val_list=val_clsidx_map)
-
-                if self.loc_val_mapping_path is not None:
-                    loc_map = self.get_loc_mapper(self.loc_val_mapping_path)
-                    it = it.to(RawImageNetDriver.parse_bbox, cls_map=cls_map, loc_map=loc_map)
+                    val_labels = self.get_val_clsidx_list()
+                if self.val_blacklist_path is not None:
+                    blacklist = load_index(self.val_blacklist_path, "int", self.index_dir)["values"]
+            loc_map = None if loc_url is None else self.get_loc_mapper(loc_url)
+            labels = LabelIndex(cls, loc=loc_map, val_labels=val_labels, blacklist=blacklist)
+            it = it.to(labels.attach, split=split, chunk_size=label_chunk_size)
 
         for h in hooks:
             it = it.to(h)
 
         if not parse:
             return it
-        return it.map(RawImageNetDriver.load_sample)
+        fs = get_filesystem(self.path)
+        if batch_decode is not None:
+            load = partial(RawImageNetDriver.load_batch, target_size=target_size, fs=fs)
+            return it.batched(batch_decode, drop_last_if_not_full=False).map(load)
+        return it.map(partial(RawImageNetDriver.load_sample, target_size=target_size, fs=fs))
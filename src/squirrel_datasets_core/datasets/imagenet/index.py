@@ -0,0 +1,349 @@
+"""Precompiled, memory-mapped index of the ImageNet mapping files.
+
+The class mapping, bounding box, validation label and blacklist files are text files. Parsing them with Python takes
+seconds and the resulting dicts of lists of dicts take hundreds of MB in every worker. Each file is therefore parsed
+once into numpy arrays, which are stored as `.npy` files and memory-mapped by all workers, so that the pages are
+shared between processes:
+
+- class mapping: class ids, class indices and class names in file order.
+- bounding boxes: sorted file names, an offset array into a packed (N, 4) int32 box array and the class of every box as
+  an index into an interned class id table.
+- validation labels and blacklist: int32 arrays.
+
+:py:class:`LabelIndex` attaches all labels to chunks of samples at once with array lookups on these indices.
+
+Index directories are keyed by the url and the `ukey` (e.g. size and modification time) of the mapping file, so that
+they are rebuilt when the file changes.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Mapping
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from squirrel.driver import FileDriver
+
+from squirrel_datasets_core.io import get_filesystem
+
+__all__ = ["BboxIndex", "INDEX_CACHE_ENV_VAR", "LabelIndex", "load_index"]
+
+INDEX_CACHE_ENV_VAR = "SQUIRREL_IMAGENET_INDEX"
+_DEFAULT_CACHE_DIR = Path("~/.cache/squirrel_datasets_core/imagenet")
+_INDEX_VERSION = 1
+
+Arrays = Dict[str, np.ndarray]
+
+
+def _build_cls_index(url: str) -> Arrays:
+    """Parse a class mapping file with lines "{class_id} {class_idx} {class_name}"."""
+    ids, idx, names = [], [], []
+    with FileDriver(url).open(mode="rt") as f:
+        for row in f.readlines():
+            class_id, class_idx, class_name = row.strip().split(" ")
+            ids.append(class_id)
+            idx.append(int(class_idx) - 1)
+            names.append(class_name)
+    return {"ids": np.array(ids, dtype="S"), "idx": np.array(idx, dtype=np.int32), "names": np.array(names, dtype="U")}
+
+
+def _build_loc_index(url: str) -> Arrays:
+    """Parse a bounding box file with a header and lines "{file_name},{class_id} {x0} {y0} {x1} {y1} ..."."""
+    loc_map = {}
+    with FileDriver(url).open(mode="rt") as f:
+        f.readline()  # skip the header
+        for row in f.readlines():
+            file_name, bboxes_raw = row.strip().split(",")
+            bboxes = []
+            for bbox_raw in bboxes_raw.split("n")[1:]:
+                class_id, *x = bbox_raw.strip().split(" ")
+                assert len(x) == 4
+                bboxes.append((f"n{class_id}", [int(ax) for ax in x]))
+            loc_map[file_name] = bboxes
+
+    files = sorted(loc_map)
+    class_ids = sorted({class_id for bboxes in loc_map.values() for class_id, _ in bboxes})
+    class_codes = {class_id: i for i, class_id in enumerate(class_ids)}
+    counts = [len(loc_map[name]) for name in files]
+    return {
+        "files": np.array(files, dtype="S"),
+        "offsets": np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        "boxes": np.array([x for name in files for _, x in loc_map[name]], dtype=np.int32).reshape(-1, 4),
+        "classes": np.array([class_codes[c] for name in files for c, _ in loc_map[name]], dtype=np.int32),
+        "class_ids": np.array(class_ids, dtype="S"),
+    }
+
+
+def _build_int_index(url: str) -> Arrays:
+    """Parse a file with one 1-based integer per line into 0-based values."""
+    with FileDriver(url).open(mode="rt") as f:
+        values = [int(row.strip()) - 1 for row in f.readlines()]
+    return {"values": np.array(values, dtype=np.int32)}
+
+
+_BUILDERS: Dict[str, Callable[[str], Arrays]] = {
+    "cls": _build_cls_index,
+    "loc": _build_loc_index,
+    "int": _build_int_index,
+}
+
+
+def _read_arrays(path: Path) -> Arrays:
+    """Memory-map all arrays of an index directory."""
+    return {p.stem: np.load(p, mmap_mode="r") for p in path.glob("*.npy")}
+
+
+def _write_arrays(path: Path, arrays: Arrays) -> None:
+    """Write the arrays of an index to a temporary directory and move it to `path`."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=path.parent, suffix=".tmp"))
+    try:
+        for name, arr in arrays.items():
+            np.save(tmp / f"{name}.npy", arr)
+        os.replace(tmp, path)
+    except OSError:
+        # another worker has written the index in the meantime
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not path.exists():
+            raise
+
+
+def load_index(url: str, kind: str, cache_dir: Optional[Union[str, Path]] = None) -> Arrays:
+    """Get the arrays of a mapping file, building the index on first use.
+
+    Args:
+        url (str): Url of the mapping file.
+        kind (str): Kind of the mapping file, one of "cls" (class mapping), "loc" (bounding boxes) or "int" (one
+            integer per line, i.e. validation labels or blacklist).
+        cache_dir (Union[str, Path], optional): Local directory to store the index in. If not provided, the environment
+            variable `SQUIRREL_IMAGENET_INDEX` is used, or `~/.cache/squirrel_datasets_core/imagenet`. If the directory
+            is not writable, the arrays are kept in memory. Defaults to None.
+
+    Returns:
+        Dict[str, np.ndarray]: Memory-mapped arrays of the index.
+    """
+    url = str(url)
+    if cache_dir is None:
+        cache_dir = os.environ.get(INDEX_CACHE_ENV_VAR, _DEFAULT_CACHE_DIR)
+    ukey = get_filesystem(url).ukey(url)
+    key = hashlib.sha256(json.dumps([_INDEX_VERSION, kind, url, ukey]).encode()).hexdigest()[:32]
+    path = Path(cache_dir).expanduser() / key
+
+    if not path.exists():
+        arrays = _BUILDERS[kind](url)
+        try:
+            _write_arrays(path, arrays)
+        except OSError:
+            return arrays
+    return _read_arrays(path)
+
+
+class BboxIndex(Mapping):
+    """Read-only mapping from an ImageNet file name to its list of bounding box dicts, backed by index arrays.
+
+    The bounding box dicts are created on access, with the keys "class_id" and "loc" like in the mapping file.
+    """
+
+    def __init__(self, arrays: Arrays) -> None:
+        """Initialize BboxIndex from the arrays of a "loc" index, see :py:func:`load_index`."""
+        self.files = arrays["files"]
+        self.offsets = arrays["offsets"]
+        self.boxes = arrays["boxes"]
+        self.classes = arrays["classes"]
+        self.class_ids = [class_id.decode() for class_id in arrays["class_ids"]]
+
+    def positions(self, file_names: Sequence[str]) -> np.ndarray:
+        """Positions of `file_names` in the sorted file names, -1 for names without entry."""
+        keys = np.array([name.encode() for name in file_names], dtype="S")
+        pos = np.searchsorted(self.files, keys)
+        pos[pos == len(self.files)] = 0
+        found = self.files[pos] == keys if len(self.files) else np.zeros(len(keys), dtype=bool)
+        return np.where(found, pos, -1)
+
+    def _position(self, file_name: str) -> Optional[int]:
+        """Position of `file_name` in the sorted file names, None if it has no entry."""
+        key = file_name.encode()
+        i = int(np.searchsorted(self.files, key))
+        if i < len(self.files) and self.files[i] == key:
+            return i
+        return None
+
+    def __getitem__(self, file_name: str) -> List[Dict[str, Any]]:
+        """Get the bounding boxes of `file_name`."""
+        i = self._position(file_name) if isinstance(file_name, str) else None
+        if i is None:
+            raise KeyError(file_name)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return [
+            {"class_id": self.class_ids[c], "loc": box}
+            for c, box in zip(self.classes[start:end].tolist(), self.boxes[start:end].tolist())
+        ]
+
+    def __contains__(self, file_name: object) -> bool:
+        """Whether `file_name` has an entry."""
+        return isinstance(file_name, str) and self._position(file_name) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the file names."""
+        return (name.decode() for name in self.files)
+
+    def __len__(self) -> int:
+        """Number of file names."""
+        return len(self.files)
+
+
+def _stem(url: str) -> str:
+    """File name of `url` without extension, like `Path(url).stem`."""
+    name = url.rsplit("/", 1)[-1]
+    stem, dot, _ = name.rpartition(".")
+    return stem if dot and stem else name
+
+
+class LabelIndex:
+    """Attaches class labels and bounding boxes to ImageNet samples in chunks.
+
+    This is the batched equivalent of the stages :py:meth:`RawImageNetDriver.parse_gt_train`,
+    :py:meth:`RawImageNetDriver.filter_val_samples_by_idx`, :py:meth:`RawImageNetDriver.parse_gt_val` and
+    :py:meth:`RawImageNetDriver.parse_bbox` and yields the same samples. File names are parsed once per sample and all
+    lookups of a chunk are done with `np.searchsorted` and array indexing.
+    """
+
+    def __init__(
+        self,
+        cls: Arrays,
+        loc: Optional[BboxIndex] = None,
+        val_labels: Optional[np.ndarray] = None,
+        blacklist: Optional[np.ndarray] = None,
+    ) -> None:
+        """Initialize LabelIndex.
+
+        Args:
+            cls (Dict[str, np.ndarray]): Arrays of a "cls" index, see :py:func:`load_index`.
+            loc (BboxIndex, optional): Bounding boxes to attach under the key "bboxes". Defaults to None.
+            val_labels (np.ndarray, optional): Class index of every validation sample. Defaults to None.
+            blacklist (np.ndarray, optional): Indices of validation samples to drop. Defaults to None.
+        """
+        ids = np.asarray(cls["ids"])
+        self.class_ids = [class_id.decode() for class_id in ids]
+        self.class_names = [str(name) for name in cls["names"]]
+        self.class_idx = np.asarray(cls["idx"])
+        self._id_order = np.argsort(ids, kind="stable")
+        self._sorted_ids = ids[self._id_order]
+        self._idx_order = np.argsort(self.class_idx, kind="stable")
+        self._sorted_idx = self.class_idx[self._idx_order]
+
+        self.loc = loc
+        if loc is not None:
+            # row in the class table of the class of every bounding box
+            self._loc_rows = self._lookup(self._sorted_ids, self._id_order, np.array(loc.class_ids, dtype="S"))
+        self.val_labels = val_labels
+        self.blacklist = None if blacklist is None else np.unique(blacklist)
+
+    @staticmethod
+    def _lookup(sorted_keys: np.ndarray, order: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        """Rows of `keys` in a table given by its sorted keys and their order, -1 for missing keys."""
+        if len(sorted_keys) == 0:
+            return np.full(len(keys), -1)
+        pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        return np.where(sorted_keys[pos] == keys, order[pos], -1)
+
+    def _class_rows(self, class_ids: List[str]) -> np.ndarray:
+        """Rows of class ids in the class table, raises KeyError for unknown class ids."""
+        rows = self._lookup(self._sorted_ids, self._id_order, np.array(class_ids, dtype="S"))
+        if (rows < 0).any():
+            raise KeyError(class_ids[int(np.argmin(rows))])
+        return rows
+
+    def _attach_bboxes(self, chunk: List[Dict[str, Any]], stems: List[str]) -> None:
+        """Add the list of bounding box dicts of every sample under the key "bboxes"."""
+        positions = self.loc.positions(stems)
+        found = positions >= 0
+        starts = np.where(found, np.asarray(self.loc.offsets)[positions], 0)
+        counts = np.where(found, np.asarray(self.loc.offsets)[positions + 1] - starts, 0)
+
+        # gather the boxes of all samples of the chunk at once
+        rows_in_chunk = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        classes = np.asarray(self.loc.classes)[rows_in_chunk]
+        boxes = np.asarray(self.loc.boxes)[rows_in_chunk].tolist()
+        rows = self._loc_rows[classes]
+        if (rows < 0).any():
+            raise KeyError(self.loc.class_ids[int(classes[int(np.argmin(rows))])])
+        labels = self.class_idx[rows].tolist()
+
+        bboxes = [
+            {
+                "class_id": self.loc.class_ids[c],
+                "loc": box,
+                "classification_label": label,
+                "classification_label_name": n,
+            }
+            for c, box, label, n in zip(classes.tolist(), boxes, labels, (self.class_names[r] for r in rows.tolist()))
+        ]
+        i = 0
+        for sample, count in zip(chunk, counts.tolist()):
+            sample["bboxes"] = bboxes[i : i + count]
+            i += count
+
+    def _attach_train(self, chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Attach labels to train samples, the class id is the name of the parent directory."""
+        class_ids = [sample["url"].split("/")[-2] for sample in chunk]
+        rows = self._class_rows(class_ids).tolist()
+        labels = self.class_idx[rows].tolist()
+        for sample, row, label, class_id in zip(chunk, rows, labels, class_ids):
+            sample["classification_label"] = label
+            sample["classification_label_name"] = self.class_names[row]
+            sample["class_id"] = class_id
+        return chunk
+
+    def _attach_val(self, chunk: List[Dict[str, Any]], stems: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Drop blacklisted validation samples and attach labels to the others, the sample index ends the name."""
+        sample_idx = np.array([int(stem.split("_")[-1]) - 1 for stem in stems], dtype=np.int64)
+        if self.blacklist is not None:
+            keep = ~np.isin(sample_idx, self.blacklist)
+            chunk = [sample for sample, k in zip(chunk, keep.tolist()) if k]
+            stems = [stem for stem, k in zip(stems, keep.tolist()) if k]
+            sample_idx = sample_idx[keep]
+
+        if self.val_labels is not None:
+            labels = np.asarray(self.val_labels[sample_idx])
+            rows = self._lookup(self._sorted_idx, self._idx_order, labels)
+            if (rows < 0).any():
+                raise KeyError(int(labels[int(np.argmin(rows))]))
+            for sample, row, label in zip(chunk, rows.tolist(), labels.tolist()):
+                sample["class_id"] = self.class_ids[row]
+                sample["classification_label_name"] = self.class_names[row]
+                sample["classification_label"] = label
+        return chunk, stems
+
+    def attach(
+        self, samples: Iterable[Dict[str, Any]], split: str, chunk_size: int = 1024
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Attach labels and bounding boxes to the samples of a split, processing `chunk_size` samples at once.
+
+        Args:
+            samples (Iterable[Dict[str, Any]]): Samples with the image url under the key "url".
+            split (str): Either "train" or "val".
+            chunk_size (int, optional): Number of samples processed at once. Defaults to 1024.
+
+        Yields:
+            Dict[str, Any]: Samples with the keys added by the per-sample stages of the split.
+        """
+        it = iter(samples)
+        while True:
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                return
+            stems = [_stem(sample["url"]) for sample in chunk]
+            if split == "train":
+                chunk = self._attach_train(chunk)
+            else:
+                chunk, stems = self._attach_val(chunk, stems)
+            if self.loc is not None:
+                self._attach_bboxes(chunk, stems)
+            yield from chunk
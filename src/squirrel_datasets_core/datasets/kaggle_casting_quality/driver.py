@@ -1,15 +1,19 @@
 from __future__ import annotations
 
 import os
+from functools import partial
 from itertools import chain
-from typing import Callable, Dict, List, Optional, TYPE_CHECKING
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING, Tuple, Union
 
 from squirrel.driver import IterDriver
-from squirrel.iterstream import FilePathGenerator, IterableSource
+from squirrel.iterstream import IterableSource
 
-from squirrel_datasets_core.io import load_image
+from squirrel_datasets_core.datasets.utils import collate_samples
+from squirrel_datasets_core.io import get_filesystem, load_image, load_images
+from squirrel_datasets_core.io.listing import list_files
 
 if TYPE_CHECKING:
+    import fsspec
     from squirrel.iterstream import Composable
 
 
@@ -27,24 +31,64 @@ class RawKaggleCastingQualityDriver(IterDriver):
         self.url = url
 
     @staticmethod
-    def load_sample(sample: Dict) -> Dict:
-        """Load sample from dict containing url to sample."""
-        sample["image"] = load_image(sample["url"])
+    def load_sample(
+        sample: Dict,
+        target_size: Optional[Union[int, Tuple[int, int]]] = None,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> Dict:
+        """Load sample from dict containing url to sample. See :py:func:`load_image` for `target_size` and `fs`."""
+        sample["image"] = load_image(sample["url"], fs=fs, target_size=target_size)
         return sample
 
-    def get_iter(self, split: str, hooks: Optional[List[Callable]] = None, parse: bool = True, **kwargs) -> Composable:
-        """Create iterstream based on dataset split (train, test). Applies hooks before loading samples."""
+    @staticmethod
+    def load_batch(
+        samples: List[Dict],
+        target_size: Optional[Union[int, Tuple[int, int]]] = None,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> Dict[str, Any]:
+        """Collate samples into a dictionary of lists and load their images concurrently under the key "image". The
+        images are stacked into one array if their shapes match. See :py:func:`load_images`.
+        """
+        batch = collate_samples(samples)
+        batch["image"] = load_images(batch["url"], fs=fs, target_size=target_size)
+        return batch
+
+    def get_iter(
+        self,
+        split: str,
+        hooks: Optional[List[Callable]] = None,
+        parse: bool = True,
+        target_size: Optional[Union[int, Tuple[int, int]]] = None,
+        batch_decode: Optional[int] = None,
+        cache_listing: bool = False,
+        refresh_listing: bool = False,
+        **kwargs,
+    ) -> Composable:
+        """Create iterstream based on dataset split (train, test). Applies hooks before loading samples. Images are
+        decoded at reduced size if they stay at least as large as `target_size`, see :py:func:`load_image`. If
+        `batch_decode` is given, samples are batched into dictionaries of lists of this size and their images are
+        loaded concurrently, see :py:meth:`load_batch`. With `cache_listing`, the file listing is kept in a persistent
+        manifest that is rebuilt if the directories change or if `refresh_listing` is True, see
+        :py:class:`~squirrel_datasets_core.io.listing.CachedFilePathGenerator`.
+        """
         assert split in ["train", "test"]  # kaggle casting quality datasets only have train and test split.
         if hooks is None:
             hooks = []
 
-        samples_def = FilePathGenerator(os.path.join(self.url, split, "def_front")).map(
+        list_kwargs = dict(cache=cache_listing, refresh=refresh_listing)
+        samples_def = list_files(os.path.join(self.url, split, "def_front"), **list_kwargs).map(
             lambda x: {"url": x, "label": 0}
         )
-        samples_ok = FilePathGenerator(os.path.join(self.url, split, "ok_front")).map(lambda x: {"url": x, "label": 1})
+        samples_ok = list_files(os.path.join(self.url, split, "ok_front"), **list_kwargs).map(
+            lambda x: {"url": x, "label": 1}
+        )
         it = IterableSource(chain(samples_ok, samples_def)).shuffle(size=1_000_000, initial=1_000_000)
         for h in hooks:
             it = it.to(h)
         if not parse:
             return it
-        return it.map(RawKaggleCastingQualityDriver.load_sample)
+        fs = get_filesystem(self.url)
+        if batch_decode is not None:
+            load = partial(RawKaggleCastingQualityDriver.load_batch, target_size=target_size, fs=fs)
+            return it.batched(batch_decode, drop_last_if_not_full=False).map(load)
+        return it.map(partial(RawKaggleCastingQualityDriver.load_sample, target_size=target_size, fs=fs))
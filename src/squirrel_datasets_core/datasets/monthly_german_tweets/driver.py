@@ -5,16 +5,23 @@ This driver can be used to parse the Zenodo Monthly German Tweet dataset obtaina
 from __future__ import annotations
 
 import json
+import logging
+from itertools import islice
 from pathlib import Path
-from typing import TYPE_CHECKING, Iterable, Iterator, List, Union
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Union
 
 from squirrel.driver import MapDriver
 from squirrel.fsspec.fs import get_fs_from_url
 from squirrel.iterstream import FilePathGenerator
 
+from squirrel_datasets_core.datasets.utils import collate_samples
+from squirrel_datasets_core.io import iter_json_array
+
 if TYPE_CHECKING:
     from squirrel.iterstream import Composable
 
+logger = logging.getLogger(__name__)
+
 
 class MonthlyGermanTweetsDriver(MapDriver):
     name = "raw_monthly_german_tweets"
@@ -29,40 +36,68 @@ class MonthlyGermanTweetsDriver(MapDriver):
         self.compression = "gzip"
         self.parse_error_count = 0
 
-    def parse_archive(self, url: str) -> List[str]:
-        """Parse a single archive. Note the custom parsing function due to the special file layout."""
+    def parse_archive(self, url: str, fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Parse a single archive, which holds a json array of tweets.
 
+        The archive is parsed incrementally, so memory usage does not grow with the size of the archive. If the archive
+        is not a valid json array, e.g. because it is truncated, the tweets up to the error are yielded, the error is
+        counted in `parse_error_count` and logged, and the rest of the archive is skipped. If `fields` are given, only
+        these fields are extracted, see :py:func:`~squirrel_datasets_core.io.iter_json_array`.
+        """
         fs = get_fs_from_url(url)
         with fs.open(url, "rb", compression=self.compression) as f:
-            json_bytes = list(f)
+            try:
+                yield from iter_json_array(f, fields=fields)
+            except json.JSONDecodeError as e:
+                self.parse_error_count += 1
+                logger.warning("Skipping the rest of %s after a parse error: %s", url, e)
 
-        dec = "".join([b.decode("utf-8").strip() for b in json_bytes])[1:-1]
-        samples = [(elem if elem.startswith("{") else "{" + elem) for elem in dec.split(",{")]
+    def get(
+        self, url: str, fields: Optional[List[str]] = None, batch_size: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yields all samples in a single archive.
 
+        Args:
+            url (str): Path to the archive.
+            fields (List[str], optional): If provided, samples only hold these fields. Nested fields are given as keys
+                joined by dots, e.g. "user.id". Fields that a tweet does not have are None. With `pysimdjson`
+                installed, no python objects are built for the other fields. Defaults to None.
+            batch_size (int, optional): If provided, dicts that map every field to the list of its values in up to
+                `batch_size` samples are yielded instead of single samples, see
+                :py:func:`~squirrel_datasets_core.datasets.utils.collate_samples`. Defaults to None.
+        """
+        samples = self.parse_archive(url, fields=fields)
+        if batch_size is not None:
+            return map(collate_samples, iter(lambda: list(islice(samples, batch_size)), []))
         return samples
 
-    def get(self, url: str) -> Iterator:
-        """Yields all samples in a single archive."""
-
-        samples = self.parse_archive(url)
-
-        for s in samples:
-            try:
-                sample = json.loads(s)
-                yield sample
-            except json.JSONDecodeError:
-                self.parse_error_count += 1
-
-    def get_iter(self, flatten: bool = True, **kwargs) -> Composable:
+    def get_iter(
+        self,
+        flatten: bool = True,
+        fields: Optional[List[str]] = None,
+        batch_size: Optional[int] = None,
+        get_kwargs: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ) -> Composable:
         """Returns a composable that iterates over the raw data in a full unzipped shard of the Monthly German Tweets
         dataset.
 
         Args:
             flatten (bool): Whether to flatten the returned iterable. Defaults to True.
+            fields (List[str], optional): If provided, samples only hold these fields, e.g.
+                `["id", "created_at", "text", "user"]`. Defaults to None.
+            batch_size (int, optional): If provided, the items are dicts of columns of up to `batch_size` samples from
+                the same archive, see :py:meth:`get`. Defaults to None.
+            get_kwargs (Dict[str, Any], optional): Keyword arguments passed to :py:meth:`get`, `fields` and
+                `batch_size` are added to them if provided. Defaults to None.
             **kwargs: Other keyword arguments passed to :py:meth:`MapDriver.get_iter`.
         """
-
-        return super().get_iter(flatten=flatten, **kwargs)
+        get_kwargs = dict(get_kwargs or {})
+        if fields is not None:
+            get_kwargs["fields"] = fields
+        if batch_size is not None:
+            get_kwargs["batch_size"] = batch_size
+        return super().get_iter(flatten=flatten, get_kwargs=get_kwargs, **kwargs)
 
     def keys(self, **kwargs) -> Iterable:
         """Returns the paths of the files in the root directory relative to root."""
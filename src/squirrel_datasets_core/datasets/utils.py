@@ -1,6 +1,11 @@
-from typing import Optional, Tuple
+from __future__ import annotations
 
-import pandas as pd
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TYPE_CHECKING, Tuple, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 def stratified_sample_df(
@@ -37,3 +42,109 @@ def proportionate_sample_df(
     test_df_ = df.groupby(col, group_keys=False).apply(lambda x: x.sample(frac=fraction, random_state=seed))
     train_df_ = df.drop(test_df_.index)
     return train_df_, test_df_
+
+
+def collate_samples(samples: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Collates a batch of sample dictionaries into a dictionary of lists.
+
+    Args:
+        samples (List[Dict[str, Any]]): Samples of the batch.
+
+    Returns:
+        Dict[str, List[Any]]: Map from each key of the samples to the list of their values. Samples without a key get
+            the value None.
+    """
+    keys = dict.fromkeys(k for sample in samples for k in sample)
+    return {k: [sample.get(k) for sample in samples] for k in keys}
+
+
+def interleave(
+    streams: Sequence[Callable[[], Iterable[Any]]],
+    weights: Sequence[float],
+    seed: Optional[int] = None,
+    cycle: bool = False,
+) -> Iterator[Any]:
+    """
+    Interleaves items of several streams by drawing the stream of every item at random with the given weights.
+
+    Only the current item of every stream is consumed, so memory usage is that of the open streams. The order is
+    reproducible for a fixed `seed` if the streams are.
+
+    Args:
+        streams (Sequence[Callable[[], Iterable[Any]]]): Functions that open each stream, they are called again to
+            restart a stream if `cycle` is True.
+        weights (Sequence[float]): Non-negative sampling weight of every stream, they do not need to sum to one.
+        seed (int): [Optional] The random seed for the sampler.
+        cycle (bool): If True, exhausted streams are restarted and the result is infinite, so that the proportions of
+            the streams follow the weights. Otherwise, exhausted streams are dropped and the weights of the remaining
+            streams are renormalized. Defaults to False.
+
+    Yields:
+        Any: Items of the streams.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    if len(weights) != len(streams) or (weights < 0).any() or not weights.sum() > 0:
+        raise ValueError(f"Expected {len(streams)} non-negative weights with a positive sum, got {weights.tolist()}")
+
+    rng = np.random.default_rng(seed)
+    iterators = [iter(stream()) if w > 0 else None for stream, w in zip(streams, weights)]
+    active = weights > 0
+    while active.any():
+        p = np.where(active, weights, 0.0)
+        for i in rng.choice(len(p), size=1024, p=p / p.sum()):
+            try:
+                yield next(iterators[i])
+                continue
+            except StopIteration:
+                pass
+            if cycle:
+                iterators[i] = iter(streams[i]())
+                try:
+                    yield next(iterators[i])
+                    continue
+                except StopIteration:
+                    pass
+            # the probabilities change, draw the following streams again
+            active[i] = False
+            break
+
+
+class ShardUrls(Sequence[str]):
+    """
+    Urls of the shards of a dataset split, generated from a url template when they are accessed.
+
+    Only the template and the number of shards are stored, so the sequence stays small when it is pickled, e.g. as part
+    of a driver that is sent to worker processes, no matter how many shards there are.
+    """
+
+    def __init__(self, template: str, num_shards: int, **fields: Any) -> None:
+        """Init the shard urls.
+
+        Args:
+            template (str): Url of a shard, formatted with `shard` (the index of the shard), `num_shards` and
+                `fields`.
+            num_shards (int): Number of shards.
+            **fields: Other fields of the template, e.g. the language of the split.
+        """
+        self.template = template
+        self.num_shards = num_shards
+        self.fields = fields
+
+    def __len__(self) -> int:
+        """Number of shards."""
+        return self.num_shards
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[str, List[str]]:
+        """Url of the shard `idx`, or the list of urls of a slice of shards."""
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self.num_shards))]
+        if idx < 0:
+            idx += self.num_shards
+        if not 0 <= idx < self.num_shards:
+            raise IndexError(f"Shard {idx} out of range for {self.num_shards} shards")
+        return self.template.format(shard=idx, num_shards=self.num_shards, **self.fields)
+
+    def __repr__(self) -> str:
+        """Template, number of shards and fields of the urls."""
+        return f"{type(self).__name__}({self.template!r}, {self.num_shards}, **{self.fields!r})"
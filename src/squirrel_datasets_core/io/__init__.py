@@ -1,3 +1,37 @@
-from squirrel_datasets_core.io.io import load_image
+from squirrel_datasets_core.io.buffers import BufferPool, get_buffer_pool
+from squirrel_datasets_core.io.compression import open_decompressed, xz_blocks
+from squirrel_datasets_core.io.decode_pool import decode_images, resize_image
+from squirrel_datasets_core.io.decoders import available_decoders
+from squirrel_datasets_core.io.download_cache import DownloadCache
+from squirrel_datasets_core.io.fs import get_filesystem
+from squirrel_datasets_core.io.http import fetch_urls
+from squirrel_datasets_core.io.io import decode_image, load_image, load_images, prefetch_files, read_file
+from squirrel_datasets_core.io.listing import CachedFilePathGenerator, list_files
+from squirrel_datasets_core.io.shard_index import ShardIndex, load_shard_index
+from squirrel_datasets_core.io.text import iter_documents, iter_json_array, iter_json_lines, iter_line_chunks
 
-__all__ = ["load_image"]
+__all__ = [
+    "BufferPool",
+    "CachedFilePathGenerator",
+    "DownloadCache",
+    "ShardIndex",
+    "available_decoders",
+    "decode_image",
+    "decode_images",
+    "fetch_urls",
+    "get_buffer_pool",
+    "get_filesystem",
+    "iter_documents",
+    "iter_json_array",
+    "iter_json_lines",
+    "iter_line_chunks",
+    "list_files",
+    "load_image",
+    "load_images",
+    "load_shard_index",
+    "open_decompressed",
+    "prefetch_files",
+    "read_file",
+    "resize_image",
+    "xz_blocks",
+]
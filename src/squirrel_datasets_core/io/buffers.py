@@ -0,0 +1,101 @@
+"""Reusable output buffers for :py:func:`squirrel_datasets_core.io.load_image`.
+
+Decoding every image into a freshly allocated array causes a lot of allocator churn for large datasets. A
+:py:class:`BufferPool` keeps released arrays, bucketed by shape and dtype, and hands them out again for images of the
+same size::
+
+    pool = get_buffer_pool()
+    for url in urls:
+        img = load_image(url, out=pool)
+        ...  # e.g. copy into a batch
+        pool.release(img)
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+__all__ = ["BufferPool", "get_buffer_pool", "allocate_output"]
+
+
+class BufferPool:
+    """Thread-safe pool of reusable numpy arrays, bucketed by shape and dtype."""
+
+    def __init__(self, max_buffers_per_shape: int = 64) -> None:
+        """Initialize BufferPool.
+
+        Args:
+            max_buffers_per_shape (int, optional): Maximum number of released buffers kept per shape and dtype. Buffers
+                released beyond that are left to the garbage collector. Defaults to 64.
+        """
+        self.max_buffers_per_shape = max_buffers_per_shape
+        self._free: Dict[Tuple[Tuple[int, ...], np.dtype], List[np.ndarray]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, shape: Tuple[int, ...], dtype: Union[str, np.dtype] = np.uint8) -> np.ndarray:
+        """Get an uninitialized array of the given shape and dtype, reusing a released one if possible."""
+        key = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                self.hits += 1
+                return free.pop()
+            self.misses += 1
+        return np.empty(key[0], dtype=key[1])
+
+    def release(self, arr: np.ndarray) -> None:
+        """Return an array to the pool. The array must not be used afterwards. Views are ignored."""
+        if arr.base is not None or not arr.flags.c_contiguous:
+            return
+        key = (arr.shape, arr.dtype)
+        with self._lock:
+            free = self._free[key]
+            if len(free) < self.max_buffers_per_shape:
+                free.append(arr)
+
+    def clear(self) -> None:
+        """Drop all released buffers."""
+        with self._lock:
+            self._free.clear()
+
+
+_POOLS: Dict[int, BufferPool] = {}
+
+
+def get_buffer_pool() -> BufferPool:
+    """Get the buffer pool of the current process. Every (forked) worker process gets its own pool."""
+    pid = os.getpid()
+    if pid not in _POOLS:
+        _POOLS.clear()
+        _POOLS[pid] = BufferPool()
+    return _POOLS[pid]
+
+
+def allocate_output(
+    out: Union[np.ndarray, BufferPool], shape: Tuple[int, ...], dtype: Union[str, np.dtype] = np.uint8
+) -> np.ndarray:
+    """Get the array to decode an image of the given shape and dtype into.
+
+    Args:
+        out (Union[np.ndarray, BufferPool]): Either a preallocated array, which must match `shape` and `dtype`, or a
+            pool to acquire the array from.
+        shape (Tuple[int, ...]): Shape of the decoded image.
+        dtype (Union[str, np.dtype], optional): Dtype of the decoded image. Defaults to np.uint8.
+
+    Returns:
+        np.ndarray: Array to write the decoded image to.
+    """
+    if isinstance(out, BufferPool):
+        return out.acquire(shape, dtype)
+    if out.shape != tuple(shape) or out.dtype != np.dtype(dtype):
+        raise ValueError(
+            f"Output buffer of shape {out.shape} and dtype {out.dtype} does not fit image of shape {shape}"
+            f" and dtype {np.dtype(dtype)}."
+        )
+    return out
@@ -0,0 +1,283 @@
+"""Decompression of compressed text shards in background threads.
+
+:py:func:`fsspec.open` decompresses while the caller reads, so reading, decompressing and parsing a shard alternate on a
+single core. :py:func:`open_decompressed` moves reading and decompression to a background thread that fills a bounded
+queue ahead of the reader. zlib and lzma release the GIL while decompressing, so decompression and parsing run in
+parallel.
+
+xz files that consist of several blocks or streams, e.g. written with `xz -T0` or by concatenating xz files, end with an
+index of their blocks, see :py:func:`xz_blocks`. The blocks are independent and are decompressed concurrently by a pool
+of threads. Gzip members cannot be located without decompressing the preceding ones, so gzip files are always
+decompressed by a single thread.
+"""
+from __future__ import annotations
+
+import io
+import lzma
+import queue
+import threading
+import zlib
+from functools import partial
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+import fsspec
+from fsspec.utils import infer_compression
+from squirrel.iterstream import IterableSource
+
+from squirrel_datasets_core.io.fs import get_filesystem
+from squirrel_datasets_core.io.text import DEFAULT_CHUNK_SIZE
+
+__all__ = ["XzBlock", "decompress_xz_block", "open_decompressed", "xz_blocks"]
+
+_XZ_MAGIC = b"\xfd7zXZ\x00"
+_XZ_FOOTER_MAGIC = b"YZ"
+# size of the stream header and of the stream footer
+_XZ_HEADER_SIZE = 12
+
+
+class XzBlock(NamedTuple):
+    """Location of a block in an xz file."""
+
+    offset: int
+    """Offset of the block in the file."""
+    size: int
+    """Size of the block in the file, including its padding."""
+    unpadded_size: int
+    """Size of the block without padding, as stored in the index."""
+    uncompressed_size: int
+    """Size of the decompressed block."""
+    stream_flags: bytes
+    """Flags of the stream that contains the block, they define the integrity check of the block."""
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Decode a variable-length integer of the xz format, returns the value and the position after it."""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _varint(value: int) -> bytes:
+    """Encode a variable-length integer of the xz format."""
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _crc32(data: bytes) -> bytes:
+    return zlib.crc32(data).to_bytes(4, "little")
+
+
+def xz_blocks(url: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> List[XzBlock]:
+    """List the blocks of an xz file from the indices at the end of its streams.
+
+    Only the stream footers, indices and headers are read, which takes three range requests per stream.
+
+    Args:
+        url (str): Url of the xz file.
+        fs (fsspec.AbstractFileSystem, optional): Filesystem to read `url` with. Defaults to
+            :py:func:`~squirrel_datasets_core.io.get_filesystem`.
+
+    Raises:
+        ValueError: If `url` is not an xz file.
+
+    Returns:
+        List[XzBlock]: Blocks in the order of the file.
+    """
+    fs = get_filesystem(url) if fs is None else fs
+    blocks = []
+    end = fs.size(url)
+    while end > 0:
+        if end < 2 * _XZ_HEADER_SIZE:
+            raise ValueError(f"{url} is not an xz file")
+        footer = fs.cat_file(url, end - _XZ_HEADER_SIZE, end)
+        if footer[-4:] == b"\x00" * 4:
+            # stream padding between concatenated streams
+            end -= 4
+            continue
+        if footer[-2:] != _XZ_FOOTER_MAGIC:
+            raise ValueError(f"{url} is not an xz file")
+
+        flags = footer[8:10]
+        index_end = end - _XZ_HEADER_SIZE
+        index_start = index_end - (int.from_bytes(footer[4:8], "little") + 1) * 4
+        index = fs.cat_file(url, index_start, index_end)
+        count, pos = _read_varint(index, 1)
+        records = []
+        for _ in range(count):
+            unpadded, pos = _read_varint(index, pos)
+            uncompressed, pos = _read_varint(index, pos)
+            records.append((unpadded, uncompressed))
+
+        offset = index_start - sum(-(-unpadded // 4) * 4 for unpadded, _ in records)
+        start = offset - _XZ_HEADER_SIZE
+        if start < 0 or fs.cat_file(url, start, offset)[:6] != _XZ_MAGIC:
+            raise ValueError(f"{url} is not an xz file")
+        stream_blocks = []
+        for unpadded, uncompressed in records:
+            size = -(-unpadded // 4) * 4
+            stream_blocks.append(XzBlock(offset, size, unpadded, uncompressed, flags))
+            offset += size
+        blocks = stream_blocks + blocks
+        end = start
+    return blocks
+
+
+def decompress_xz_block(block: XzBlock, data: bytes) -> bytes:
+    """Decompress a single block of an xz file.
+
+    The block is wrapped in a stream with its own header, index and footer, so that lzma verifies its integrity check
+    and sizes like for a complete file.
+
+    Args:
+        block (XzBlock): Location of the block, see :py:func:`xz_blocks`.
+        data (bytes): The `block.size` bytes of the block.
+
+    Returns:
+        bytes: The decompressed block.
+    """
+    header = _XZ_MAGIC + block.stream_flags + _crc32(block.stream_flags)
+    index = b"\x00" + _varint(1) + _varint(block.unpadded_size) + _varint(block.uncompressed_size)
+    index += b"\x00" * (-len(index) % 4)
+    index += _crc32(index)
+    backward_size = (len(index) // 4 - 1).to_bytes(4, "little")
+    footer = _crc32(backward_size + block.stream_flags) + backward_size + block.stream_flags + _XZ_FOOTER_MAGIC
+    return lzma.decompress(header + data + index + footer, format=lzma.FORMAT_XZ)
+
+
+def _read_xz_block(url: str, fs: fsspec.AbstractFileSystem, block: XzBlock) -> bytes:
+    return decompress_xz_block(block, fs.cat_file(url, block.offset, block.offset + block.size))
+
+
+def _iter_file(url: str, fs: fsspec.AbstractFileSystem, compression: Optional[str], chunk_size: int) -> Iterator[bytes]:
+    """Yield the decompressed content of `url` in chunks."""
+    with fs.open(url, "rb", compression=compression) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _iter_xz_blocks(url: str, fs: fsspec.AbstractFileSystem, blocks: List[XzBlock], workers: int) -> Iterator[bytes]:
+    """Yield the decompressed blocks of an xz file in order, decompressing up to `workers` blocks concurrently."""
+    yield from IterableSource(blocks).async_map(partial(_read_xz_block, url, fs), buffer=workers, max_workers=workers)
+
+
+class _BackgroundReader(io.RawIOBase):
+    """Raw stream over chunks that are produced by a background thread into a bounded queue."""
+
+    def __init__(self, chunks: Iterator[bytes], max_chunks: int) -> None:
+        super().__init__()
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._stop = threading.Event()
+        self._chunk = memoryview(b"")
+        self._done = False
+        self._thread = threading.Thread(target=self._produce, args=(chunks,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item: object) -> bool:
+        """Put an item into the queue, returns False if the reader was closed while waiting."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, chunks: Iterator[bytes]) -> None:
+        try:
+            for chunk in chunks:
+                if not self._put(chunk):
+                    return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+        finally:
+            chunks.close()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: bytearray) -> int:
+        while not self._chunk:
+            if self._done:
+                return 0
+            item = self._queue.get()
+            if item is None or isinstance(item, Exception):
+                self._done = True
+                if item is not None:
+                    raise item
+                return 0
+            self._chunk = memoryview(item)
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self) -> None:
+        self._stop.set()
+        super().close()
+
+
+def open_decompressed(
+    url: str,
+    compression: Optional[str] = "infer",
+    workers: int = 1,
+    fs: Optional[fsspec.AbstractFileSystem] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    buffer: int = 8,
+) -> BinaryIO:
+    """Open a (compressed) file for reading its decompressed content, which is decompressed ahead of the reader.
+
+    Example::
+
+        with open_decompressed("https://data.statmt.org/cc-100/af.txt.xz", workers=4) as f:
+            for line in f:
+                ...
+
+    Args:
+        url (str): Url of the file.
+        compression (str, optional): Compression of the file, as in :py:func:`fsspec.open`. "infer" guesses it from the
+            file extension. Defaults to "infer".
+        workers (int, optional): Number of threads that decompress the file. With 0, the file is decompressed in the
+            calling thread while reading, like with :py:func:`fsspec.open`. With 1, a background thread decompresses
+            the file. With more, the blocks of xz files are decompressed concurrently, other files use a single thread.
+            Defaults to 1.
+        fs (fsspec.AbstractFileSystem, optional): Filesystem to read `url` with. Defaults to
+            :py:func:`~squirrel_datasets_core.io.get_filesystem`.
+        chunk_size (int, optional): Number of decompressed bytes to read at once from files that are decompressed by a
+            single thread. Defaults to 1MB.
+        buffer (int, optional): Maximum number of decompressed chunks or blocks that are kept ahead of the reader.
+            Defaults to 8.
+
+    Returns:
+        BinaryIO: Buffered binary stream of the decompressed content, to be used as a context manager.
+    """
+    url = str(url)
+    fs = get_filesystem(url) if fs is None else fs
+    if compression == "infer":
+        compression = infer_compression(url)
+    if workers == 0:
+        return fs.open(url, "rb", compression=compression)
+
+    blocks = xz_blocks(url, fs) if compression == "xz" and workers > 1 else []
+    if len(blocks) > 1:
+        chunks = _iter_xz_blocks(url, fs, blocks, workers)
+    else:
+        chunks = _iter_file(url, fs, compression, chunk_size)
+    return _open_background(chunks, buffer, chunk_size)
+
+
+def _open_background(chunks: Iterator[bytes], buffer: int = 8, chunk_size: int = DEFAULT_CHUNK_SIZE) -> BinaryIO:
+    """Buffered binary stream over chunks that are produced by a background thread."""
+    return io.BufferedReader(_BackgroundReader(chunks, max_chunks=buffer), buffer_size=chunk_size)
@@ -0,0 +1,196 @@
+"""Decoding a stream of encoded images in a pool of processes.
+
+Decoding is CPU-bound and holds the GIL for a good part of the time, so decoding in the threads that also download the
+images slows down both. :py:func:`decode_images` decodes in separate processes instead. The encoded images are sent to
+the workers, which are small compared to decoded images. The decoded images are returned through a shared memory arena
+with one slot per image in flight, which saves pickling and piping them. The main process copies each image out of its
+slot once, after which the slot is reused. Images that do not fit into a slot are returned by pickling.
+
+The shared memory is allocated in `/dev/shm`, which is small in some containers (e.g. 64MB by default in docker). The
+arena takes `buffer * slot_size` bytes, 16MB with the defaults. Its pages are reserved when it is created, so that a
+full `/dev/shm` is detected upfront instead of crashing the workers. If the arena cannot be allocated, all images are
+returned by pickling.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+from squirrel.iterstream import IterableSource
+
+from squirrel_datasets_core.io.io import decode_image
+
+if TYPE_CHECKING:
+    from squirrel.iterstream import Composable
+
+__all__ = ["decode_images", "resize_image"]
+
+logger = logging.getLogger(__name__)
+
+# slot size if the size of the images is not known, e.g. a 512x680 RGB image, larger images are returned by pickling
+DEFAULT_SLOT_SIZE = 2**20
+
+# shared memory arenas attached by the current worker process, by name
+_ARENAS: Dict[str, SharedMemory] = {}
+
+
+def resize_image(img: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Resize an image to (height, width) with bilinear interpolation, images of that size are returned as they are."""
+    if img.shape[:2] == tuple(size):
+        return img
+    return np.asarray(Image.fromarray(img).resize((size[1], size[0]), Image.BILINEAR))
+
+
+def _decode(data: bytes, decoder: Optional[str], size: Optional[Tuple[int, int]]) -> np.ndarray:
+    """Decode an image, large JPEGs are reduced in the DCT domain while decoding before they are resized to `size`."""
+    img = decode_image(data, decoder=decoder, target_size=size)
+    return img if size is None else resize_image(img, size)
+
+
+def _decode_into_slot(
+    data: bytes,
+    decoder: Optional[str],
+    size: Optional[Tuple[int, int]],
+    arena: Optional[str],
+    offset: int,
+    slot_size: int,
+) -> Union[np.ndarray, Tuple[Tuple[int, ...], str]]:
+    """Decode an image in a worker process and write it into a slot of the shared memory arena.
+
+    Returns:
+        Union[np.ndarray, Tuple[Tuple[int, ...], str]]: Shape and dtype of the image in the slot, or the image if it
+        does not fit into the slot or there is no arena.
+    """
+    img = _decode(data, decoder, size)
+    if arena is None or img.nbytes > slot_size:
+        return img
+    if arena not in _ARENAS:
+        _ARENAS[arena] = SharedMemory(arena)
+    np.ndarray(img.shape, img.dtype, buffer=_ARENAS[arena].buf, offset=offset)[...] = img
+    return img.shape, img.dtype.str
+
+
+def _create_arena(size: int) -> Optional[SharedMemory]:
+    """Allocate a shared memory arena of `size` bytes, None if there is not enough shared memory."""
+    try:
+        arena = SharedMemory(create=True, size=size)
+    except OSError as e:
+        logger.warning("Decoded images are pickled, the shared memory arena cannot be created: %s", e)
+        return None
+    if hasattr(os, "posix_fallocate"):
+        # the pages are otherwise allocated when they are first written, which kills the writer with SIGBUS if
+        # /dev/shm is full
+        try:
+            os.posix_fallocate(arena._fd, 0, size)
+        except OSError as e:
+            arena.close()
+            arena.unlink()
+            logger.warning("Decoded images are pickled, %d bytes of shared memory are not available: %s", size, e)
+            return None
+    return arena
+
+
+def _decode_images(
+    items: Iterable,
+    get_data: Callable[[Any], Optional[bytes]],
+    workers: int,
+    buffer: int,
+    size: Optional[Tuple[int, int]],
+    decoder: Optional[str],
+    slot_size: int,
+) -> Iterator[Tuple[Any, Optional[np.ndarray], Optional[Exception]]]:
+    arena = _create_arena(buffer * slot_size)
+    arena_name = None if arena is None else arena.name
+    # spawned workers do not inherit the locks held by the threads of this process, e.g. of a download stage
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    free = list(range(buffer))
+    pending: Deque[Tuple[Any, Optional[int], Optional[Future]]] = deque()
+
+    def result(item: Any, slot: Optional[int], future: Optional[Future]) -> Tuple[Any, Optional[np.ndarray], Any]:
+        if future is None:
+            return item, None, None
+        try:
+            out = future.result()
+        except Exception as e:
+            return item, None, e
+        finally:
+            free.append(slot)
+        if isinstance(out, np.ndarray):
+            return item, out, None
+        shape, dtype = out
+        # copy the image out of its slot, so that the slot can be reused
+        return item, np.ndarray(shape, dtype, buffer=arena.buf, offset=slot * slot_size).copy(), None
+
+    try:
+        for item in items:
+            data = get_data(item)
+            if data is None:
+                pending.append((item, None, None))
+            else:
+                slot = free.pop()
+                args = (data, decoder, size, arena_name, slot * slot_size, slot_size)
+                pending.append((item, slot, pool.submit(_decode_into_slot, *args)))
+            # keep at most `buffer` images in flight, which is also the number of slots
+            while pending and (not free or pending[0][2] is None or pending[0][2].done()):
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
+    finally:
+        for _, _, future in pending:
+            if future is not None:
+                future.cancel()
+        pool.shutdown(wait=True)
+        if arena is not None:
+            arena.close()
+            arena.unlink()
+
+
+def decode_images(
+    items: Iterable,
+    get_data: Optional[Callable[[Any], Optional[bytes]]] = None,
+    workers: Optional[int] = None,
+    buffer: int = 16,
+    size: Optional[Tuple[int, int]] = None,
+    decoder: Optional[str] = None,
+    slot_size: Optional[int] = None,
+) -> Composable:
+    """Decode a stream of encoded images in a pool of processes.
+
+    Up to `buffer` images are decoded at a time. The stream is pulled only when a slot is free, so that a slow consumer
+    slows down the stage before, e.g. a download stage. The order of the stream is kept::
+
+        it = decode_images(fetch_urls(urls), get_data=lambda x: x[1], workers=4, size=(224, 224))
+
+    Args:
+        items (Iterable): Stream of encoded images, or of items that contain encoded images, see `get_data`.
+        get_data (Callable[[Any], Optional[bytes]], optional): Function that returns the encoded image of an item.
+            Items for which it returns None are passed through without decoding. Defaults to None, i.e. the items are
+            encoded images.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        buffer (int, optional): Number of images in flight, i.e. the number of slots of the shared memory arena.
+            Defaults to 16.
+        size (Tuple[int, int], optional): (height, width) that all images are resized to. Defaults to None, i.e. the
+            images keep their size.
+        decoder (str, optional): Name of the decoder to use, see :py:func:`~squirrel_datasets_core.io.load_image`.
+            Defaults to None.
+        slot_size (int, optional): Size of a slot of the shared memory arena in bytes. Defaults to the size of an RGBA
+            image of `size`, or 1MB if no size is given.
+
+    Returns:
+        Composable: Stream of (item, image, error) tuples. `image` is None if decoding failed with `error` or if
+        there was no encoded image.
+    """
+    if buffer < 1:
+        raise ValueError(f"buffer must be positive, got {buffer}")
+    if slot_size is None:
+        slot_size = DEFAULT_SLOT_SIZE if size is None else size[0] * size[1] * 4
+    workers = workers or multiprocessing.cpu_count()
+    get_data = get_data or (lambda x: x)
+    return IterableSource(lambda: _decode_images(items, get_data, workers, buffer, size, decoder, slot_size))
@@ -0,0 +1,299 @@
+"""Image decoder backends used by :py:func:`squirrel_datasets_core.io.load_image`.
+
+PIL is always available and can decode any image format. Faster backends are used if they are installed:
+
+- `simplejpeg <https://gitlab.com/jfolz/simplejpeg>`_ and `PyTurboJPEG <https://github.com/lilohuang/PyTurboJPEG>`_
+  decode JPEG images with libjpeg-turbo.
+- `OpenCV <https://pypi.org/project/opencv-python-headless/>`_ decodes PNG images.
+
+All backends return the same arrays as `np.array(Image.open(fh))`. Images that a backend cannot decode identically
+(e.g. CMYK JPEGs or palette PNGs) are decoded with PIL.
+
+JPEG images can be decoded at reduced size by passing a `target_size`. The image is then scaled down by up to 1/8 in the
+DCT domain, which is much faster than decoding at full size, while the decoded image stays at least as large as
+`target_size`. The available scales depend on the backend, e.g. PIL supports 1/2, 1/4 and 1/8.
+
+Images can be decoded into preallocated memory by passing `out`, either an array or a
+:py:class:`~squirrel_datasets_core.io.buffers.BufferPool`. simplejpeg decodes directly into `out`, the other backends
+copy their output into it once.
+"""
+from __future__ import annotations
+
+import functools
+import io
+import os
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from squirrel_datasets_core.io.buffers import BufferPool, allocate_output
+
+__all__ = [
+    "DECODER_ENV_VAR",
+    "DECODERS",
+    "ImageDecoder",
+    "available_decoders",
+    "get_decoder",
+    "image_format",
+    "register_decoder",
+]
+
+DECODER_ENV_VAR = "SQUIRREL_IMAGE_DECODER"
+
+_EXTENSION_TO_FORMAT = {".jpg": "jpeg", ".jpeg": "jpeg", ".jpe": "jpeg", ".jfif": "jpeg", ".png": "png"}
+
+# decoders that are tried in order when no decoder is selected, PIL is used if none of them is available
+_PREFERENCE = {"jpeg": ("simplejpeg", "turbojpeg"), "png": ("opencv",)}
+
+
+def image_format(path: str) -> Optional[str]:
+    """Guess the image format from the file extension. Returns None if the format is unknown."""
+    return _EXTENSION_TO_FORMAT.get(os.path.splitext(path)[1].lower())
+
+
+Output = Optional[Union[np.ndarray, BufferPool]]
+
+
+def _to_output(arr: np.ndarray, out: Output) -> np.ndarray:
+    """Copy a decoded image into `out` if given."""
+    if out is None:
+        return arr
+    buf = allocate_output(out, arr.shape, arr.dtype)
+    np.copyto(buf, arr)
+    return buf
+
+
+def _decode_pil(fh: BinaryIO, target_size: Optional[Tuple[int, int]] = None, out: Output = None) -> np.ndarray:
+    """Decode an image with PIL. JPEGs are decoded in draft mode if `target_size` is given."""
+    img = Image.open(fh)
+    if target_size is not None:
+        img.draft(img.mode, (target_size[1], target_size[0]))
+    if out is None:
+        return np.array(img)
+    # PIL cannot decode into external memory, but np.asarray wraps its exported pixels without another copy
+    return _to_output(np.asarray(img), out)
+
+
+class ImageDecoder:
+    """Base class of image decoders.
+
+    Subclasses set `name` and `formats` and implement :py:meth:`_load_backend` and :py:meth:`decode`.
+    """
+
+    name: str = None
+    # formats the decoder can handle, None means any format
+    formats: Optional[Tuple[str, ...]] = None
+
+    def __init__(self) -> None:
+        """Initialize the decoder. The backend is loaded lazily."""
+        self._backend = None
+        self._available = None
+
+    def _load_backend(self) -> Any:
+        """Import the backend. Raises an exception if it is not available."""
+        return None
+
+    @property
+    def backend(self) -> Any:
+        """The backend module or object, loaded on first access."""
+        if self._backend is None:
+            self._backend = self._load_backend()
+        return self._backend
+
+    def is_available(self) -> bool:
+        """Whether the backend is installed and can be loaded."""
+        if self._available is None:
+            try:
+                _ = self.backend
+                self._available = True
+            except (ImportError, OSError, RuntimeError):
+                self._available = False
+        return self._available
+
+    def supports(self, fmt: Optional[str]) -> bool:
+        """Whether the decoder can decode images of format `fmt`."""
+        return self.formats is None or fmt in self.formats
+
+    def decode(self, fh: BinaryIO, target_size: Optional[Tuple[int, int]] = None, out: Output = None) -> np.ndarray:
+        """Decode the image in the file object `fh` into a numpy array.
+
+        Args:
+            fh (BinaryIO): File object to read the encoded image from.
+            target_size (Tuple[int, int], optional): Minimum (height, width) of the decoded image. If given, JPEGs are
+                decoded at the smallest scale supported by the backend that is at least as large. Defaults to None.
+            out (Union[np.ndarray, BufferPool], optional): Array to decode into, it must match the shape and dtype of
+                the decoded image, or pool to take the array from. If not provided, a new array is allocated. Defaults
+                to None.
+
+        Returns:
+            np.ndarray: Decoded image.
+        """
+        raise NotImplementedError
+
+
+class PILDecoder(ImageDecoder):
+    name = "pil"
+
+    def decode(self, fh: BinaryIO, target_size: Optional[Tuple[int, int]] = None, out: Output = None) -> np.ndarray:
+        """Decode an image of any format supported by PIL."""
+        return _decode_pil(fh, target_size, out)
+
+
+class SimpleJpegDecoder(ImageDecoder):
+    name = "simplejpeg"
+    formats = ("jpeg",)
+
+    def _load_backend(self) -> Any:
+        """Import simplejpeg."""
+        import simplejpeg
+
+        return simplejpeg
+
+    def decode(self, fh: BinaryIO, target_size: Optional[Tuple[int, int]] = None, out: Output = None) -> np.ndarray:
+        """Decode a grayscale or color JPEG with simplejpeg, directly into `out` if given."""
+        data = fh.read()
+        min_height, min_width = target_size if target_size is not None else (0, 0)
+        try:
+            height, width, colorspace, _ = self.backend.decode_jpeg_header(data, min_height, min_width)
+        except ValueError:
+            colorspace = None
+        if colorspace == "Gray":
+            shape, colorspace = (height, width), "GRAY"
+        elif colorspace in ("YCbCr", "RGB"):
+            shape, colorspace = (height, width, 3), "RGB"
+        else:
+            return _decode_pil(io.BytesIO(data), target_size, out)
+
+        buf = None if out is None else allocate_output(out, shape)
+        img = self.backend.decode_jpeg(
+            data, colorspace=colorspace, min_height=min_height, min_width=min_width, buffer=buf
+        )
+        return img.reshape(shape) if buf is None else buf
+
+
+class TurboJpegDecoder(ImageDecoder):
+    name = "turbojpeg"
+    formats = ("jpeg",)
+
+    def _load_backend(self) -> Any:
+        """Load libturbojpeg through PyTurboJPEG."""
+        import turbojpeg
+
+        return turbojpeg.TurboJPEG()
+
+    @staticmethod
+    def _scaling_factor(height: int, width: int, target_size: Optional[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+        """Smallest scaling factor of 1/8, 1/4 and 1/2 that keeps the image at least as large as `target_size`."""
+        if target_size is None:
+            return None
+        for denom in (8, 4, 2):
+            if -(-height // denom) >= target_size[0] and -(-width // denom) >= target_size[1]:
+                return 1, denom
+        return None
+
+    def decode(self, fh: BinaryIO, target_size: Optional[Tuple[int, int]] = None, out: Output = None) -> np.ndarray:
+        """Decode a grayscale or color JPEG with libturbojpeg."""
+        import turbojpeg
+
+        data = fh.read()
+        try:
+            width, height, subsampling, colorspace = self.backend.decode_header(data)
+        except OSError:
+            # not a JPEG, e.g. a PNG with a .jpg extension
+            return _decode_pil(io.BytesIO(data), target_size, out)
+        scaling_factor = self._scaling_factor(height, width, target_size)
+        if colorspace == turbojpeg.TJCS_GRAY or subsampling == turbojpeg.TJSAMP_GRAY:
+            img = self.backend.decode(data, pixel_format=turbojpeg.TJPF_GRAY, scaling_factor=scaling_factor)[..., 0]
+        elif colorspace in (turbojpeg.TJCS_YCbCr, turbojpeg.TJCS_RGB):
+            img = self.backend.decode(data, pixel_format=turbojpeg.TJPF_RGB, scaling_factor=scaling_factor)
+        else:
+            return _decode_pil(io.BytesIO(data), target_size, out)
+        return _to_output(img, out)
+
+
+class OpenCVDecoder(ImageDecoder):
+    name = "opencv"
+    formats = ("png",)
+
+    def _load_backend(self) -> Any:
+        """Import OpenCV."""
+        import cv2
+
+        return cv2
+
+    def decode(self, fh: BinaryIO, target_size: Optional[Tuple[int, int]] = None, out: Output = None) -> np.ndarray:
+        """Decode an 8-bit grayscale, RGB or RGBA PNG with OpenCV. PNGs are always decoded at full size."""
+        cv2 = self.backend
+        data = fh.read()
+        # IHDR: bit depth at byte 24 and color type at byte 25. Other bit depths, palette and gray+alpha images as well
+        # as images with transparency chunk are not decoded identically to PIL.
+        header = data[12:26]
+        if header[:4] != b"IHDR" or header[12:13] != b"\x08" or header[13:14] not in (b"\x00", b"\x02", b"\x06"):
+            return _decode_pil(io.BytesIO(data), out=out)
+        if b"tRNS" in data:
+            return _decode_pil(io.BytesIO(data), out=out)
+
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            return _decode_pil(io.BytesIO(data), out=out)
+        if header[13] == 0:
+            return _to_output(img, out)
+        # the channel conversion writes directly into the output buffer
+        dst = None if out is None else allocate_output(out, img.shape, img.dtype)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB if header[13] == 2 else cv2.COLOR_BGRA2RGBA, dst=dst)
+
+
+DECODERS: Dict[str, ImageDecoder] = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _auto_decoder(fmt: Optional[str]) -> ImageDecoder:
+    """Fastest available decoder for `fmt`."""
+    for name in _PREFERENCE.get(fmt, ()):
+        if name in DECODERS and DECODERS[name].is_available():
+            return DECODERS[name]
+    return DECODERS["pil"]
+
+
+def register_decoder(decoder: ImageDecoder) -> None:
+    """Register a decoder so that it can be selected by its name."""
+    DECODERS[decoder.name] = decoder
+    _auto_decoder.cache_clear()
+
+
+for _decoder in (PILDecoder(), SimpleJpegDecoder(), TurboJpegDecoder(), OpenCVDecoder()):
+    register_decoder(_decoder)
+
+
+def available_decoders() -> List[str]:
+    """Names of the registered decoders whose backends are installed."""
+    return [name for name, decoder in DECODERS.items() if decoder.is_available()]
+
+
+def get_decoder(fmt: Optional[str], name: Optional[str] = None) -> ImageDecoder:
+    """Select the decoder for an image format.
+
+    Args:
+        fmt (str, optional): Image format as returned by :py:func:`image_format`.
+        name (str, optional): Name of the decoder to use. If not provided, the environment variable
+            `SQUIRREL_IMAGE_DECODER` is used. If neither is set or set to "auto", the fastest available decoder for
+            `fmt` is used. A selected decoder that does not support `fmt` is replaced by the automatic choice, so that
+            e.g. "simplejpeg" can be selected for datasets that contain PNG labels.
+
+    Returns:
+        ImageDecoder: The decoder.
+    """
+    if name is None:
+        name = os.environ.get(DECODER_ENV_VAR, "auto")
+    if name == "auto":
+        return _auto_decoder(fmt)
+
+    if name not in DECODERS:
+        raise ValueError(f"Unknown image decoder {name}, choose one of {list(DECODERS)} or 'auto'.")
+    decoder = DECODERS[name]
+    if not decoder.is_available():
+        raise ValueError(f"Image decoder {name} is not installed.")
+    if not decoder.supports(fmt):
+        return _auto_decoder(fmt)
+    return decoder
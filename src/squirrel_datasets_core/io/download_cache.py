@@ -0,0 +1,234 @@
+"""Persistent cache of downloaded urls and of urls that failed permanently.
+
+Datasets like Conceptual Captions are downloaded from the origin servers at every epoch, and many of their urls are
+dead. :py:class:`DownloadCache` stores the content of downloaded urls on a local disk and remembers the urls that
+failed permanently (e.g. with 404 or with an undecodable image), so that later epochs read locally and skip dead urls
+without a request.
+
+The content of a url is stored in a file named after the hash of the url, below `root/data`. Files are written to a
+temporary name and renamed, so that readers never see partial files. Every read updates the modification time of the
+file, and the least recently used files are deleted once the cache grows beyond `max_size` bytes.
+
+Failed urls are appended as 64 bit hashes to the file `root/failed.u64`. Every process keeps them in a sorted array
+and reads the hashes appended by other processes every `refresh_interval` seconds. A million failed urls take 8MB.
+
+All state is on disk, so the cache can be shared by the processes of a node by passing them the same `root`. The size
+of the cache is kept in the file `root/size`. Processes add the bytes they wrote to it in steps of up to 64MB, and the
+process that finds the cache too large scans it and evicts files. Both are serialized with a lock file.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover, only on Windows
+    fcntl = None
+
+__all__ = ["DOWNLOAD_CACHE_ENV_VAR", "DownloadCache", "NEGATIVE_STATUSES"]
+
+DOWNLOAD_CACHE_ENV_VAR = "SQUIRREL_DOWNLOAD_CACHE"
+
+# http status codes of urls that are not expected to come back
+NEGATIVE_STATUSES = frozenset({404, 410})
+
+# fraction of `max_size` that is kept when the cache is evicted, so that eviction does not run at every write
+_LOW_WATER = 0.9
+# bytes that a process writes before it adds them to the shared size of the cache, at most 1% of `max_size`
+_FLUSH_SIZE = 64 * 2**20
+_TMP_TIMEOUT = 3600
+
+
+def _url_hash(url: str) -> bytes:
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+
+
+class DownloadCache:
+    """Content-addressed cache of downloaded urls on a local disk with a negative cache of failed urls."""
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        max_size: int = 100 * 2**30,
+        negative_statuses: Iterable[int] = NEGATIVE_STATUSES,
+        refresh_interval: float = 10.0,
+    ) -> None:
+        """Open the cache in `root`, create it if it does not exist.
+
+        Args:
+            root (Union[str, Path]): Local directory of the cache.
+            max_size (int, optional): Maximum size of the cached content in bytes. Defaults to 100GiB.
+            negative_statuses (Iterable[int], optional): Http status codes of downloads that are added to the negative
+                cache by :py:func:`~squirrel_datasets_core.io.fetch_urls`. Defaults to :py:data:`NEGATIVE_STATUSES`.
+            refresh_interval (float, optional): Seconds after which failed urls added by other processes are read.
+                Defaults to 10.0.
+        """
+        self.root = Path(root).expanduser()
+        self.max_size = max_size
+        self.negative_statuses = frozenset(negative_statuses)
+        self.refresh_interval = refresh_interval
+        (self.root / "data").mkdir(parents=True, exist_ok=True)
+        self._failed_path = self.root / "failed.u64"
+        self._failed_path.touch()
+        self._lock = threading.Lock()
+        # sorted hashes of failed urls read from disk, hashes added since the last refresh and the bytes read so far
+        self._failed = np.empty(0, dtype=np.uint64)
+        self._recent = set()
+        self._offset = 0
+        self._refreshed = -float("inf")
+        # bytes written by this process that are not yet added to the shared size of the cache
+        self._size_path = self.root / "size"
+        self._flush_size = min(_FLUSH_SIZE, max_size // 100)
+        self._written = 0
+
+    def __getstate__(self) -> dict:
+        """Pickle the configuration only, the negative cache is read again from disk."""
+        return {k: getattr(self, k) for k in ("root", "max_size", "negative_statuses", "refresh_interval")}
+
+    def __setstate__(self, state: dict) -> None:
+        """Open the cache in another process."""
+        self.__init__(**state)
+
+    def path(self, url: str) -> Path:
+        """Path of the cached content of `url`."""
+        key = _url_hash(url).hex()
+        return self.root / "data" / key[:2] / key
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Get the cached content of `url`, None if it is not cached."""
+        path = self.path(url)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, url: str, data: bytes) -> None:
+        """Store the content of `url`, evict least recently used content if the cache is full."""
+        path = self.path(url)
+        path.parent.mkdir(exist_ok=True)
+        try:
+            # the content of a url that is cached already is replaced, so only the difference in size is added
+            old_size = path.stat().st_size
+        except FileNotFoundError:
+            old_size = 0
+        tmp = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._written += len(data) - old_size
+            written = self._written if self._written >= self._flush_size else 0
+            self._written -= written
+        if written:
+            self._add_size(written)
+
+    def _add_size(self, nbytes: int) -> None:
+        """Add `nbytes` to the size of the cache that is shared by all processes, evict if it is too large."""
+        with self._locked():
+            try:
+                size = int(self._size_path.read_text()) + nbytes
+            except (FileNotFoundError, ValueError):
+                size = self._evict()
+            if size > self.max_size:
+                size = self._evict()
+            self._size_path.write_text(str(size))
+
+    def evict(self) -> int:
+        """Delete the least recently used content until the cache is below its maximum size.
+
+        Returns:
+            int: Size of the cache in bytes after eviction.
+        """
+        with self._locked():
+            size = self._evict()
+            self._size_path.write_text(str(size))
+        return size
+
+    def _evict(self) -> int:
+        """Scan the cache and delete the least recently used files, the lock of the cache must be held."""
+        entries = []
+        now = time.time()
+        for subdir in os.scandir(self.root / "data"):
+            for entry in os.scandir(subdir.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(".tmp") and now - stat.st_mtime < _TMP_TIMEOUT:
+                    # being written, temporary files of crashed writers are evicted after a while
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(e[1] for e in entries)
+        if size > self.max_size:
+            entries.sort()
+            for _, nbytes, path in entries:
+                if size <= _LOW_WATER * self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= nbytes
+        return size
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the lock of the cache directory, which serializes size updates and eviction between processes."""
+        with open(self.root / ".lock", "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def add_failed(self, url: str) -> None:
+        """Add `url` to the negative cache and drop its content."""
+        key = int.from_bytes(_url_hash(url)[:8], "little")
+        with self._lock:
+            fd = os.open(self._failed_path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, np.uint64(key).tobytes())
+            finally:
+                os.close(fd)
+            self._recent.add(key)
+        try:
+            os.remove(self.path(url))
+        except FileNotFoundError:
+            pass
+
+    def is_failed(self, url: str) -> bool:
+        """Whether `url` is in the negative cache."""
+        if time.monotonic() - self._refreshed > self.refresh_interval:
+            self.refresh()
+        key = int.from_bytes(_url_hash(url)[:8], "little")
+        if key in self._recent:
+            return True
+        i = np.searchsorted(self._failed, np.uint64(key))
+        return bool(i < len(self._failed) and self._failed[i] == key)
+
+    def refresh(self) -> None:
+        """Read the failed urls that were added since the last refresh, also by other processes."""
+        with self._lock:
+            with open(self._failed_path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            data = data[: len(data) // 8 * 8]
+            self._offset += len(data)
+            new = np.sort(np.frombuffer(data, dtype=np.uint64))
+            if len(new):
+                self._failed = np.insert(self._failed, np.searchsorted(self._failed, new), new)
+            # the hashes added by this process are on disk before they are added to `_recent`
+            self._recent = set()
+            self._refreshed = time.monotonic()
@@ -0,0 +1,93 @@
+"""Process-local cache of fsspec filesystems used by :py:func:`squirrel_datasets_core.io.load_image`.
+
+Opening every file with :py:func:`fsspec.open` resolves the protocol and looks up the filesystem instance for each call.
+For remote stores the filesystem also owns the HTTP session, so reusing a single instance keeps connections alive
+between files::
+
+    fs = get_filesystem("gs://bucket/imagenet")
+    for url in urls:
+        img = load_image(url, fs=fs)
+
+Filesystems are cached by protocol and storage options. Every (forked) worker process gets its own instances, because
+HTTP sessions and event loops cannot be shared between processes.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Dict, Tuple
+
+import fsspec
+from fsspec.core import split_protocol
+
+__all__ = ["DEFAULT_MAX_CONNECTIONS", "clear_filesystem_cache", "get_filesystem"]
+
+# maximum number of open connections per http(s) filesystem
+DEFAULT_MAX_CONNECTIONS = 64
+
+# maximum number of cached filesystems, the least recently used one is dropped first
+_MAX_CACHED = 32
+
+_CACHE: "OrderedDict[Tuple[str, str], fsspec.AbstractFileSystem]" = OrderedDict()
+_CACHE_PID = None
+_LOCK = threading.Lock()
+
+
+async def _get_bounded_client(max_connections: int, **client_kwargs) -> Any:
+    """Create the aiohttp session of an http filesystem with a bounded connection pool."""
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    return aiohttp.ClientSession(connector=connector, **client_kwargs)
+
+
+def _default_options(protocol: str, max_connections: int) -> Dict[str, Any]:
+    """Storage options that bound the connection pool of the filesystem, if the protocol supports it."""
+    if protocol in ("http", "https"):
+        return {"get_client": partial(_get_bounded_client, max_connections)}
+    return {}
+
+
+def get_filesystem(
+    url: str, max_connections: int = DEFAULT_MAX_CONNECTIONS, **storage_options
+) -> fsspec.AbstractFileSystem:
+    """Get a cached filesystem for the protocol of `url`.
+
+    Filesystems are created once per process, protocol and storage options and are shared between threads.
+
+    Args:
+        url (str): Url or path, only the protocol is used. Paths without protocol use the local filesystem.
+        max_connections (int, optional): Maximum number of open connections of an http(s) filesystem. Other
+            filesystems keep using the connection pool of their session. Defaults to DEFAULT_MAX_CONNECTIONS.
+        **storage_options: Keyword arguments passed to :py:func:`fsspec.filesystem`.
+
+    Returns:
+        fsspec.AbstractFileSystem: The filesystem.
+    """
+    global _CACHE_PID
+
+    protocol = split_protocol(url)[0] or "file"
+    key = (protocol, json.dumps({"max_connections": max_connections, **storage_options}, sort_keys=True, default=repr))
+    with _LOCK:
+        if _CACHE_PID != os.getpid():
+            _CACHE.clear()
+            _CACHE_PID = os.getpid()
+        fs = _CACHE.get(key)
+        if fs is not None:
+            _CACHE.move_to_end(key)
+            return fs
+
+        fs = fsspec.filesystem(protocol, **{**_default_options(protocol, max_connections), **storage_options})
+        _CACHE[key] = fs
+        if len(_CACHE) > _MAX_CACHED:
+            _CACHE.popitem(last=False)
+        return fs
+
+
+def clear_filesystem_cache() -> None:
+    """Drop all cached filesystems of the current process."""
+    with _LOCK:
+        _CACHE.clear()
@@ -0,0 +1,264 @@
+"""Concurrent download of many small files over http with asyncio.
+
+Datasets like Conceptual Captions reference millions of images on thousands of hosts. Fetching them with blocking
+requests on a thread pool caps the throughput at the number of threads, and each slow host stalls a thread.
+:py:func:`fetch_urls` instead runs one `aiohttp <https://docs.aiohttp.org>`_ session on an event loop in a background
+thread, which keeps thousands of requests in flight with a single thread. The session
+
+- limits the number of connections in total and per host, so that single hosts are not flooded,
+- caches DNS lookups and reuses keep-alive connections to the same host,
+- retries connection errors, timeouts and transient http errors with exponential backoff.
+
+aiohttp is installed with the `gcp` extra of squirrel-core. Every connection needs a file descriptor, the soft limit
+of open files (`ulimit -n`) may need to be raised for a high `concurrency`.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from squirrel.iterstream import IterableSource
+
+if TYPE_CHECKING:
+    import aiohttp
+    from squirrel.iterstream import Composable
+
+    from squirrel_datasets_core.io.download_cache import DownloadCache
+
+logger = logging.getLogger(__name__)
+
+# http status codes that are worth retrying, all other error codes are final
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+_DONE = object()
+
+
+async def _semaphore(value: int) -> asyncio.Semaphore:
+    return asyncio.Semaphore(value)
+
+
+class _Fetcher:
+    """Fetches items on an event loop in a background thread and hands over the results through a queue."""
+
+    def __init__(
+        self,
+        get_url: Callable[[Any], str],
+        concurrency: int,
+        limit_per_host: int,
+        buffer: int,
+        timeout: Optional[float],
+        connect_timeout: Optional[float],
+        retries: int,
+        backoff: float,
+        retry_statuses: Iterable[int],
+        dns_cache_ttl: Optional[int],
+        keepalive_timeout: float,
+        headers: Optional[Dict[str, str]],
+        cache: Optional[DownloadCache],
+    ) -> None:
+        self.get_url = get_url
+        self.concurrency = concurrency
+        self.limit_per_host = limit_per_host
+        self.buffer = buffer
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.headers = headers
+        self.cache = cache
+
+    async def _get(self, session: aiohttp.ClientSession, url: str) -> bytes:
+        """Get the content of `url`, retry transient errors."""
+        import aiohttp
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url) as resp:
+                    resp.raise_for_status()
+                    return await resp.read()
+            except aiohttp.ClientResponseError as e:
+                if e.status not in self.retry_statuses or attempt == self.retries:
+                    raise
+                logger.debug("Retrying %s after error %s", url, e)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                logger.debug("Retrying %s after error %r", url, e)
+            # exponential backoff with jitter, so that retries to the same host do not arrive at once
+            await asyncio.sleep(self.backoff * 2**attempt * random.uniform(0.5, 1.5))
+
+    async def _fetch(self, session: aiohttp.ClientSession, item: Any, results: queue.Queue) -> None:
+        try:
+            url = self.get_url(item)
+            if self.cache is None:
+                content = await self._get(session, url)
+            else:
+                content = await self._get_cached(session, url)
+            results.put((item, content, None))
+        except Exception as e:
+            results.put((item, None, e))
+
+    async def _get_cached(self, session: aiohttp.ClientSession, url: str) -> bytes:
+        """Get the content of `url` from the cache, or download and cache it."""
+        import aiohttp
+
+        # reading and writing local files is done in threads, so that it does not block the downloads
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(None, self.cache.get, url)
+        if content is not None:
+            return content
+        try:
+            content = await self._get(session, url)
+        except aiohttp.ClientResponseError as e:
+            if e.status in self.cache.negative_statuses:
+                await loop.run_in_executor(None, self.cache.add_failed, url)
+            raise
+        await loop.run_in_executor(None, self.cache.put, url, content)
+        return content
+
+    async def _run(self, items: Iterator, results: queue.Queue, slots: asyncio.Semaphore) -> None:
+        """Fetch all items, the semaphore `slots` bounds the number of items in flight and not yet consumed."""
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=self.dns_cache_ttl != 0,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        # no total timeout, it would include the time waiting for a free connection to a busy host
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.timeout)
+        tasks: Set[asyncio.Future] = set()
+        next_items: Deque = deque()
+        # the items may come from a blocking iterator, e.g. a streamed index file, which must not block the loop
+        reader = ThreadPoolExecutor(1, thread_name_prefix="squirrel_fetch_urls_items")
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers) as session:
+                while True:
+                    if not next_items:
+                        next_items.extend(await loop.run_in_executor(reader, list, islice(items, self.concurrency)))
+                        if not next_items:
+                            break
+                    await slots.acquire()
+                    task = asyncio.ensure_future(self._fetch(session, next_items.popleft(), results))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.gather(*tasks)
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            results.put(e)
+        else:
+            results.put(_DONE)
+        finally:
+            reader.shutdown(wait=False)
+
+    def __call__(self, items: Iterable) -> Iterator[Tuple[Any, Optional[bytes], Optional[Exception]]]:
+        """Yield (item, content, error) tuples in the order in which the downloads complete."""
+        results: queue.Queue = queue.Queue()
+        loop = asyncio.new_event_loop()
+        # the semaphore is created on the loop that uses it, older python versions bind it on construction
+        slots = loop.run_until_complete(_semaphore(self.concurrency + self.buffer))
+        task = loop.create_task(self._run(iter(items), results, slots))
+        thread = threading.Thread(target=loop.run_until_complete, args=(task,), daemon=True, name="squirrel_fetch_urls")
+        thread.start()
+        try:
+            while True:
+                result = results.get()
+                if result is _DONE:
+                    break
+                if isinstance(result, BaseException):
+                    raise result
+                loop.call_soon_threadsafe(slots.release)
+                yield result
+        finally:
+            if thread.is_alive():
+                loop.call_soon_threadsafe(task.cancel)
+            thread.join()
+            loop.close()
+
+
+def fetch_urls(
+    items: Iterable,
+    get_url: Optional[Callable[[Any], str]] = None,
+    concurrency: int = 1000,
+    limit_per_host: int = 16,
+    buffer: int = 256,
+    timeout: Optional[float] = 30.0,
+    connect_timeout: Optional[float] = 10.0,
+    retries: int = 2,
+    backoff: float = 0.5,
+    retry_statuses: Iterable[int] = RETRY_STATUSES,
+    dns_cache_ttl: Optional[int] = 600,
+    keepalive_timeout: float = 30.0,
+    headers: Optional[Dict[str, str]] = None,
+    cache: Optional[DownloadCache] = None,
+) -> Composable:
+    """Download the content of many urls concurrently with asyncio.
+
+    Up to `concurrency` requests are in flight at any time. Results are yielded in the order in which the downloads
+    complete, so that slow hosts do not hold back the stream. Failed downloads are yielded with their exception
+    instead of raising it::
+
+        it = fetch_urls(urls).filter(lambda x: x[2] is None).map(lambda x: decode_image(x[1], x[0]))
+
+    Args:
+        items (Iterable): Stream of urls, or of items that contain urls, see `get_url`. The stream is consumed in a
+            background thread.
+        get_url (Callable[[Any], str], optional): Function that returns the url of an item. Defaults to None, i.e.
+            the items are urls.
+        concurrency (int, optional): Maximum number of requests in flight and of open connections. Defaults to 1000.
+        limit_per_host (int, optional): Maximum number of open connections to the same host, 0 for no limit.
+            Defaults to 16.
+        buffer (int, optional): Number of downloaded items that are held until they are consumed. Defaults to 256.
+        timeout (float, optional): Maximum time in seconds to wait for data from a server, i.e. for the response or
+            the next chunk of the content. None for no timeout. Defaults to 30.0.
+        connect_timeout (float, optional): Timeout of connecting to a host in seconds. Defaults to 10.0.
+        retries (int, optional): Number of retries of a failed request. Defaults to 2.
+        backoff (float, optional): Wait time in seconds before the first retry, it doubles with every retry and is
+            randomized by ±50%. Defaults to 0.5.
+        retry_statuses (Iterable[int], optional): Http status codes that are retried, other error codes fail
+            immediately. Defaults to :py:data:`RETRY_STATUSES`.
+        dns_cache_ttl (int, optional): Time in seconds for which DNS lookups are cached, None to cache them forever
+            and 0 to disable the cache. Defaults to 600.
+        keepalive_timeout (float, optional): Time in seconds for which idle connections are kept open for reuse.
+            Defaults to 30.0.
+        headers (Dict[str, str], optional): Headers sent with every request, e.g. a "User-Agent". Defaults to None.
+        cache (DownloadCache, optional): Cache that content is read from and downloads are stored in. Urls that fail
+            with one of its `negative_statuses` are added to its negative cache, but are not skipped here, see
+            :py:meth:`DownloadCache.is_failed`. Defaults to None.
+
+    Returns:
+        Composable: Stream of (item, content, error) tuples. `content` is None if the download failed with `error`.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be positive, got {concurrency}")
+    fetcher = _Fetcher(
+        get_url=get_url or str,
+        concurrency=concurrency,
+        limit_per_host=limit_per_host,
+        buffer=buffer,
+        timeout=timeout,
+        connect_timeout=connect_timeout,
+        retries=retries,
+        backoff=backoff,
+        retry_statuses=retry_statuses,
+        dns_cache_ttl=dns_cache_ttl,
+        keepalive_timeout=keepalive_timeout,
+        headers=headers,
+        cache=cache,
+    )
+    return IterableSource(lambda: fetcher(items))
@@ -1,22 +1,123 @@
-from typing import Dict, Optional
+from __future__ import annotations
+
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 import fsspec
 import numpy as np
-from PIL import Image
+from fsspec.implementations.local import LocalFileSystem
+from squirrel.iterstream import IterableSource
+
+from squirrel_datasets_core.io.buffers import BufferPool
+from squirrel_datasets_core.io.decoders import get_decoder, image_format
+from squirrel_datasets_core.io.fs import get_filesystem
+
+if TYPE_CHECKING:
+    from squirrel.iterstream import Composable
+
+_EXECUTORS: Dict[Tuple[int, Optional[int]], ThreadPoolExecutor] = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def _get_executor(max_workers: Optional[int]) -> ThreadPoolExecutor:
+    """Get the thread pool of the current process with `max_workers` threads, create it on first use."""
+    key = (os.getpid(), max_workers)
+    with _EXECUTORS_LOCK:
+        if key not in _EXECUTORS:
+            _EXECUTORS[key] = ThreadPoolExecutor(max_workers, thread_name_prefix="squirrel_load_images")
+        return _EXECUTORS[key]
+
+
+def read_file(path: str, fs: Optional[fsspec.AbstractFileSystem] = None, open_kwargs: Optional[Dict] = None) -> bytes:
+    """Read a whole file into memory.
+
+    Without `open_kwargs`, the file is fetched with :py:meth:`fsspec.AbstractFileSystem.cat_file`, i.e. with a single
+    request for remote filesystems. Otherwise the file is opened with `open_kwargs` and read at once.
+
+    Args:
+        path (str): File path.
+        fs (fsspec.AbstractFileSystem, optional): Filesystem object to use. If not provided, the cached filesystem of
+            the protocol of `path` is used. Chained urls are opened with :py:func:`fsspec.open`. Defaults to None.
+        open_kwargs (Dict, optional): Keyword arguments passed to `fs.open()`. Defaults to None.
+
+    Returns:
+        bytes: Content of the file.
+    """
+    if fs is None:
+        fs = fsspec if "::" in path else get_filesystem(path)
+    open_kwargs = {k: v for k, v in (open_kwargs or {}).items() if k != "mode"}
+    if fs is not fsspec and not open_kwargs:
+        return fs.cat_file(path)
+    with fs.open(path, mode="rb", **open_kwargs) as fh:
+        return fh.read()
+
+
+def decode_image(
+    data: bytes,
+    path: Optional[str] = None,
+    decoder: Optional[str] = None,
+    target_size: Optional[Union[int, Tuple[int, int]]] = None,
+    out: Optional[Union[np.ndarray, BufferPool]] = None,
+) -> np.ndarray:
+    """Decode an encoded image that is already in memory, e.g. fetched by :py:func:`prefetch_files`.
+
+    Args:
+        data (bytes): Encoded image.
+        path (str, optional): Path of the image, only its extension is used to select the decoder. If not provided,
+            PIL is used unless another decoder is selected. Defaults to None.
+        decoder (str, optional): Name of the decoder to use, see :py:func:`load_image`. Defaults to None.
+        target_size (Union[int, Tuple[int, int]], optional): Minimum (height, width) of the decoded image, see
+            :py:func:`load_image`. Defaults to None.
+        out (Union[np.ndarray, BufferPool], optional): Output array or buffer pool, see :py:func:`load_image`.
+            Defaults to None.
+
+    Returns:
+        np.ndarray: Image as a numpy array.
+    """
+    if isinstance(target_size, int):
+        target_size = (target_size, target_size)
+    dec = get_decoder(image_format(path) if path is not None else None, decoder)
+    return dec.decode(io.BytesIO(data), target_size, out)
 
 
 def load_image(
-    path: str, fs: Optional[fsspec.AbstractFileSystem] = None, open_kwargs: Optional[Dict] = None
+    path: str,
+    fs: Optional[fsspec.AbstractFileSystem] = None,
+    open_kwargs: Optional[Dict] = None,
+    decoder: Optional[str] = None,
+    target_size: Optional[Union[int, Tuple[int, int]]] = None,
+    out: Optional[Union[np.ndarray, BufferPool]] = None,
+    read_ahead: Optional[bool] = None,
 ) -> np.ndarray:
     """Load an image.
 
-    File is opened from an arbitrary path using fsspec and image is loaded using PIL and converted to a numpy array.
+    File is opened from an arbitrary path using fsspec and image is decoded into a numpy array with the fastest
+    available decoder for its format, see :py:mod:`squirrel_datasets_core.io.decoders`.
 
     Args:
         path (str): Image path.
         fs (fsspec.AbstractFileSystem, optional): Filesystem object to use for opening the file. If not provided,
-            :py:func:`fsspec.open` will be used. Defaults to None.
+            the cached filesystem of the protocol of `path` is used, see
+            :py:func:`~squirrel_datasets_core.io.fs.get_filesystem`. Chained urls (e.g. "simplecache::gs://...") are
+            opened with :py:func:`fsspec.open`. Defaults to None.
         open_kwargs (Dict, optional): Keyword arguments passed to `fs.open()`. By default, only mode="rb" is set.
+        decoder (str, optional): Name of the decoder to use, e.g. "pil", "simplejpeg", "turbojpeg" or "opencv". If not
+            provided, the decoder is selected by the environment variable `SQUIRREL_IMAGE_DECODER` or automatically.
+            Defaults to None.
+        target_size (Union[int, Tuple[int, int]], optional): Minimum (height, width) of the loaded image, an int
+            applies to both sides. If given, JPEGs are decoded directly at reduced scale (down to 1/8) in the DCT domain
+            as long as the image stays at least as large as `target_size`. The image is not resized to `target_size`
+            and other formats are always loaded at full size. Defaults to None.
+        out (Union[np.ndarray, BufferPool], optional): Preallocated array to decode the image into, which must match
+            the shape and dtype of the image, or a :py:class:`~squirrel_datasets_core.io.buffers.BufferPool` to take a
+            reusable array from. If not provided, a new array is allocated. Defaults to None.
+        read_ahead (bool, optional): Whether to read the whole file into memory before decoding, see
+            :py:func:`read_file`. Decoders read files in many small chunks, which can turn into many requests for
+            remote files. If not provided, read-ahead is used for all but local files. Defaults to None.
 
     Returns:
         np.ndarray: Image as a numpy array.
@@ -26,7 +127,108 @@ def load_image(
     open_kwargs["mode"] = open_kwargs.get("mode", "rb")
 
     if fs is None:
-        fs = fsspec
+        fs = fsspec if "::" in path else get_filesystem(path)
 
+    if isinstance(target_size, int):
+        target_size = (target_size, target_size)
+
+    dec = get_decoder(image_format(path), decoder)
+    if read_ahead is None:
+        read_ahead = not isinstance(fs, LocalFileSystem)
+    if read_ahead:
+        return dec.decode(io.BytesIO(read_file(path, fs, open_kwargs)), target_size, out)
     with fs.open(path, **open_kwargs) as fh:
-        return np.array(Image.open(fh))
+        return dec.decode(fh, target_size, out)
+
+
+def load_images(
+    paths: Sequence[str],
+    fs: Optional[fsspec.AbstractFileSystem] = None,
+    open_kwargs: Optional[Dict] = None,
+    decoder: Optional[str] = None,
+    target_size: Optional[Union[int, Tuple[int, int]]] = None,
+    out: Optional[Union[np.ndarray, BufferPool]] = None,
+    max_workers: Optional[int] = None,
+    stack: bool = True,
+) -> Union[np.ndarray, List[np.ndarray]]:
+    """Load several images concurrently.
+
+    The files are read and decoded in a thread pool, which runs in parallel because file io as well as the decoders
+    release the GIL. If all images have the same shape and dtype, they are stacked into one contiguous array of shape
+    (N, H, W[, C]).
+
+    Args:
+        paths (Sequence[str]): Image paths.
+        fs (fsspec.AbstractFileSystem, optional): Filesystem object to use for opening the files. If not provided,
+            the cached filesystem of the protocol of each path is used. Defaults to None.
+        open_kwargs (Dict, optional): Keyword arguments passed to `fs.open()`. By default, only mode="rb" is set.
+        decoder (str, optional): Name of the decoder to use, see :py:func:`load_image`. Defaults to None.
+        target_size (Union[int, Tuple[int, int]], optional): Minimum (height, width) of the loaded images, see
+            :py:func:`load_image`. Defaults to None.
+        out (Union[np.ndarray, BufferPool], optional): Preallocated array of shape (N, H, W[, C]) to decode the images
+            into, all images must match its shape and dtype. Or a
+            :py:class:`~squirrel_datasets_core.io.buffers.BufferPool` that the images and the stacked array are taken
+            from. The single images are released to the pool again after stacking. Defaults to None.
+        max_workers (int, optional): Number of threads. The thread pool is created once per process and number of
+            threads. Defaults to None, which uses the default of :py:class:`concurrent.futures.ThreadPoolExecutor`.
+        stack (bool, optional): Whether to stack images of the same shape and dtype into one array. Defaults to True.
+
+    Returns:
+        Union[np.ndarray, List[np.ndarray]]: The stacked images, or a list of images if they differ in shape or dtype
+            or if `stack` is False.
+    """
+    if isinstance(out, np.ndarray) and len(out) != len(paths):
+        raise ValueError(f"Output buffer of length {len(out)} does not fit {len(paths)} images.")
+
+    def _load(i: int) -> np.ndarray:
+        target = out[i] if isinstance(out, np.ndarray) else out
+        return load_image(paths[i], fs, dict(open_kwargs or {}), decoder, target_size, target)
+
+    images = list(_get_executor(max_workers).map(_load, range(len(paths))))
+    if isinstance(out, np.ndarray):
+        return out
+    if not stack or not images or len({(img.shape, img.dtype) for img in images}) > 1:
+        return images
+
+    shape = (len(images),) + images[0].shape
+    batch = np.empty(shape, images[0].dtype) if out is None else out.acquire(shape, images[0].dtype)
+    np.stack(images, out=batch)
+    if out is not None:
+        for img in images:
+            out.release(img)
+    return batch
+
+
+def _fetch(path: str, fs: Optional[fsspec.AbstractFileSystem], open_kwargs: Optional[Dict]) -> Tuple[str, bytes]:
+    """Read a file and return it together with its path."""
+    return path, read_file(path, fs, open_kwargs)
+
+
+def prefetch_files(
+    paths: Iterable[str],
+    size: int = 16,
+    fs: Optional[fsspec.AbstractFileSystem] = None,
+    open_kwargs: Optional[Dict] = None,
+    max_workers: Optional[int] = None,
+) -> Composable:
+    """Read the files of a stream of paths ahead of time.
+
+    The next `size` files are fetched concurrently while earlier ones are consumed, which hides the latency of remote
+    storage. The order of the stream is kept::
+
+        it = prefetch_files(FilePathGenerator(url), size=32).map(lambda x: decode_image(x[1], x[0]))
+
+    Args:
+        paths (Iterable[str]): Stream of file paths, e.g. a :py:class:`squirrel.iterstream.FilePathGenerator`.
+        size (int, optional): Number of files in flight. Defaults to 16.
+        fs (fsspec.AbstractFileSystem, optional): Filesystem object to use. If not provided, the cached filesystem of
+            the protocol of each path is used. Defaults to None.
+        open_kwargs (Dict, optional): Keyword arguments passed to `fs.open()`, see :py:func:`read_file`. Defaults to
+            None.
+        max_workers (int, optional): Number of threads fetching files. Defaults to `size`.
+
+    Returns:
+        Composable: Stream of (path, content) tuples.
+    """
+    fetch = partial(_fetch, fs=fs, open_kwargs=open_kwargs)
+    return IterableSource(paths).async_map(fetch, buffer=size, max_workers=max_workers or size)
@@ -0,0 +1,175 @@
+"""Persistent file listings for drivers that iterate over the files of a directory.
+
+Listing a large dataset on object storage, e.g. the 1.28M images of ImageNet on GCS, takes minutes and is repeated by
+:py:class:`squirrel.iterstream.FilePathGenerator` at every `get_iter` call and in every worker.
+:py:class:`CachedFilePathGenerator` writes the listing to a manifest on the first iteration and reads it from there
+afterwards.
+
+A manifest is a gzipped text file. Its first line is a json header with the url, the listing mode and the fingerprint
+of the root directory. It is followed by one line per file with its path, size and modification time, separated by tabs
+and sorted by path.
+
+The fingerprint is a hash of the top-level entries of `url` with their sizes and modification times, which takes a
+single `ls`. A manifest is rebuilt if the fingerprint changed. Changes below the top level are only detected if the
+filesystem updates the modification time of the parent directories (e.g. local filesystems for direct children), object
+stores do not. Pass `refresh=True` to rebuild the manifest after such changes.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import fsspec
+from squirrel.fsspec.fs import get_fs_from_url, get_protocol
+from squirrel.iterstream import Composable, FilePathGenerator
+
+__all__ = ["CachedFilePathGenerator", "LISTING_CACHE_ENV_VAR", "list_files"]
+
+LISTING_CACHE_ENV_VAR = "SQUIRREL_LISTING_CACHE"
+_DEFAULT_CACHE_DIR = Path("~/.cache/squirrel_datasets_core/listings")
+_MANIFEST_VERSION = 1
+
+# (path, size, modification time)
+Entry = Tuple[str, int, str]
+
+
+def _modification_time(info: Dict[str, Any]) -> str:
+    """Modification time of an entry of `fs.ls(detail=True)`, its key depends on the filesystem."""
+    for key in ("mtime", "updated", "LastModified", "last_modified", "created"):
+        if info.get(key) is not None:
+            return str(info[key])
+    return ""
+
+
+def _entry(info: Dict[str, Any]) -> Entry:
+    """Convert an entry of `fs.ls(detail=True)` to a manifest entry."""
+    return info["name"], int(info.get("size") or 0), _modification_time(info)
+
+
+class CachedFilePathGenerator(Composable):
+    """Drop-in replacement of :py:class:`squirrel.iterstream.FilePathGenerator` that persists the listing."""
+
+    def __init__(
+        self,
+        url: str,
+        nested: bool = False,
+        cache_dir: Optional[Union[str, Path]] = None,
+        refresh: bool = False,
+        **storage_options,
+    ) -> None:
+        """Initialize CachedFilePathGenerator.
+
+        Args:
+            url (str): Url of the directory to list.
+            nested (bool, optional): If True, all files below `url` are yielded. Otherwise, the top-level entries of
+                `url` are yielded, including directories. Defaults to False.
+            cache_dir (Union[str, Path], optional): Local directory to store manifests in. If not provided, the
+                environment variable `SQUIRREL_LISTING_CACHE` is used, or `~/.cache/squirrel_datasets_core/listings`.
+                Defaults to None.
+            refresh (bool, optional): Whether to list `url` and rewrite the manifest even if it is up to date. Defaults
+                to False.
+            **storage_options: Keyword arguments passed to the fsspec filesystem.
+        """
+        super().__init__()
+        self.url = str(url)
+        self.protocol = get_protocol(self.url)
+        self.nested = nested
+        if cache_dir is None:
+            cache_dir = os.environ.get(LISTING_CACHE_ENV_VAR, _DEFAULT_CACHE_DIR)
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.refresh = refresh
+        self.storage_options = storage_options
+
+    @property
+    def manifest_path(self) -> Path:
+        """Path of the manifest of `url`."""
+        key = hashlib.sha256(json.dumps([self.url, self.nested]).encode()).hexdigest()[:32]
+        return self.cache_dir / f"{key}.tsv.gz"
+
+    @staticmethod
+    def _fingerprint(top_level: List[Dict[str, Any]]) -> str:
+        """Hash of the top-level entries."""
+        h = hashlib.sha256()
+        for name, size, mtime in sorted(_entry(info) for info in top_level):
+            h.update(f"{name}\t{size}\t{mtime}\n".encode())
+        return h.hexdigest()
+
+    def _read_manifest(self, fingerprint: str) -> Optional[List[Entry]]:
+        """Read the manifest, returns None if it does not exist or is outdated."""
+        try:
+            with gzip.open(self.manifest_path, "rt", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header != self._header(fingerprint):
+                    return None
+                entries = []
+                for line in f:
+                    name, size, mtime = line.rstrip("\n").split("\t")
+                    entries.append((name, int(size), mtime))
+                return entries
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def _write_manifest(self, fingerprint: str, entries: List[Entry]) -> None:
+        """Write the manifest atomically, so that concurrent workers never read a partial manifest."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                f.write(json.dumps(self._header(fingerprint)) + "\n")
+                f.writelines(f"{name}\t{size}\t{mtime}\n" for name, size, mtime in entries)
+            os.replace(tmp, self.manifest_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _header(self, fingerprint: str) -> Dict[str, Any]:
+        """First line of the manifest."""
+        return {"version": _MANIFEST_VERSION, "url": self.url, "nested": self.nested, "fingerprint": fingerprint}
+
+    def _list(self, fs: fsspec.AbstractFileSystem, top_level: List[Dict[str, Any]]) -> List[Entry]:
+        """List `url`, recursively if `nested`."""
+        if self.nested:
+            infos = fs.find(self.url, detail=True).values()
+        else:
+            infos = top_level
+        return sorted(_entry(info) for info in infos)
+
+    def entries(self) -> List[Entry]:
+        """Get the (path, size, modification time) of all listed files, from the manifest if it is up to date."""
+        fs = get_fs_from_url(self.url, **self.storage_options)
+        top_level = fs.ls(self.url, detail=True) if fs.exists(self.url) else []
+        fingerprint = self._fingerprint(top_level)
+        entries = None if self.refresh else self._read_manifest(fingerprint)
+        if entries is None:
+            entries = self._list(fs, top_level)
+            self._write_manifest(fingerprint, entries)
+        return entries
+
+    def __iter__(self) -> Iterator[str]:
+        """Yield the paths of all listed files."""
+        for name, _, _ in self.entries():
+            yield f"{self.protocol}{name}"
+
+
+def list_files(url: str, nested: bool = False, cache: bool = False, refresh: bool = False) -> Composable:
+    """Stream the file paths under `url`, optionally from a persistent manifest.
+
+    Args:
+        url (str): Url of the directory to list.
+        nested (bool, optional): If True, all files below `url` are yielded. Otherwise, the top-level entries of `url`
+            are yielded, including directories. Defaults to False.
+        cache (bool, optional): Whether to persist the listing in a manifest, see :py:class:`CachedFilePathGenerator`.
+            Defaults to False.
+        refresh (bool, optional): Whether to rebuild the manifest. Only used if `cache` is True. Defaults to False.
+
+    Returns:
+        Composable: Stream of file paths.
+    """
+    if cache:
+        return CachedFilePathGenerator(url, nested=nested, refresh=refresh)
+    return FilePathGenerator(url, nested=nested)
@@ -0,0 +1,291 @@
+"""Seek index of compressed text shards for random access and for splitting a shard between workers.
+
+A shard, e.g. a CC100 language file, is a sequence of documents separated by `separator`. Its index divides the shard
+into blocks that can be decompressed independently and stores for every block
+
+- its location in the compressed file,
+- its offset in the decompressed content,
+- the id of the first document that starts in the block and the decompressed offset where it starts.
+
+The blocks are the blocks of multi-block xz files (see :py:func:`~squirrel_datasets_core.io.xz_blocks`), e.g. written
+with `xz -T0` or by concatenating xz files. Other files, including gzip files and xz files with a single block, cannot
+be decompressed from the middle and are a single block.
+
+A document belongs to the block in which it starts, so that the documents of a range of blocks can be read with
+:py:meth:`ShardIndex.open` without overlap between ranges, by decompressing the range and the blocks until its last
+document ends. :py:meth:`ShardIndex.document` reads a single document by decompressing from the block in which it
+starts.
+
+The index is built by decompressing the shard once and is cached in a local directory, keyed by the url and the `ukey`
+(e.g. size and modification time) of the shard.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from itertools import islice
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import fsspec
+import numpy as np
+from fsspec.utils import infer_compression
+
+from squirrel_datasets_core.io.compression import XzBlock, _iter_file, _iter_xz_blocks, _open_background, xz_blocks
+from squirrel_datasets_core.io.fs import get_filesystem
+from squirrel_datasets_core.io.text import DEFAULT_CHUNK_SIZE, iter_documents
+
+__all__ = ["SHARD_INDEX_ENV_VAR", "ShardIndex", "load_shard_index"]
+
+SHARD_INDEX_ENV_VAR = "SQUIRREL_SHARD_INDEX"
+_DEFAULT_CACHE_DIR = Path("~/.cache/squirrel_datasets_core/shards")
+_INDEX_VERSION = 1
+
+Arrays = Dict[str, np.ndarray]
+
+
+def _scan(blocks: Iterable[Iterable[bytes]], separator: bytes) -> Arrays:
+    """Find the first document start of every block, given the decompressed chunks of each block.
+
+    Documents start at offset 0 and after every separator, which are matched from left to right like by
+    :py:meth:`bytes.split`.
+    """
+    sep_len = len(separator)
+    uncompressed_offsets, first_doc, doc_starts = [], [], []
+    n_starts, last_start, pos, tail = 1, 0, 0, b""
+    for chunks in blocks:
+        # a document that starts exactly at the block boundary belongs to this block
+        starts_here = last_start == pos
+        uncompressed_offsets.append(pos)
+        first_doc.append(n_starts - starts_here)
+        doc_starts.append(pos if starts_here else -1)
+        for chunk in chunks:
+            # the tail of the previous chunk may hold the beginning of a separator
+            buf = tail + chunk
+            base = pos - len(tail)
+            parts = buf.split(separator)
+            if len(parts) > 1:
+                n_starts += len(parts) - 1
+                last_start = base + len(buf) - len(parts[-1])
+                if doc_starts[-1] == -1:
+                    doc_starts[-1] = base + len(parts[0]) + sep_len
+            rest = parts[-1]
+            tail = rest[max(len(rest) - sep_len + 1, 0) :]
+            pos += len(chunk)
+        if doc_starts[-1] == pos:
+            # the only start is at the end of the block and belongs to the next one
+            doc_starts[-1] = -1
+
+    if last_start == pos and doc_starts[-1] == -1:
+        # a document that starts at the end of the shard, i.e. after a trailing separator, belongs to the last block
+        doc_starts[-1] = pos
+    uncompressed_offsets.append(pos)
+    first_doc.append(n_starts)
+    # blocks without a document start continue the last document of a previous block, the first document start at or
+    # after them is that of a later block, or the end of the shard
+    doc_starts.append(pos + sep_len)
+    for i in range(len(doc_starts) - 2, -1, -1):
+        if doc_starts[i] == -1:
+            doc_starts[i] = doc_starts[i + 1]
+    return {
+        "uncompressed_offsets": np.array(uncompressed_offsets, dtype=np.int64),
+        "first_doc": np.array(first_doc, dtype=np.int64),
+        "doc_starts": np.array(doc_starts, dtype=np.int64),
+    }
+
+
+def _build_index(
+    url: str, separator: bytes, compression: Optional[str], fs: fsspec.AbstractFileSystem, workers: int
+) -> Arrays:
+    """Decompress the shard once and build its index."""
+    blocks = xz_blocks(url, fs) if compression == "xz" else []
+    if len(blocks) > 1:
+        arrays = _scan(([data] for data in _iter_xz_blocks(url, fs, blocks, workers)), separator)
+        arrays["offsets"] = np.array([b.offset for b in blocks], dtype=np.int64)
+        arrays["sizes"] = np.array([b.size for b in blocks], dtype=np.int64)
+        arrays["unpadded_sizes"] = np.array([b.unpadded_size for b in blocks], dtype=np.int64)
+        arrays["stream_flags"] = np.array([int.from_bytes(b.stream_flags, "little") for b in blocks], dtype=np.uint16)
+    else:
+        arrays = _scan([_iter_file(url, fs, compression, DEFAULT_CHUNK_SIZE)], separator)
+        arrays["offsets"] = np.zeros(1, dtype=np.int64)
+        arrays["sizes"] = np.array([fs.size(url)], dtype=np.int64)
+        arrays["unpadded_sizes"] = np.zeros(1, dtype=np.int64)
+        arrays["stream_flags"] = np.zeros(1, dtype=np.uint16)
+    arrays["xz_blocks"] = np.array(len(blocks) > 1)
+    return arrays
+
+
+def _write_arrays(path: Path, arrays: Arrays) -> None:
+    """Write the arrays of an index to a temporary file and move it to `path`."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class ShardIndex:
+    """Seek index of a compressed text shard, see :py:func:`load_shard_index`."""
+
+    def __init__(
+        self,
+        url: str,
+        arrays: Arrays,
+        separator: bytes = b"\n\n",
+        compression: Optional[str] = None,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> None:
+        """Initialize ShardIndex.
+
+        Args:
+            url (str): Url of the shard.
+            arrays (Dict[str, np.ndarray]): Arrays of the index.
+            separator (bytes, optional): Separator between documents. Defaults to a blank line.
+            compression (str, optional): Compression of the shard, as in :py:func:`fsspec.open`. Defaults to None.
+            fs (fsspec.AbstractFileSystem, optional): Filesystem to read `url` with. Defaults to
+                :py:func:`~squirrel_datasets_core.io.get_filesystem`.
+        """
+        self.url = url
+        self.separator = separator
+        self.compression = compression
+        self.fs = get_filesystem(url) if fs is None else fs
+        self.arrays = arrays
+
+    @property
+    def n_blocks(self) -> int:
+        """Number of blocks of the shard."""
+        return len(self.arrays["offsets"])
+
+    @property
+    def n_docs(self) -> int:
+        """Number of documents of the shard."""
+        return int(self.arrays["first_doc"][-1])
+
+    def count(self, start: int = 0, stop: Optional[int] = None) -> int:
+        """Number of documents that start in the blocks `start` to `stop` (exclusive)."""
+        stop = self.n_blocks if stop is None else stop
+        return int(self.arrays["first_doc"][stop] - self.arrays["first_doc"][start])
+
+    def ranges(self, blocks_per_range: int = 1) -> List[Tuple[int, int]]:
+        """Split the blocks into consecutive (start, stop) ranges of `blocks_per_range` blocks."""
+        return [(i, min(i + blocks_per_range, self.n_blocks)) for i in range(0, self.n_blocks, blocks_per_range)]
+
+    def _iter_range(self, start: int, end: int, workers: int) -> Iterator[bytes]:
+        """Yield the decompressed bytes from offset `start` to `end` of the shard."""
+        offsets = self.arrays["uncompressed_offsets"]
+        if self.arrays["xz_blocks"]:
+            first = int(np.searchsorted(offsets, start, side="right")) - 1
+            blocks = [
+                XzBlock(int(offset), int(size), int(unpadded), int(uncompressed), int(flags).to_bytes(2, "little"))
+                for offset, size, unpadded, uncompressed, flags in zip(
+                    self.arrays["offsets"][first:],
+                    self.arrays["sizes"][first:],
+                    self.arrays["unpadded_sizes"][first:],
+                    np.diff(offsets)[first:],
+                    self.arrays["stream_flags"][first:],
+                )
+            ]
+            chunks = _iter_xz_blocks(self.url, self.fs, blocks, workers)
+            pos = int(offsets[first])
+        else:
+            chunks = _iter_file(self.url, self.fs, self.compression, DEFAULT_CHUNK_SIZE)
+            pos = 0
+
+        try:
+            for chunk in chunks:
+                if pos >= end:
+                    return
+                lo, hi = max(start - pos, 0), min(end - pos, len(chunk))
+                if lo < hi:
+                    yield chunk[lo:hi]
+                pos += len(chunk)
+        finally:
+            chunks.close()
+
+    def open(self, start: int = 0, stop: Optional[int] = None, workers: int = 1) -> BinaryIO:
+        """Open the documents that start in the blocks `start` to `stop` (exclusive) for reading.
+
+        The content of the stream is the part of the decompressed shard from the start of the first document to the end
+        of the last document, including the separators between them. It is empty if no document starts in the
+        blocks, which :py:meth:`count` tells apart from a single empty document.
+
+        Args:
+            start (int, optional): First block. Defaults to 0.
+            stop (int, optional): Block after the last block. Defaults to the number of blocks.
+            workers (int, optional): Number of threads that decompress blocks concurrently. Defaults to 1.
+
+        Returns:
+            BinaryIO: Buffered binary stream, which is decompressed in background threads.
+        """
+        stop = self.n_blocks if stop is None else stop
+        doc_starts = self.arrays["doc_starts"]
+        begin = int(doc_starts[start])
+        end = max(int(doc_starts[stop]) - len(self.separator), begin)
+        return _open_background(self._iter_range(begin, end, workers))
+
+    def document(self, doc_id: int) -> bytes:
+        """Read the document with id `doc_id`, i.e. the `doc_id`-th element of `content.split(separator)`.
+
+        Raises:
+            IndexError: If the shard has no document with id `doc_id`.
+        """
+        if not 0 <= doc_id < self.n_docs:
+            raise IndexError(f"{self.url} has {self.n_docs} documents, got document id {doc_id}")
+        first_doc = self.arrays["first_doc"]
+        block = int(np.searchsorted(first_doc[:-1], doc_id, side="right")) - 1
+        with self.open(block) as f:
+            return next(islice(iter_documents(f, self.separator), doc_id - int(first_doc[block]), None))
+
+
+def load_shard_index(
+    url: str,
+    separator: bytes = b"\n\n",
+    compression: Optional[str] = "infer",
+    cache_dir: Optional[Union[str, Path]] = None,
+    fs: Optional[fsspec.AbstractFileSystem] = None,
+    workers: int = 1,
+) -> ShardIndex:
+    r"""Get the seek index of a shard, building it on first use.
+
+    Args:
+        url (str): Url of the shard.
+        separator (bytes, optional): Separator between documents, e.g. b"\n" for json lines. Defaults to a blank line.
+        compression (str, optional): Compression of the shard, as in :py:func:`fsspec.open`. "infer" guesses it from
+            the file extension. Defaults to "infer".
+        cache_dir (Union[str, Path], optional): Local directory to store the index in. If not provided, the environment
+            variable `SQUIRREL_SHARD_INDEX` is used, or `~/.cache/squirrel_datasets_core/shards`. If the directory is
+            not writable, the index is kept in memory. Defaults to None.
+        fs (fsspec.AbstractFileSystem, optional): Filesystem to read `url` with. Defaults to
+            :py:func:`~squirrel_datasets_core.io.get_filesystem`.
+        workers (int, optional): Number of threads that decompress blocks concurrently while building the index.
+            Defaults to 1.
+
+    Returns:
+        ShardIndex: The index.
+    """
+    url = str(url)
+    fs = get_filesystem(url) if fs is None else fs
+    if compression == "infer":
+        compression = infer_compression(url)
+    if cache_dir is None:
+        cache_dir = os.environ.get(SHARD_INDEX_ENV_VAR, _DEFAULT_CACHE_DIR)
+    key_data = [_INDEX_VERSION, url, separator.hex(), compression, fs.ukey(url)]
+    key = hashlib.sha256(json.dumps(key_data).encode()).hexdigest()[:32]
+    path = Path(cache_dir).expanduser() / f"{key}.npz"
+
+    if path.exists():
+        with np.load(path) as npz:
+            arrays = dict(npz)
+    else:
+        arrays = _build_index(url, separator, compression, fs, workers)
+        try:
+            _write_arrays(path, arrays)
+        except OSError:
+            pass
+    return ShardIndex(url, arrays, separator=separator, compression=compression, fs=fs)
@@ -0,0 +1,361 @@
+"""Streaming readers for text corpora, e.g. the json lines shards of C4, the plain text files of CC100 and the json
+arrays of the Monthly German Tweets.
+
+The readers consume (decompressed) binary streams in chunks of `chunk_size` bytes, so that the memory used per shard is
+bounded by the chunk size instead of the size of the decompressed shard. Lines are parsed from raw bytes with `orjson`
+if it is installed, and with the standard library otherwise. Json arrays from which only some fields are read are parsed
+lazily with `pysimdjson` if it is installed.
+"""
+from __future__ import annotations
+
+import codecs
+import json
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional
+
+__all__ = [
+    "DEFAULT_CHUNK_SIZE",
+    "get_json_loads",
+    "iter_documents",
+    "iter_json_array",
+    "iter_json_lines",
+    "iter_line_chunks",
+]
+
+DEFAULT_CHUNK_SIZE = 2**20
+
+
+def get_json_loads() -> Callable[[bytes], Any]:
+    """Get the fastest available function to parse a json document from bytes, `orjson.loads` if installed."""
+    try:
+        import orjson
+
+        return orjson.loads
+    except ImportError:
+        return json.loads
+
+
+def iter_line_chunks(f: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[bytes]]:
+    """Yield the lines of a binary stream in lists, reading `chunk_size` bytes at a time.
+
+    Each list holds the lines that were completed by one read, without the trailing newline characters. A line that is
+    longer than `chunk_size` is yielded once it is complete.
+
+    Args:
+        f (BinaryIO): Stream opened in binary mode.
+        chunk_size (int, optional): Number of bytes to read at once. Defaults to 1MB.
+
+    Yields:
+        List[bytes]: Lines of the stream.
+    """
+    pending = []
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        head, sep, tail = chunk.rpartition(b"\n")
+        if not sep:
+            pending.append(chunk)
+            continue
+        pending.append(head)
+        yield b"".join(pending).split(b"\n")
+        pending = [tail]
+
+    rest = b"".join(pending)
+    if rest:
+        yield [rest]
+
+
+def iter_documents(f: BinaryIO, separator: bytes = b"\n\n", chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Split a binary stream at `separator`, reading `chunk_size` bytes at a time.
+
+    The documents are the same as those of `f.read().split(separator)`, including empty documents, but only the current
+    chunk and the unfinished document are held in memory.
+
+    Args:
+        f (BinaryIO): Stream opened in binary mode.
+        separator (bytes, optional): Separator between documents. Defaults to a blank line.
+        chunk_size (int, optional): Number of bytes to read at once. Defaults to 1MB.
+
+    Yields:
+        bytes: Documents without the separators.
+    """
+    buffer = bytearray()
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        # only the new bytes and a possible separator across the chunk boundary need to be searched
+        start = max(len(buffer) - len(separator) + 1, 0)
+        buffer += chunk
+        if buffer.find(separator, start) == -1:
+            continue
+        *documents, rest = bytes(buffer).split(separator)
+        yield from documents
+        buffer = bytearray(rest)
+    yield bytes(buffer)
+
+
+def _rebatch(chunks: Iterable[List[Any]], batch_size: int) -> Iterator[List[Any]]:
+    """Regroup lists of arbitrary lengths into lists of `batch_size` items, the last one may be shorter."""
+    buffer = []
+    for chunk in chunks:
+        buffer.extend(chunk)
+        if len(buffer) < batch_size:
+            continue
+        end = len(buffer) - len(buffer) % batch_size
+        for start in range(0, end, batch_size):
+            yield buffer[start : start + batch_size]
+        buffer = buffer[end:]
+    if buffer:
+        yield buffer
+
+
+def iter_json_lines(
+    f: BinaryIO,
+    batch_size: Optional[int] = None,
+    loads: Optional[Callable[[bytes], Any]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Any]:
+    """Parse a json lines stream incrementally. Blank lines are skipped.
+
+    Args:
+        f (BinaryIO): Stream opened in binary mode.
+        batch_size (int, optional): If provided, lists of `batch_size` records are yielded instead of single records.
+            The last list may be shorter. Defaults to None.
+        loads (Callable[[bytes], Any], optional): Function that parses a single line. Defaults to
+            :py:func:`get_json_loads`.
+        chunk_size (int, optional): Number of bytes to read at once. Defaults to 1MB.
+
+    Yields:
+        Any: Parsed records, or lists of them if `batch_size` is provided.
+    """
+    if loads is None:
+        loads = get_json_loads()
+    chunks = ([loads(line) for line in lines if line.strip()] for lines in iter_line_chunks(f, chunk_size))
+
+    if batch_size is None:
+        for records in chunks:
+            yield from records
+    else:
+        yield from _rebatch(chunks, batch_size)
+
+
+_JSON_WHITESPACE = " \t\n\r"
+_JSON_NUMBER_CHARS = "0123456789+-.eE"
+
+
+class _JsonFields:
+    """Extracts fields, given as keys joined by dots, from json objects. Fields that an object does not have are None.
+
+    With `pysimdjson <https://github.com/TkTech/pysimdjson>`_ installed, :py:meth:`loads` parses documents lazily and
+    converts only the values of the fields to python objects. Otherwise, documents are parsed completely with
+    :py:func:`get_json_loads` and the fields are taken from the result.
+    """
+
+    def __init__(self, fields: List[str]) -> None:
+        """Init the extractor.
+
+        Args:
+            fields (List[str]): Fields to extract, nested fields are given as keys joined by dots, e.g. "user.id".
+        """
+        self.paths = []
+        for field in fields:
+            key, *keys = field.split(".")
+            self.paths.append((field, key, keys))
+        try:
+            import simdjson
+
+            # a parser is not thread-safe, and it can only parse the next document once no proxies into the previous
+            # one are left, which holds as all values are converted before `loads` returns
+            self.parser = simdjson.Parser()
+            self.object_type = simdjson.Object
+            self.converters = {simdjson.Object: simdjson.Object.as_dict, simdjson.Array: simdjson.Array.as_list}
+        except ImportError:
+            self.parser = None
+            self.json_loads = get_json_loads()
+
+    def __call__(self, obj: Any) -> Dict[str, Any]:
+        """Extract the fields from a parsed object."""
+        if not isinstance(obj, dict):
+            return {field: None for field, _, _ in self.paths}
+        sample = {}
+        for field, key, keys in self.paths:
+            value = obj.get(key)
+            for key in keys:
+                value = value.get(key) if isinstance(value, dict) else None
+            sample[field] = value
+        return sample
+
+    def loads(self, data: bytes) -> Dict[str, Any]:
+        """Parse a json object from bytes and extract the fields."""
+        if self.parser is None:
+            return self(self.json_loads(data))
+        try:
+            doc = self.parser.parse(data)
+        except RuntimeError:
+            # values that simdjson cannot represent, e.g. integers beyond 64 bits
+            return self(json.loads(data))
+        object_type = self.object_type
+        if type(doc) is not object_type:
+            return {field: None for field, _, _ in self.paths}
+        sample = {}
+        for field, key, keys in self.paths:
+            value = doc.get(key)
+            for key in keys:
+                value = value.get(key) if type(value) is object_type else None
+            convert = self.converters.get(type(value))
+            sample[field] = value if convert is None else convert(value)
+        return sample
+
+
+def iter_json_array(
+    f: BinaryIO,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    loads: Optional[Callable[[bytes], Any]] = None,
+    fields: Optional[List[str]] = None,
+) -> Iterator[Any]:
+    """Parse the elements of a top-level json array incrementally, reading `chunk_size` bytes at a time.
+
+    Json strings cannot contain line breaks, so a line that holds a complete object is a complete element. As long as
+    every line holds a single object, e.g. in json arrays that are written with one element per line, the lines are
+    parsed with `loads`. From the first line that does not, the rest of the stream is decoded element by element with
+    :py:meth:`json.JSONDecoder.raw_decode` from a buffer that holds the unparsed rest of the current chunk. In both
+    cases, memory is bounded by the chunk size and the size of the largest element.
+
+    If `fields` are given, the elements are dicts of only these fields. With `pysimdjson` installed, lines are then
+    parsed lazily and no python objects are built for other fields.
+
+    Args:
+        f (BinaryIO): Stream of utf-8 encoded json, opened in binary mode.
+        chunk_size (int, optional): Number of bytes to read at once. Defaults to 1MB.
+        loads (Callable[[bytes], Any], optional): Function that parses a single line, ignored if `fields` are given.
+            Defaults to :py:func:`get_json_loads`.
+        fields (List[str], optional): If provided, only these fields of the elements are returned. Nested fields are
+            given as keys joined by dots, e.g. "user.id". Fields that an element does not have are None. Defaults to
+            None.
+
+    Raises:
+        json.JSONDecodeError: If the stream is not a valid json array. The elements before the error are yielded.
+
+    Yields:
+        Any: Elements of the array.
+    """
+    project = None
+    if fields is not None:
+        project = _JsonFields(fields)
+        loads = project.loads
+    elif loads is None:
+        loads = get_json_loads()
+    expect, rest = "[", b""
+    while True:
+        chunk = f.read(chunk_size)
+        if chunk:
+            head, sep, rest = (rest + chunk).rpartition(b"\n")
+            lines = head.split(b"\n") if sep else []
+        else:
+            lines, rest = [rest], b""
+
+        for i, line in enumerate(lines):
+            item = line.strip()
+            if not item:
+                continue
+            if expect == "[" and item == b"[":
+                expect = "first"
+                continue
+            if expect in ("first", "comma") and item == b"]":
+                return
+
+            comma = item.startswith(b",")
+            if comma:
+                item = item[1:].lstrip()
+            trailing_comma = item.endswith(b",")
+            if trailing_comma:
+                item = item[:-1].rstrip()
+            element = _NOT_PARSED
+            if expect != "[" and comma == (expect == "comma") and item.startswith(b"{") and item.endswith(b"}"):
+                try:
+                    element = loads(item)
+                except ValueError:
+                    pass
+            if element is _NOT_PARSED:
+                prefix = b"\n".join(lines[i:]) + b"\n" + rest
+                elements = _iter_json_array_raw(f, chunk_size, prefix, expect)
+                yield from elements if project is None else map(project, elements)
+                return
+            yield element
+            expect = "element" if trailing_comma else "comma"
+
+        if not chunk:
+            raise json.JSONDecodeError("Expecting ']'", "", 0)
+
+
+# marks lines that are not parsed by the fast path of iter_json_array
+_NOT_PARSED = object()
+
+
+def _iter_json_array_raw(f: BinaryIO, chunk_size: int, prefix: bytes, expect: str) -> Iterator[Any]:
+    """Decode the rest of a json array element by element, see :py:func:`iter_json_array`.
+
+    Args:
+        f (BinaryIO): Stream of the rest of the array after `prefix`.
+        chunk_size (int): Number of bytes to read at once.
+        prefix (bytes): Part of the array that was read from `f` but not parsed.
+        expect (str): What the array continues with: "[" at its start, "first" after the opening bracket, "comma" after
+            an element and "element" after a comma.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, eof = utf8.decode(prefix), 0, False
+
+    def read() -> bool:
+        """Replace the parsed part of the buffer with the next chunk, returns False at the end of the stream."""
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+        return True
+
+    def skip() -> str:
+        """Skip whitespace, returns the next character or an empty string at the end of the stream."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _JSON_WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or not read():
+                return buffer[pos : pos + 1]
+
+    def read_number_end(end: int) -> bool:
+        """Read the next chunk if the number that ends at `end` runs to the end of the buffer, e.g. "1." of "1.5"."""
+        if buffer[end : end + 1] not in _JSON_NUMBER_CHARS or buffer[end:].lstrip(_JSON_NUMBER_CHARS):
+            return False
+        return read()
+
+    if expect == "[":
+        if skip() != "[":
+            raise json.JSONDecodeError("Expecting '['", buffer, pos)
+        pos += 1
+    while True:
+        char = skip()
+        if char == "]" and expect != "element":
+            return
+        if expect == "comma":
+            if char != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            pos += 1
+            skip()
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # the element may continue in the next chunk
+                if read():
+                    continue
+                raise
+            if not isinstance(element, (int, float)) or isinstance(element, bool) or not read_number_end(end):
+                break
+        pos = end
+        expect = "comma"
+        yield element
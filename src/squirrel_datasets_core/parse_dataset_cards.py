@@ -2,10 +2,13 @@ import docutils.nodes
 import docutils.parsers.rst
 import docutils.utils
 import docutils.frontend
-import pkg_resources
 
 from typing import Dict
 
+from squirrel_datasets_core.dataset_cards import parse_readme
+
+__all__ = ["parse_rst", "MachineAttributesVisitor", "parse_readme"]
+
 
 def parse_rst(text: str) -> docutils.nodes.document:
     """Parse RST file.
@@ -62,20 +65,3 @@ class MachineAttributesVisitor(docutils.nodes.NodeVisitor):
             Dict[str, str]: Parsed summary.
         """
         return self._machine_readable_attributes
-
-
-def parse_readme(name: str) -> Dict[str, str]:
-    """Parse readme in the current directory and extract attributes.
-
-    Args:
-        name (str): path to dataset directory.
-
-    Returns:
-        _type_: Machine readable summary of attributes.
-    """
-    stream = pkg_resources.resource_stream(name, "README.rst")
-    doc = parse_rst(stream.read().decode("utf-8"))
-    visitor = MachineAttributesVisitor(doc)
-    doc.walk(visitor)
-
-    return visitor.machine_readable_attributes()
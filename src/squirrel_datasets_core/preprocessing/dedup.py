@@ -0,0 +1,300 @@
+"""Streaming removal of exact and near-duplicate documents from text streams.
+
+Both deduplicators keep their state in a :py:class:`BloomFilter` of fixed size, so memory does not grow with the number
+of documents, and the state can be saved and loaded to deduplicate across several runs or shards:
+
+- :py:class:`ExactDedup` drops documents whose 64-bit hash was seen before.
+- :py:class:`MinHashDedup` drops documents that share a locality-sensitive hashing band of their MinHash signature with
+  an earlier document, i.e. documents whose word shingles are similar to those of an earlier document.
+
+The Bloom filter has no false negatives, but a false positive rate that grows as more keys are added than its
+`capacity`, so a small fraction of unique documents is dropped.
+
+Example::
+
+    from squirrel_datasets_core.preprocessing.dedup import MinHashDedup, deduplicate
+
+    dedup = MinHashDedup(capacity=10_000_000)
+    it = driver.get_iter().to(deduplicate, dedup)
+    ...
+    dedup.save("gs://bucket/dedup/c4-en.npz")
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import zlib
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Union
+
+import numpy as np
+
+from squirrel_datasets_core.io.fs import get_filesystem
+
+__all__ = ["BloomFilter", "ExactDedup", "MinHashDedup", "deduplicate", "hash_texts"]
+
+_UINT32_MASK = np.uint64(0xFFFFFFFF)
+# maximum number of shingles that are hashed at once per document, bounds the temporary memory of MinHashDedup
+_SHINGLE_CHUNK = 4096
+
+
+def _save_arrays(url: str, arrays: Dict[str, np.ndarray]) -> None:
+    """Write arrays to a temporary file next to `url` and move it to `url`."""
+    fs = get_filesystem(url)
+    if os.path.dirname(url):
+        fs.makedirs(os.path.dirname(url), exist_ok=True)
+    tmp = f"{url}.tmp"
+    with fs.open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    fs.mv(tmp, url)
+
+
+def _load_arrays(url: str) -> Dict[str, np.ndarray]:
+    with get_filesystem(url).open(url, "rb") as f, np.load(f) as npz:
+        return dict(npz)
+
+
+def hash_texts(texts: List[str]) -> np.ndarray:
+    """Hash texts to 64-bit integers that are the same in every process, unlike :py:func:`hash`."""
+    digests = b"".join(hashlib.blake2b(text.encode(), digest_size=8).digest() for text in texts)
+    return np.frombuffer(digests, dtype=np.uint64)
+
+
+class BloomFilter:
+    """Set of 64-bit keys in a fixed-size bit array, which may report keys as present that were never added."""
+
+    def __init__(self, capacity: int, error_rate: float = 1e-3) -> None:
+        """Init an empty Bloom filter sized for `capacity` keys.
+
+        Args:
+            capacity (int): Number of keys for which the false positive rate is `error_rate`.
+            error_rate (float, optional): False positive rate at `capacity` keys. Defaults to 0.001.
+        """
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError(f"Expected a positive capacity and an error rate in (0, 1), got {capacity}, {error_rate}")
+        n_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.bits = np.zeros(-(-n_bits // 8), dtype=np.uint8)
+        self.num_hashes = max(1, round(len(self.bits) * 8 / capacity * math.log(2)))
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the bit array in bytes."""
+        return self.bits.nbytes
+
+    def _positions(self, keys: np.ndarray) -> np.ndarray:
+        """Bit positions of every key, derived from the two halves of the key by double hashing."""
+        low, high = keys & _UINT32_MASK, (keys >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (low[:, None] + steps[None, :] * high[:, None]) % np.uint64(len(self.bits) * 8)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """Whether each key is (probably) in the set."""
+        pos = self._positions(np.asarray(keys, dtype=np.uint64).ravel())
+        return (self.bits[pos >> np.uint64(3)] & (1 << (pos & np.uint64(7))).astype(np.uint8)).all(axis=1)
+
+    def add(self, keys: np.ndarray) -> np.ndarray:
+        """Add keys to the set.
+
+        Args:
+            keys (np.ndarray): 64-bit keys.
+
+        Returns:
+            np.ndarray: Whether each key was (probably) in the set before, including keys that occur earlier in `keys`.
+        """
+        keys = np.asarray(keys, dtype=np.uint64).ravel()
+        seen = self.contains(keys)
+        _, first = np.unique(keys, return_index=True)
+        repeated = np.ones(len(keys), dtype=bool)
+        repeated[first] = False
+
+        pos = self._positions(keys).ravel()
+        np.bitwise_or.at(self.bits, pos >> np.uint64(3), (1 << (pos & np.uint64(7))).astype(np.uint8))
+        self.count += len(keys)
+        return seen | repeated
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays of the state, to be saved with :py:func:`numpy.savez`."""
+        return {"bits": self.bits, "num_hashes": np.array(self.num_hashes), "count": np.array(self.count)}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> BloomFilter:
+        """Restore a Bloom filter from the arrays of :py:meth:`to_arrays`."""
+        bloom = cls.__new__(cls)
+        bloom.bits = arrays["bits"]
+        bloom.num_hashes = int(arrays["num_hashes"])
+        bloom.count = int(arrays["count"])
+        return bloom
+
+
+class ExactDedup:
+    """Keep the first occurrence of every document, comparing documents by their 64-bit hash."""
+
+    def __init__(self, capacity: int = 10_000_000, error_rate: float = 1e-3) -> None:
+        """Init the exact deduplication.
+
+        Args:
+            capacity (int, optional): Expected number of unique documents, the state takes about `1.8 * capacity`
+                bytes with the default error rate. Defaults to 10 million.
+            error_rate (float, optional): Fraction of unique documents that are dropped at `capacity` documents.
+                Defaults to 0.001.
+        """
+        self.bloom = BloomFilter(capacity, error_rate)
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        """Whether to keep each text, i.e. it did not occur before."""
+        return ~self.bloom.add(hash_texts(texts))
+
+    def save(self, url: str) -> None:
+        """Save the state to a npz file."""
+        _save_arrays(url, self.bloom.to_arrays())
+
+    @classmethod
+    def load(cls, url: str) -> ExactDedup:
+        """Load the state saved with :py:meth:`save`."""
+        dedup = cls.__new__(cls)
+        dedup.bloom = BloomFilter.from_arrays(_load_arrays(url))
+        return dedup
+
+
+class MinHashDedup:
+    """Keep documents that are not similar to an earlier document, by MinHash locality-sensitive hashing.
+
+    The MinHash signature of a document holds the minimum of `num_perm` hash functions over the hashes of its shingles
+    of `shingle_size` consecutive words. The signature is split into `bands` bands of `num_perm // bands` values, and a
+    document is a near-duplicate if any of its bands equals the same band of an earlier document. Two documents with a
+    Jaccard similarity `s` of their shingles are detected with probability `1 - (1 - s ** r) ** bands`, where
+    `r = num_perm // bands`, which is one half at about `(1 / bands) ** (1 / r)`, 0.7 with the defaults.
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 5,
+        capacity: int = 10_000_000,
+        error_rate: float = 1e-3,
+        seed: int = 0,
+    ) -> None:
+        """Init the near-duplicate detection.
+
+        Args:
+            num_perm (int, optional): Number of hash functions. Defaults to 128.
+            bands (int, optional): Number of bands, must divide `num_perm`. Defaults to 16.
+            shingle_size (int, optional): Number of words per shingle. Defaults to 5.
+            capacity (int, optional): Expected number of unique documents, the state takes about
+                `bands * 1.8 * capacity` bytes with the default error rate. Defaults to 10 million.
+            error_rate (float, optional): False positive rate of a single band at `capacity` documents. Defaults to
+                0.001.
+            seed (int, optional): Seed of the hash functions, only states with the same seed can be shared. Defaults
+                to 0.
+        """
+        if num_perm % bands:
+            raise ValueError(f"The number of bands {bands} must divide num_perm {num_perm}")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.bloom = BloomFilter(capacity * bands, error_rate)
+        self._init_hashes()
+
+    def _init_hashes(self) -> None:
+        """Draw the multiply-shift hash functions from the seed."""
+        rng = np.random.default_rng(self.seed)
+        rows = self.num_perm // self.bands
+        draws = rng.integers(
+            0, 2**64, size=self.shingle_size + 2 * self.num_perm + rows + self.bands, dtype=np.uint64
+        )
+        mult, add, band_mult, self._band_salt = np.split(
+            draws[self.shingle_size :], np.cumsum([self.num_perm, self.num_perm, rows])
+        )
+        self._shingle_mult = draws[: self.shingle_size] | np.uint64(1)
+        self._perm_mult = (mult | np.uint64(1))[:, None]
+        self._perm_add = add[:, None]
+        self._band_mult = band_mult | np.uint64(1)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        """64-bit hashes of the shingles of consecutive words of a text."""
+        words = np.fromiter((zlib.crc32(w.encode()) for w in text.split()), dtype=np.uint64)
+        n = max(len(words) - self.shingle_size + 1, 1)
+        words = np.pad(words, (0, n + self.shingle_size - 1 - len(words)))
+        shingles = np.zeros(n, dtype=np.uint64)
+        for i, mult in enumerate(self._shingle_mult):
+            shingles += words[i : i + n] * mult
+        return shingles
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """Compute the MinHash signatures of texts, an array of shape `(len(texts), num_perm)`."""
+        out = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for row, text in enumerate(texts):
+            shingles = self._shingles(text)
+            sig = np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+            for start in range(0, len(shingles), _SHINGLE_CHUNK):
+                chunk = shingles[None, start : start + _SHINGLE_CHUNK]
+                # the upper 32 bits of multiply-add are the hash, the shift commutes with the minimum
+                hashes = (chunk * self._perm_mult + self._perm_add).min(axis=1) >> np.uint64(32)
+                np.minimum(sig, hashes.astype(np.uint32), out=sig)
+            out[row] = sig
+        return out
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """64-bit key of every band of the signatures, an array of shape `(len(signatures), bands)`."""
+        bands = signatures.reshape(len(signatures), self.bands, self.num_perm // self.bands).astype(np.uint64)
+        return (bands * self._band_mult).sum(axis=2, dtype=np.uint64) ^ self._band_salt
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        """Whether to keep each text, i.e. no earlier text shares a band with it."""
+        seen = self.bloom.add(self.band_keys(self.signatures(texts)))
+        return ~seen.reshape(len(texts), self.bands).any(axis=1)
+
+    def save(self, url: str) -> None:
+        """Save the state and the parameters to a npz file."""
+        params = {k: np.array(getattr(self, k)) for k in ("num_perm", "bands", "shingle_size", "seed")}
+        _save_arrays(url, {**self.bloom.to_arrays(), **params})
+
+    @classmethod
+    def load(cls, url: str) -> MinHashDedup:
+        """Load the state saved with :py:meth:`save`."""
+        arrays = _load_arrays(url)
+        dedup = cls.__new__(cls)
+        for k in ("num_perm", "bands", "shingle_size", "seed"):
+            setattr(dedup, k, int(arrays.pop(k)))
+        dedup.bloom = BloomFilter.from_arrays(arrays)
+        dedup._init_hashes()
+        return dedup
+
+
+def _text(item: Union[str, Dict[str, Any]], text_key: str) -> str:
+    return item if isinstance(item, str) else item[text_key]
+
+
+def deduplicate(
+    items: Iterable[Union[str, Dict[str, Any], List]],
+    dedup: Callable[[List[str]], np.ndarray],
+    text_key: str = "text",
+    batch_size: int = 1024,
+) -> Iterator[Any]:
+    """Drop duplicate documents from a stream, to be used with :py:meth:`squirrel.iterstream.Composable.to`.
+
+    Args:
+        items (Iterable[Union[str, Dict[str, Any], List]]): Texts, samples with the text under `text_key`, or lists of
+            them, e.g. the batches of :py:meth:`C4DatasetDriver.get_iter` with `batch_size`. Duplicates are removed
+            from the lists. The stream must not mix single items and lists.
+        dedup (Callable[[List[str]], np.ndarray]): Function that returns whether to keep each of a batch of texts,
+            e.g. :py:class:`ExactDedup` or :py:class:`MinHashDedup`. It is called with the texts in stream order.
+        text_key (str, optional): Key of the text in the samples. Defaults to "text".
+        batch_size (int, optional): Number of single items that are checked at once. Defaults to 1024.
+
+    Yields:
+        Any: The items that are kept, in order.
+    """
+    it = iter(items)
+    for item in it:
+        if isinstance(item, list):
+            keep = dedup([_text(sample, text_key) for sample in item])
+            yield [sample for sample, k in zip(item, keep) if k]
+        else:
+            batch = [item, *islice(it, batch_size - 1)]
+            keep = dedup([_text(sample, text_key) for sample in batch])
+            yield from (sample for sample, k in zip(batch, keep) if k)
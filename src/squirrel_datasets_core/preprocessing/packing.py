@@ -0,0 +1,153 @@
+"""Tokenization of text streams and packing of the tokens into fixed-length sequences for language model training.
+
+The documents of a stream are tokenized in batches by any batch-encode callable, e.g. a fast tokenizer, and their
+tokens are concatenated and cut into sequences of `seq_len` tokens that are written straight into preallocated
+`np.int32` arrays of shape `(batch_size, seq_len)`. Documents continue in the next sequence, so no tokens are padded.
+
+Example::
+
+    from squirrel_datasets_core.preprocessing.packing import tokenize_and_pack
+
+    tokenizer = transformers.AutoTokenizer.from_pretrained("gpt2")
+    batches = driver.get_iter(batch_size=1024).to(
+        tokenize_and_pack,
+        tokenize=lambda texts: tokenizer(texts)["input_ids"],
+        seq_len=1024,
+        batch_size=8,
+        eos_id=tokenizer.eos_token_id,
+    )
+"""
+from __future__ import annotations
+
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+__all__ = ["WhitespaceTokenizer", "pack_tokens", "tokenize_and_pack"]
+
+TokenizeFn = Callable[[List[str]], Sequence[Sequence[int]]]
+
+
+class WhitespaceTokenizer:
+    """Trivial tokenizer that splits texts at whitespace and numbers the words in the order they are first seen.
+
+    It implements the batch-encode interface of :py:func:`tokenize_and_pack` without any dependencies, for tests and
+    benchmarks.
+    """
+
+    def __init__(self) -> None:
+        """Init the tokenizer with an empty vocabulary."""
+        self.vocab: Dict[str, int] = {}
+
+    def __call__(self, texts: List[str]) -> List[List[int]]:
+        """Encode a batch of texts into lists of token ids."""
+        vocab = self.vocab
+        return [[vocab.setdefault(word, len(vocab)) for word in text.split()] for text in texts]
+
+
+def _concat(ids: Sequence[Sequence[int]], eos_id: Optional[int]) -> np.ndarray:
+    """Concatenate the token ids of a batch of documents into one array, appending `eos_id` to every document."""
+    lengths = np.fromiter(map(len, ids), dtype=np.int64, count=len(ids))
+    tokens = np.fromiter(chain.from_iterable(ids), dtype=np.int32, count=int(lengths.sum()))
+    if eos_id is None:
+        return tokens
+    return np.insert(tokens, np.cumsum(lengths), eos_id)
+
+
+def pack_tokens(
+    token_batches: Iterable[Sequence[Sequence[int]]],
+    seq_len: int,
+    batch_size: int,
+    eos_id: Optional[int] = None,
+    drop_last: bool = False,
+) -> Iterator[np.ndarray]:
+    """Pack the token ids of documents into batches of sequences of `seq_len` tokens.
+
+    The tokens of each batch of documents are concatenated in order into one array, with `eos_id` inserted after every
+    document, and then copied into the yielded arrays. Tokens at the end of the stream that do not fill a sequence are
+    dropped.
+
+    Args:
+        token_batches (Iterable[Sequence[Sequence[int]]]): Token ids of batches of documents, e.g. the output of a
+            batch-encode call per batch.
+        seq_len (int): Number of tokens per sequence.
+        batch_size (int): Number of sequences per array.
+        eos_id (int, optional): If provided, this token is appended to every document. Defaults to None.
+        drop_last (bool, optional): If True, the last array is dropped if it has less than `batch_size` sequences.
+            Defaults to False.
+
+    Yields:
+        np.ndarray: New `np.int32` arrays of shape `(batch_size, seq_len)`, the last one may have fewer rows.
+    """
+    if seq_len < 1 or batch_size < 1:
+        raise ValueError(f"seq_len and batch_size must be positive, got {seq_len} and {batch_size}")
+
+    out = np.empty((batch_size, seq_len), dtype=np.int32)
+    flat = out.reshape(-1)
+    filled = 0
+    for ids in token_batches:
+        tokens = _concat(ids, eos_id)
+        pos = 0
+        while pos < len(tokens):
+            n = min(len(tokens) - pos, flat.size - filled)
+            flat[filled : filled + n] = tokens[pos : pos + n]
+            filled += n
+            pos += n
+            if filled == flat.size:
+                yield out
+                out = np.empty((batch_size, seq_len), dtype=np.int32)
+                flat = out.reshape(-1)
+                filled = 0
+
+    rows = filled // seq_len
+    if rows and not drop_last:
+        yield out[:rows]
+
+
+def _iter_texts(items: Iterable[Any], text_key: str) -> Iterator[str]:
+    """Yield the texts of strings, samples or lists of them."""
+    for item in items:
+        if isinstance(item, list):
+            for sample in item:
+                yield sample if isinstance(sample, str) else sample[text_key]
+        else:
+            yield item if isinstance(item, str) else item[text_key]
+
+
+def tokenize_and_pack(
+    items: Iterable[Union[str, Dict[str, Any], List]],
+    tokenize: TokenizeFn,
+    seq_len: int,
+    batch_size: int,
+    text_key: str = "text",
+    tokenize_batch_size: int = 1024,
+    eos_id: Optional[int] = None,
+    drop_last: bool = False,
+) -> Iterator[np.ndarray]:
+    """Tokenize a stream of documents in batches and pack their tokens into arrays of shape `(batch_size, seq_len)`.
+
+    To be used as a stage of a :py:class:`squirrel.iterstream.Composable`, e.g. after
+    :py:meth:`C4DatasetDriver.get_iter` or :py:meth:`CC100Driver.get_iter`::
+
+        it.to(tokenize_and_pack, tokenize=WhitespaceTokenizer(), seq_len=2048, batch_size=8)
+
+    Args:
+        items (Iterable[Union[str, Dict[str, Any], List]]): Texts, samples with the text under `text_key`, or lists of
+            them, e.g. the batches of :py:meth:`C4DatasetDriver.get_iter` with `batch_size`.
+        tokenize (Callable[[List[str]], Sequence[Sequence[int]]]): Batch-encode callable that maps a list of texts to
+            the token ids of every text.
+        seq_len (int): Number of tokens per sequence.
+        batch_size (int): Number of sequences per array.
+        text_key (str, optional): Key of the text in the samples. Defaults to "text".
+        tokenize_batch_size (int, optional): Number of texts passed to `tokenize` at once. Defaults to 1024.
+        eos_id (int, optional): If provided, this token is appended to every document. Defaults to None.
+        drop_last (bool, optional): If True, the last array is dropped if it has less than `batch_size` sequences.
+            Defaults to False.
+
+    Yields:
+        np.ndarray: `np.int32` arrays of shape `(batch_size, seq_len)`, see :py:func:`pack_tokens`.
+    """
+    texts = _iter_texts(items, text_key)
+    token_batches = map(tokenize, iter(lambda: list(islice(texts, tokenize_batch_size)), []))
+    yield from pack_tokens(token_batches, seq_len, batch_size, eos_id=eos_id, drop_last=drop_last)
@@ -1,57 +1,79 @@
+"""Squirrel plugin that registers the drivers and sources of this package.
+
+Importing every dataset package to collect its ``DRIVERS`` and ``SOURCES`` pulls in all of their dependencies (pandas,
+PIL, requests, docutils, ...). Therefore, the hooks read a static manifest that is generated at build time with::
+
+    python -m squirrel_datasets_core.squirrel_plugin
+
+and drivers are only imported once they are instantiated. If the manifest is missing, the hooks fall back to
+discovering drivers and sources by importing the dataset packages.
+"""
 import contextlib
+import functools
 import importlib
+import json
 import pkgutil
-from typing import List, Tuple, Type
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
 
 from squirrel.catalog import CatalogKey, Source
 from squirrel.driver import Driver
 from squirrel.framework.plugins.hookimpl import hookimpl
 
+MANIFEST_PATH = Path(__file__).parent / "plugin_manifest.json"
 
-def get_hub_driver() -> Driver:
-    """Imports and returns the hub driver class"""
-    from squirrel_datasets_core.driver.hub import HubDriver
+# drivers that are not part of a dataset package, they depend on optional extras of this package
+EXTRA_DRIVERS = {
+    "hub": "squirrel_datasets_core.driver.hub:HubDriver",
+    "deeplake": "squirrel_datasets_core.driver.deeplake:DeeplakeDriver",
+    "huggingface": "squirrel_datasets_core.driver.huggingface:HuggingfaceDriver",
+    "torchvision": "squirrel_datasets_core.driver.torchvision:TorchvisionDriver",
+}
 
-    return HubDriver
 
+class LazyDriver:
+    """Placeholder for a driver class that imports the driver only when it is instantiated.
 
-def get_deeplake_driver() -> Driver:
-    """Imports and returns the deeplake driver class"""
-    from squirrel_datasets_core.driver.deeplake import DeeplakeDriver
-
-    return DeeplakeDriver
-
+    :py:meth:`squirrel.catalog.catalog.CatalogSource.get_driver` looks up drivers by their `name` attribute and calls
+    the matching class, hence a `LazyDriver` can be returned from the `squirrel_drivers` hook instead of the class.
+    """
 
-def get_huggingface_driver() -> Driver:
-    """Imports and returns the huggingface driver class"""
-    from squirrel_datasets_core.driver.huggingface import HuggingfaceDriver
+    def __init__(self, name: str, target: str) -> None:
+        """Initialize LazyDriver.
 
-    return HuggingfaceDriver
+        Args:
+            name (str): Name of the driver, i.e. the `name` attribute of the driver class.
+            target (str): Import path of the driver class in the form "package.module:ClassName".
+        """
+        self.name = name
+        self.target = target
+        self._cls = None
 
+    def load(self) -> Type[Driver]:
+        """Import and return the driver class."""
+        if self._cls is None:
+            module, _, attr = self.target.partition(":")
+            self._cls = getattr(importlib.import_module(module), attr)
+        return self._cls
 
-def get_torchvision_driver() -> Driver:
-    """Imports and returns the torchvision driver class"""
-    from squirrel_datasets_core.driver.torchvision import TorchvisionDriver
+    def __call__(self, *args, **kwargs) -> Driver:
+        """Instantiate the driver class."""
+        return self.load()(*args, **kwargs)
 
-    return TorchvisionDriver
+    def __repr__(self) -> str:  # noqa D105
+        return f"{self.__class__.__name__}(name={self.name!r}, target={self.target!r})"
 
 
-@hookimpl
-def squirrel_drivers() -> List[Type[Driver]]:
-    """Custom drivers added by this package."""
+def discover_drivers() -> List[Type[Driver]]:
+    """Import all dataset packages and collect their `DRIVERS`. Extra drivers are imported if their dependencies are
+    installed.
+    """
     import squirrel_datasets_core.datasets as ds
 
     drivers = []
-    add_drivers = {
-        "hub": get_hub_driver,
-        "deeplake": get_deeplake_driver,
-        "huggingface": get_huggingface_driver,
-        "torchvision": get_torchvision_driver,
-    }
-
-    for d in add_drivers:
+    for d, target in EXTRA_DRIVERS.items():
         try:
-            drivers.append(add_drivers[d]())
+            drivers.append(LazyDriver(d, target).load())
         except ImportError as e:
             print(f"Failed to import {d} driver with error: {e}")
 
@@ -67,6 +89,71 @@ def squirrel_drivers() -> List[Type[Driver]]:
     return drivers
 
 
+def discover_sources() -> List[Tuple[CatalogKey, Source]]:
+    """Import all dataset packages and collect their `SOURCES`."""
+    import squirrel_datasets_core.datasets as ds
+
+    datasets = []
+    for m in pkgutil.iter_modules(ds.__path__):
+        with contextlib.suppress(AttributeError):
+            d = importlib.import_module(f"{ds.__package__}.{m.name}").SOURCES
+            datasets += d
+    return datasets
+
+
+def build_manifest() -> Dict[str, List[Dict[str, Any]]]:
+    """Build the plugin manifest by importing all dataset packages.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: JSON serializable manifest with the keys "drivers" and "sources".
+    """
+    drivers = [{"name": name, "target": target} for name, target in EXTRA_DRIVERS.items()]
+    for d in discover_drivers():
+        target = f"{d.__module__}:{d.__qualname__}"
+        if target not in EXTRA_DRIVERS.values():
+            drivers.append({"name": d.name, "target": target})
+
+    sources = [
+        {
+            "key": {"identifier": key.identifier, "version": key.version},
+            "source": {"driver_name": s.driver_name, "driver_kwargs": s.driver_kwargs, "metadata": s.metadata},
+        }
+        for key, s in discover_sources()
+    ]
+    return {"drivers": drivers, "sources": sources}
+
+
+def write_manifest(path: Union[str, Path] = MANIFEST_PATH) -> None:
+    """Build the plugin manifest and write it to `path`."""
+    with open(path, "w") as f:
+        json.dump(build_manifest(), f, separators=(",", ":"))
+
+
+@functools.lru_cache(maxsize=None)
+def load_manifest(path: Union[str, Path] = MANIFEST_PATH) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """Load the plugin manifest. Returns None if it does not exist."""
+    try:
+        with open(path, "rb") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _lazy_drivers() -> List[LazyDriver]:
+    """Lazy drivers listed in the manifest, created once per process so that imported classes are reused."""
+    return [LazyDriver(d["name"], d["target"]) for d in load_manifest()["drivers"]]
+
+
+@hookimpl
+def squirrel_drivers() -> List[Union[Type[Driver], LazyDriver]]:
+    """Custom drivers added by this package."""
+    if load_manifest() is None:
+        return discover_drivers()
+    # CatalogSource.get_driver only reads `.name` and calls the entry, which a LazyDriver supports like a class
+    return list(_lazy_drivers())
+
+
 @hookimpl
 def squirrel_sources() -> List[Tuple[CatalogKey, Source]]:
     """Custom sources added by this package.
@@ -74,12 +161,11 @@ def squirrel_sources() -> List[Tuple[CatalogKey, Source]]:
     Returns:
         List of (CatalogKey, Source) tuples.
     """
-    datasets = []
+    manifest = load_manifest()
+    if manifest is None:
+        return discover_sources()
+    return [(CatalogKey(**s["key"]), Source(**s["source"])) for s in manifest["sources"]]
 
-    import squirrel_datasets_core.datasets as ds
 
-    for m in pkgutil.iter_modules(ds.__path__):
-        with contextlib.suppress(AttributeError):
-            d = importlib.import_module(f"{ds.__package__}.{m.name}").SOURCES
-            datasets += d
-    return datasets
+if __name__ == "__main__":
+    write_manifest()
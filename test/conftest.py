@@ -8,6 +8,10 @@ Not importing from conftest is a best practice described in the note here:
 https://pytest.org/en/6.2.x/writing_plugins.html#conftest-py-local-per-directory-plugins
 """
 
+import asyncio
+import threading
+from typing import Awaitable, Callable, Iterator
+
 import pytest
 from squirrel.catalog import Catalog
 
@@ -22,3 +26,31 @@ def unit_test_fixture() -> str:
 def plugin_catalog() -> Catalog:
     """Create catalog from plugins."""
     return Catalog.from_plugins()
+
+
+@pytest.fixture()
+def http_server() -> Iterator[Callable[[Callable[..., Awaitable]], str]]:
+    """Serve aiohttp request handlers for all paths on local ports, returns a function that returns the base url."""
+    from aiohttp import web
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runners = []
+
+    async def start(handler: Callable[..., Awaitable]) -> str:
+        app = web.Application()
+        app.router.add_get("/{path:.*}", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        runners.append(runner)
+        return f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+    yield lambda handler: asyncio.run_coroutine_threadsafe(start(handler), loop).result()
+
+    for runner in runners:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
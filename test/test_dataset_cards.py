@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import pytest
+
+from squirrel_datasets_core import dataset_cards
+from squirrel_datasets_core.dataset_cards import build_index, load_index, parse_readme
+
+
+def test_index_up_to_date() -> None:
+    """The shipped index must match the dataset cards. Regenerate it with `python -m
+    squirrel_datasets_core.dataset_cards` if this test fails.
+    """
+    assert load_index() == build_index()
+
+
+def test_import_without_docutils() -> None:
+    """Importing a dataset package with a dataset card must not import docutils."""
+    code = (
+        "import sys\n"
+        "import squirrel_datasets_core.datasets.imagenet as m\n"
+        "assert m.DATASET_ATTRIBUTES['pretty_name'] == 'Imagenet Dataset'\n"
+        "print('docutils' in sys.modules)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    assert out.strip() == "False"
+
+
+def test_parse_readme_stale_index(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Dataset cards are parsed if the index entry is stale or missing."""
+    name = "squirrel_datasets_core.datasets.imagenet"
+    expected = load_index()[name]["attributes"]
+
+    monkeypatch.setattr(dataset_cards, "load_index", lambda: {name: {"hash": "stale", "attributes": {}}})
+    assert parse_readme(name) == expected
+
+    monkeypatch.setattr(dataset_cards, "load_index", lambda: {})
+    assert parse_readme(name) == expected
@@ -1,4 +1,5 @@
 import json
+import pickle
 from collections import defaultdict
 from pathlib import Path
 from typing import Iterator, Tuple
@@ -56,6 +57,52 @@ def test_allenai(tmp_path: Path) -> None:
         driver.select("en").get_iter().collect()
 
 
+def test_allenai_batched(tmp_path: Path) -> None:
+    """Batched iteration yields lists of the samples of each archive file."""
+    mock_data = list(mock_allenai_data(tmp_path))
+    config = defaultdict(dict)
+    for language, split, _, save_path in mock_data:
+        config[language][split] = [save_path]
+
+    driver = C4DatasetDriver(config).select("af", "train")
+    batches = driver.get_iter(batch_size=10, max_workers=1).collect()
+    assert [len(b) for b in batches] == [10] * 6 + [4]
+    assert sum(batches, []) == driver.get_iter(max_workers=1).collect()
+
+    index_dir = str(tmp_path / "index")
+    url = config["af"]["train"][0]
+    assert C4DatasetDriver(config, index_dir=index_dir).select("af", "train").keys(blocks_per_key=1) == [
+        (str(url), (0, 1))
+    ]
+    assert C4DatasetDriver.get(url, doc_id=5, index_dir=index_dir) == sum(batches, [])[5]
+
+    # C4 files end with a newline, the empty line after it is not a sample
+    save_gzip(url, "\n".join(json.dumps(sample) for sample in sum(batches, [])) + "\n")
+    assert C4DatasetDriver.get(url, doc_id=63, index_dir=index_dir) == sum(batches, [])[63]
+    with pytest.raises(IndexError):
+        C4DatasetDriver.get(url, doc_id=64, index_dir=index_dir)
+
+    hooked = C4DatasetDriver(config, deser_hook=lambda d: {**d, "hooked": True}).select("af", "train")
+    assert all(sample["hooked"] for sample in hooked.get_iter())
+
+
+def test_allenai_url_templates(plugin_catalog: Catalog) -> None:
+    """The shard urls of the catalog driver are generated from templates and numbers of shards."""
+    driver: C4DatasetDriver = plugin_catalog["c4"].get_driver()
+    keys = driver.select(["af", "zh"], "valid").keys()
+    base = "https://huggingface.co/datasets/allenai/c4/resolve/607bd4c8450a42878aa9ddc051a65a055450ef87/multilingual"
+    assert keys == [
+        f"{base}/c4-af-validation.tfrecord-00000-of-00001.json.gz",
+        f"{base}/c4-zh-validation.tfrecord-00000-of-00002.json.gz",
+        f"{base}/c4-zh-validation.tfrecord-00001-of-00002.json.gz",
+    ]
+    assert driver.select("ar").keys()[-1] == f"{base}/c4-ar.tfrecord-01023-of-01024.json.gz"
+    assert driver.select().keys() == [
+        url for iso in driver.available_languages for url in C4_MULTILINGUAL_CONFIG[iso]["train"]
+    ]
+    assert len(pickle.dumps(driver)) < 100_000
+
+
 @pytest.mark.skip(reason="Dataset is on public storage.")
 def test_allenai_public_data(plugin_catalog: Catalog) -> None:
     """Test loading a single language from the C4 corpus."""
@@ -66,3 +113,40 @@ def test_allenai_public_data(plugin_catalog: Catalog) -> None:
     it = driver.select("af", "valid").get_iter(shuffle_key_buffer=1, shuffle_item_buffer=1, prefetch_buffer=1)
     data = it.take(TAKE).tqdm().collect()
     assert len(data) == TAKE
+
+
+def test_allenai_interleave(tmp_path: Path) -> None:
+    """Languages are interleaved with the given weights, reproducibly by seed."""
+    mock_data = list(mock_allenai_data(tmp_path))
+    config = defaultdict(dict)
+    for language, split, _, save_path in mock_data:
+        config[language][split] = [save_path]
+    config["af"]["train"] = config["af"]["train"] * 3
+
+    driver = C4DatasetDriver(config)
+    language_of = {}
+    for language in ("af", "am", "zu"):
+        for sample in driver.select(language).get_iter():
+            language_of[sample["url"]] = language
+
+    def languages(**select_kwargs) -> list:
+        it = driver.select(["af", "am", "zu"], **select_kwargs).get_iter(max_workers=1)
+        return [language_of[sample["url"]] for sample in it.take(200)]
+
+    mixed = languages(weights={"af": 1, "am": 1, "zu": 2}, seed=0)
+    assert sorted(mixed) == sorted(["af"] * 192 + ["am"] * 3 + ["zu"] * 5)
+    assert mixed == languages(weights={"af": 1, "am": 1, "zu": 2}, seed=0)
+    assert mixed != languages(weights={"af": 1, "am": 1, "zu": 2}, seed=1)
+    assert set(mixed[:20]) == {"af", "am", "zu"}
+
+    # temperature 1 follows the number of shards, cycling repeats exhausted languages
+    assert driver.select(["af", "am", "zu"]).temperature_weights(1.0) == pytest.approx(
+        {"af": 0.6, "am": 0.2, "zu": 0.2}
+    )
+    assert len(set(driver.select(["am", "zu"]).temperature_weights(100.0).values())) == 1
+    cycled = languages(temperature=1.0, seed=0, cycle=True)
+    assert len(cycled) == 200
+    assert 90 < cycled.count("af") < 150
+
+    with pytest.raises(ValueError):
+        driver.select(["af", "am"], weights={"af": 1})
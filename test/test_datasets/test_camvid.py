@@ -44,3 +44,18 @@ def test_camvid(tmp_path: Path) -> None:
             break
 
     assert len(driver.get_iter("val", hooks=[_test_hook], parse_label=False, parse_image=False).collect()) == 1
+
+
+def test_camvid_batch_decode(tmp_path: Path) -> None:
+    """Images and labels of a batch are stacked into one array each."""
+    N = 10
+    shape = (48, 36)
+    mock_camvid_data(N, tmp_path, shape)
+    driver = CamvidDriver(tmp_path)
+
+    batches = driver.get_iter("train", batch_decode=4).collect()
+    assert [len(b["image_url"]) for b in batches] == [4, 4, 2]
+    for batch in batches:
+        assert batch["image"].shape == (len(batch["image_url"]),) + shape + (4,)
+        assert batch["label"].shape == batch["image"].shape
+        assert batch["split"] == ["train"] * len(batch["image_url"])
@@ -1,3 +1,4 @@
+import lzma
 from pathlib import Path
 
 import numpy as np
@@ -45,12 +46,37 @@ def test_cc100(tmp_path: Path) -> None:
     for sample in driver.select("af").get_iter():
         assert sample["text"] is not None
 
+    text = lzma.decompress(save_path_af.read_bytes()).decode()
+    assert list(CC100Driver.get(save_path_af, compression="xz")) == [{"text": doc} for doc in text.split("\n\n")]
+
     assert len(driver.select().get_iter().collect()) == 25
+    assert (
+        driver.select("am").get_iter(max_workers=1, decompress_workers=2).collect()
+        == driver.select("am").get_iter(max_workers=1).collect()
+    )
 
     with pytest.raises(KeyError):
         driver.select("en").get_iter().collect()
 
 
+def test_cc100_sub_shards(tmp_path: Path) -> None:
+    """Multi-block shards are split into sub-shard keys and support random access."""
+    docs = [create_random_str(np.random.randint(10, 100)) for _ in range(50)]
+    text = "\n\n".join(docs).encode()
+    save_path = tmp_path / "af.txt.xz"
+    save_path.write_bytes(b"".join(lzma.compress(text[i : i + 300]) for i in range(0, len(text), 300)))
+
+    driver = CC100Driver({"af": str(save_path)}, index_dir=str(tmp_path / "index")).select("af")
+    keys = driver.keys(blocks_per_key=2)
+    assert len(keys) > 1
+    assert all(url == str(save_path) for url, _ in keys)
+    records = driver.get_iter(keys_kwargs={"blocks_per_key": 2}, max_workers=1).collect()
+    assert records == [{"text": doc} for doc in docs]
+    assert CC100Driver.get(str(save_path), compression="xz", doc_id=17, index_dir=str(tmp_path / "index")) == {
+        "text": docs[17]
+    }
+
+
 @pytest.mark.skip(reason="Dataset is on public storage.")
 def test_cc100_public_data(plugin_catalog: Catalog) -> None:
     """Test loading a single language from the CC100 corpus."""
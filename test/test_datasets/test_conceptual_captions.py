@@ -1,11 +1,14 @@
 import io
 import urllib
-from typing import Any, Iterable
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Tuple
 from unittest.mock import patch
 
 import numpy as np
 import pytest
 import requests
+from aiohttp import web
 from PIL import Image
 from squirrel.catalog import Catalog
 
@@ -15,6 +18,14 @@ from squirrel_datasets_core.datasets.conceptual_captions.driver import CC12MDriv
 SHAPE = (10, 10, 3)
 
 
+def random_png() -> bytes:
+    """Encode a random image as PNG"""
+    rand_img = np.random.randint(0, 255, size=SHAPE).astype(np.uint8)
+    img_byte_arr = io.BytesIO()
+    Image.fromarray(rand_img).save(img_byte_arr, format="PNG")
+    return img_byte_arr.getvalue()
+
+
 class MockImageResponse:
     calls = 0
     fail_n_times = 1
@@ -26,11 +37,7 @@ class MockImageResponse:
             # test broken URL
             raise urllib.error.HTTPError(None, None, None, None, None)
 
-        rand_img = np.random.randint(0, 255, size=SHAPE).astype(np.uint8)
-        img_byte_arr = io.BytesIO()
-        Image.fromarray(rand_img).save(img_byte_arr, format="PNG")
-        img_byte_arr.seek(0)
-        return img_byte_arr.read()
+        return random_png()
 
 
 class MockTextResponse:
@@ -91,6 +98,78 @@ def test_conceptual_captions_driver() -> None:
         assert sample["image"].shape == SHAPE
 
 
+@pytest.mark.parametrize(
+    "downloader,decode_workers,image_size",
+    [("aiohttp", 0, None), ("aiohttp", 2, (5, 4)), ("urllib", 2, None), ("urllib", 0, (5, 4))],
+)
+def test_conceptual_captions_pipeline(
+    http_server: Callable, downloader: str, decode_workers: int, image_size: Optional[Tuple[int, int]]
+) -> None:
+    """Images are downloaded and decoded in threads or in a process pool, broken urls and images are dropped."""
+
+    async def handler(request: web.Request) -> web.Response:
+        name = request.match_info["path"]
+        if name == "missing":
+            return web.Response(status=404)
+        if name == "broken":
+            return web.Response(body=b"not an image")
+        if name == "truncated":
+            png = random_png()
+            return web.Response(body=png[: len(png) // 2])
+        return web.Response(body=random_png())
+
+    url = http_server(handler)
+    names = ["missing", "broken", "truncated"] + [str(i) for i in range(10)]
+    lines = [f"{url}/{name}\tcaption {name}".encode("utf-8") for name in names]
+
+    with patch("requests.get") as get:
+        get.return_value.__enter__.return_value.iter_lines.return_value = lines
+        it = CC12MDriver("test").get_iter(
+            downloader=downloader,
+            fetch_kwargs={"concurrency": 4} if downloader == "aiohttp" else None,
+            decode_workers=decode_workers,
+            decode_buffer=3,
+            image_size=image_size,
+        )
+        samples = it.collect()
+
+    assert sorted(s["caption"] for s in samples) == sorted(f"caption {i}" for i in range(10))
+    for sample in samples:
+        assert not sample["error"]
+        assert sample["image"].shape == (SHAPE if image_size is None else (*image_size, 3))
+    with pytest.raises(ValueError):
+        CC12MDriver("test").get_iter(downloader="curl")
+
+
+@pytest.mark.parametrize("downloader", ["urllib", "aiohttp"])
+def test_conceptual_captions_cache(http_server: Callable, tmp_path: Path, downloader: str) -> None:
+    """Later epochs read images from the cache and skip urls that are not found or not images."""
+    calls = Counter()
+
+    async def handler(request: web.Request) -> web.Response:
+        name = request.match_info["path"]
+        calls[name] += 1
+        if name == "missing":
+            return web.Response(status=404)
+        if name == "broken":
+            return web.Response(body=b"not an image")
+        return web.Response(body=random_png())
+
+    url = http_server(handler)
+    names = ["missing", "broken"] + [str(i) for i in range(5)]
+    lines = [f"{url}/{name}\tcaption {name}".encode("utf-8") for name in names]
+
+    driver = CC12MDriver("test", cache_dir=str(tmp_path))
+    with patch("requests.get") as get:
+        get.return_value.__enter__.return_value.iter_lines.return_value = lines
+        epochs = [driver.get_iter(downloader=downloader).collect() for _ in range(2)]
+
+    assert calls == {name: 1 for name in names}
+    for samples in epochs:
+        assert sorted(s["caption"] for s in samples) == sorted(f"caption {i}" for i in range(5))
+        assert all(s["image"].shape == SHAPE for s in samples)
+
+
 @pytest.mark.skip(reason="Dataset is on public storage.")
 def test_conceptual_captions_public_data(plugin_catalog: Catalog) -> None:
     """Test the conceptual captions loader"""
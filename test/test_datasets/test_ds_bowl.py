@@ -45,3 +45,19 @@ def test_ds_bowl_driver(tmp_path: Path) -> None:
             break
 
     assert len(driver.get_iter("stage1_train", hooks=[_test_hook]).collect()) == 1
+
+
+def test_ds_bowl_driver_batch_decode(tmp_path: Path) -> None:
+    """Images and masks of a batch are loaded together and match the samples loaded one by one."""
+    N = 5
+    mock_ds_bowl_data(N, tmp_path)
+    driver = DataScienceBowl2018Driver(tmp_path)
+
+    samples = {s["sample_url"]: s for s in driver.get_iter("stage1_train")}
+    batches = driver.get_iter("stage1_train", batch_decode=2).collect()
+    assert [len(b["sample_url"]) for b in batches] == [2, 2, 1]
+    for batch in batches:
+        assert batch["image"].shape == (len(batch["sample_url"]), 256, 256, 4)
+        for url, image, masks in zip(batch["sample_url"], batch["image"], batch["masks"]):
+            np.testing.assert_array_equal(image, samples[url]["image"])
+            assert len(masks) == len(samples[url]["masks"])
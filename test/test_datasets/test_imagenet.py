@@ -1,8 +1,9 @@
 from pathlib import Path
 from typing import Callable, Dict, Iterator, List, Tuple
 
+import numpy as np
 import pytest
-from squirrel_datasets_core.datasets.imagenet import RawImageNetDriver
+from squirrel_datasets_core.datasets.imagenet import RawImageNetDriver, index
 
 from mock_utils import create_image_folder, create_random_str
 
@@ -93,9 +94,10 @@ def mock_blacklist_info(tmp_path: Path) -> str:
 
 
 @pytest.fixture
-def imagenet_generate_data(tmp_path: Path) -> None:
+def imagenet_generate_data(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
     """Generate imagenet mock data"""
     N_CLASSES = 10
+    monkeypatch.setenv("SQUIRREL_IMAGENET_INDEX", str(tmp_path / "index"))
 
     source_path, cls_names, train_image_names, val_image_names, _ = mock_imagenet_data(N_CLASSES, tmp_path)
     mapping_url = mock_imagenet_cls_mapping(cls_names, tmp_path)
@@ -233,3 +235,96 @@ def test_raw_imagenet_driver_train_set(
             split_mapping_exists=True,
             loc_mapping_exists=use_loc_train_mapping_url,
         )
+
+
+def test_raw_imagenet_driver_target_size(imagenet_generate_data: Callable) -> None:
+    """Test that imagenet images are decoded at reduced size."""
+    imagenet_driver = RawImageNetDriver(url=imagenet_generate_data["source_path"])
+    samples = imagenet_driver.get_iter(split="test", buffer_size=2, target_size=64).take(2).collect()
+    for sample in samples:
+        assert sample["image"].shape == (64, 64, 3)
+
+
+def test_raw_imagenet_driver_cache_listing(
+    imagenet_generate_data: Callable, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that the cached file listing yields the same samples as listing the directories."""
+    monkeypatch.setenv("SQUIRREL_LISTING_CACHE", str(tmp_path / "listings"))
+    imagenet_driver = RawImageNetDriver(url=imagenet_generate_data["source_path"])
+    expected = {s["url"] for s in imagenet_driver.get_iter(split="train", parse=False)}
+    for _ in range(2):
+        samples = imagenet_driver.get_iter(split="train", parse=False, cache_listing=True)
+        assert {s["url"] for s in samples} == expected
+    assert len(list((tmp_path / "listings").iterdir())) == 1
+
+
+def test_raw_imagenet_index(imagenet_generate_data: Callable, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the mapping files are parsed once into memory-mapped arrays, which are rebuilt if a file changes."""
+    loc_url = imagenet_generate_data["loc_val_mapping_url"]
+    driver = RawImageNetDriver(url=imagenet_generate_data["source_path"], **imagenet_generate_data)
+
+    with open(loc_url) as f:
+        rows = [row.strip().split(",") for row in f.readlines()[1:]]
+    loc_map = driver.get_loc_mapper(loc_url)
+    assert isinstance(loc_map.boxes, np.memmap)
+    assert len(loc_map) == len(rows)
+    for file_name, bbox in rows:
+        class_id, *x = bbox.split(" ")
+        assert loc_map[file_name] == [{"class_id": class_id, "loc": [int(ax) for ax in x]}]
+    assert "missing" not in loc_map
+    assert loc_map.get("missing") is None
+
+    cls_map = driver.get_id_to_idx_and_name_mapper()
+    assert len(cls_map) == 10
+    assert driver.get_val_blacklist_indices() == {-1, 0}
+    assert driver.get_val_clsidx_list()[3] == 2
+
+    built = []
+    builders = {k: lambda url, f=f: built.append(url) or f(url) for k, f in index._BUILDERS.items()}
+    monkeypatch.setattr(index, "_BUILDERS", builders)
+    assert driver.get_id_to_idx_and_name_mapper() == cls_map
+    assert built == []
+
+    with open(imagenet_generate_data["val_blacklist_url"], "w") as f:
+        f.write("3\n4\n5")
+    assert driver.get_val_blacklist_indices() == {2, 3, 4}
+    assert built == [str(imagenet_generate_data["val_blacklist_url"])]
+
+
+def test_raw_imagenet_driver_global_shuffle(imagenet_generate_data: Callable) -> None:
+    """Test that the global shuffle is an exact, seeded permutation that can be resumed from an offset."""
+    imagenet_driver = RawImageNetDriver(url=imagenet_generate_data["source_path"])
+    urls = [s["url"] for s in imagenet_driver.get_iter(split="train", parse=False, shuffle="global", seed=1)]
+    assert sorted(urls) == sorted(s["url"] for s in imagenet_driver.get_iter(split="train", parse=False))
+    assert urls != sorted(urls)
+    assert urls == [s["url"] for s in imagenet_driver.get_iter(split="train", parse=False, shuffle="global", seed=1)]
+    assert urls != [s["url"] for s in imagenet_driver.get_iter(split="train", parse=False, shuffle="global", seed=2)]
+
+    resumed = imagenet_driver.get_iter(split="train", parse=False, shuffle="global", seed=1, offset=5)
+    assert [s["url"] for s in resumed] == urls[5:]
+
+    with pytest.raises(ValueError):
+        imagenet_driver.get_iter(split="train", shuffle="local")
+
+
+@pytest.mark.parametrize("split", ["train", "val"])
+def test_raw_imagenet_label_index(split: str, imagenet_generate_data: Callable) -> None:
+    """Test that labels attached in chunks equal the labels of the per-sample stages."""
+    driver = RawImageNetDriver(url=imagenet_generate_data["source_path"], **imagenet_generate_data)
+    urls = sorted(str(p) for p in Path(imagenet_generate_data["source_path"], split).rglob("*.JPEG"))
+    cls_map = driver.get_id_to_idx_and_name_mapper()
+    loc_map = driver.get_loc_mapper(imagenet_generate_data[f"loc_{split}_mapping_url"])
+
+    expected = [{"url": url} for url in urls]
+    if split == "train":
+        expected = RawImageNetDriver.parse_gt_train(expected, cls_map=cls_map)
+    else:
+        expected = RawImageNetDriver.filter_val_samples_by_idx(expected, driver.get_val_blacklist_indices())
+        expected = RawImageNetDriver.parse_gt_val(
+            expected, driver.get_idx_to_id_and_name_mapper(), driver.get_val_clsidx_list()
+        )
+    expected = list(RawImageNetDriver.parse_bbox(expected, cls_map=cls_map, loc_map=loc_map))
+
+    samples = driver.get_iter(split=split, parse=False, shuffle=False, label_chunk_size=3).collect()
+    assert sorted(samples, key=lambda s: s["url"]) == expected
+    assert any(s["bboxes"] for s in expected) == (split == "train")
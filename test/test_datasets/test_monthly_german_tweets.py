@@ -47,3 +47,41 @@ def test_german_tweets(tmp_path: Path) -> None:
     for sample in driver.get_iter():
         for k in keys:
             assert sample[k] is not None
+
+
+def test_german_tweets_streaming(tmp_path: Path) -> None:
+    """Tweets are parsed from the json array without relying on the layout of the archive."""
+    tweets = [{"id": i, "text": f'reply,{{"quoted": {i}}} ,\n{{ "x"'} for i in range(5)]
+    save_gzip(tmp_path / "record.json.gz", json.dumps(tweets, indent=2))
+    driver = MonthlyGermanTweetsDriver(tmp_path)
+    assert driver.get_iter(max_workers=1).collect() == tweets
+    assert driver.parse_error_count == 0
+
+    # a truncated archive yields the tweets before the error
+    save_gzip(tmp_path / "record.json.gz", json.dumps(tweets)[:-20])
+    assert driver.get_iter(max_workers=1).collect() == tweets[:4]
+    assert driver.parse_error_count == 1
+
+
+def test_german_tweets_fields(tmp_path: Path) -> None:
+    """Only the requested fields are returned, optionally as columns of batches."""
+    tweets = [{"id": i, "text": str(i), "user": {"id": i * 10, "name": "x"}, "urls": []} for i in range(5)]
+    save_gzip(tmp_path / "record.json.gz", "[\n" + ",\n".join(json.dumps(tweet) for tweet in tweets) + "\n]")
+    driver = MonthlyGermanTweetsDriver(tmp_path)
+
+    fields = ["id", "user.id", "user.missing", "text"]
+    samples = driver.get_iter(fields=fields, max_workers=1).collect()
+    assert samples == [{"id": i, "user.id": i * 10, "user.missing": None, "text": str(i)} for i in range(5)]
+
+    batches = driver.get_iter(fields=["id", "user.id"], batch_size=2, max_workers=1).collect()
+    assert batches == [
+        {"id": [0, 1], "user.id": [0, 10]},
+        {"id": [2, 3], "user.id": [20, 30]},
+        {"id": [4], "user.id": [40]},
+    ]
+    assert driver.get_iter(batch_size=5, max_workers=1).collect()[0]["user"] == [tweet["user"] for tweet in tweets]
+
+    # fields are added to other keyword arguments of get
+    assert driver.get_iter(fields=["id"], get_kwargs={"batch_size": 5}, max_workers=1).collect() == [
+        {"id": list(range(5))}
+    ]
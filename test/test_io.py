@@ -0,0 +1,497 @@
+import asyncio
+import gzip
+import io
+import json
+import lzma
+import os
+import pickle
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pytest
+from aiohttp import web
+from PIL import Image
+from squirrel.iterstream import FilePathGenerator
+
+from squirrel_datasets_core.io import (
+    BufferPool,
+    CachedFilePathGenerator,
+    DownloadCache,
+    available_decoders,
+    decode_image,
+    decode_images,
+    fetch_urls,
+    get_filesystem,
+    iter_documents,
+    iter_json_array,
+    iter_json_lines,
+    iter_line_chunks,
+    load_image,
+    load_images,
+    load_shard_index,
+    open_decompressed,
+    prefetch_files,
+    resize_image,
+    xz_blocks,
+)
+from squirrel_datasets_core.io.decoders import DECODER_ENV_VAR, get_decoder
+
+
+def _save(tmp_path: Path, name: str, mode: str) -> Path:
+    """Save a random image with the given PIL mode."""
+    img = Image.fromarray((np.random.rand(32, 48, 3) * 255).astype("uint8")).convert(mode)
+    path = tmp_path / name
+    img.save(path)
+    return path
+
+
+@pytest.mark.parametrize("decoder", ["pil", "simplejpeg", "turbojpeg", "opencv"])
+@pytest.mark.parametrize(
+    "name, mode", [("rgb.jpg", "RGB"), ("gray.JPEG", "L"), ("rgb.png", "RGB"), ("rgba.png", "RGBA"), ("p.png", "P")]
+)
+def test_decoders_match_pil(tmp_path: Path, decoder: str, name: str, mode: str) -> None:
+    """All decoders return the same array as PIL."""
+    if decoder not in available_decoders():
+        pytest.skip(f"{decoder} is not installed")
+    path = _save(tmp_path, name, mode)
+    expected = np.array(Image.open(path))
+    img = load_image(str(path), decoder=decoder)
+    assert img.shape == expected.shape
+    assert img.dtype == expected.dtype
+    # JPEG decoders may use different IDCT implementations
+    assert np.abs(img.astype(int) - expected.astype(int)).max() <= (2 if ".jp" in name.lower() else 0)
+
+
+def test_decoder_selection(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Decoders are selected by name, environment variable or automatically."""
+    assert get_decoder("jpeg", "pil").name == "pil"
+    assert get_decoder(None).name == "pil"
+    # decoders that do not support a format are replaced by the automatic choice
+    assert get_decoder("png", "simplejpeg").name == get_decoder("png").name
+
+    monkeypatch.setenv(DECODER_ENV_VAR, "pil")
+    assert get_decoder("png").name == "pil"
+
+    with pytest.raises(ValueError):
+        get_decoder("jpeg", "unknown")
+
+
+@pytest.mark.parametrize("decoder", ["simplejpeg", "turbojpeg"])
+def test_jpeg_decoders_fall_back_to_pil(tmp_path: Path, decoder: str) -> None:
+    """Files with a JPEG extension that are not JPEGs are decoded with PIL."""
+    if decoder not in available_decoders():
+        pytest.skip(f"{decoder} is not installed")
+    path = tmp_path / "png.jpg"
+    Image.fromarray((np.random.rand(32, 48, 3) * 255).astype("uint8")).save(path, format="PNG")
+    np.testing.assert_array_equal(load_image(str(path), decoder=decoder), np.array(Image.open(path)))
+
+
+@pytest.mark.parametrize("decoder", ["pil", "simplejpeg", "turbojpeg"])
+@pytest.mark.parametrize("target_size, max_size", [(None, (300, 400)), (100, (150, 200)), ((40, 90), (75, 100))])
+def test_target_size(tmp_path: Path, decoder: str, target_size: int, max_size: tuple) -> None:
+    """Reduced-size decoding shrinks JPEGs down to at least the target size and keeps other formats at full size."""
+    if decoder not in available_decoders():
+        pytest.skip(f"{decoder} is not installed")
+    path = tmp_path / "img.jpg"
+    Image.fromarray((np.random.rand(300, 400, 3) * 255).astype("uint8")).save(path)
+    img = load_image(str(path), decoder=decoder, target_size=target_size)
+    min_size = (0, 0) if target_size is None else np.broadcast_to(target_size, 2)
+    assert min_size[0] <= img.shape[0] <= max_size[0]
+    assert min_size[1] <= img.shape[1] <= max_size[1]
+
+    path = _save(tmp_path, "img.png", "RGB")
+    assert load_image(str(path), decoder=decoder, target_size=8).shape == (32, 48, 3)
+
+
+@pytest.mark.parametrize("decoder", ["pil", "simplejpeg", "turbojpeg", "opencv"])
+@pytest.mark.parametrize("name, mode", [("rgb.jpg", "RGB"), ("gray.jpg", "L"), ("rgb.png", "RGB"), ("p.png", "P")])
+def test_output_buffer(tmp_path: Path, decoder: str, name: str, mode: str) -> None:
+    """Images are decoded into preallocated arrays and arrays from a buffer pool."""
+    if decoder not in available_decoders():
+        pytest.skip(f"{decoder} is not installed")
+    path = str(_save(tmp_path, name, mode))
+    expected = load_image(path, decoder=decoder)
+
+    out = np.zeros_like(expected)
+    assert load_image(path, decoder=decoder, out=out) is out
+    np.testing.assert_array_equal(out, expected)
+
+    with pytest.raises(ValueError):
+        load_image(path, decoder=decoder, out=np.zeros((1, 1), dtype=expected.dtype))
+
+    pool = BufferPool()
+    img = load_image(path, decoder=decoder, out=pool)
+    np.testing.assert_array_equal(img, expected)
+    pool.release(img)
+    assert load_image(path, decoder=decoder, out=pool) is img
+    assert (pool.hits, pool.misses) == (1, 1)
+
+
+def test_get_filesystem(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Filesystems are cached by protocol and storage options and reused by load_image."""
+    fs = get_filesystem(str(tmp_path))
+    assert fs.protocol[0] == "file"
+    assert get_filesystem(f"file://{tmp_path}") is fs
+    with ThreadPoolExecutor(4) as pool:
+        assert set(pool.map(get_filesystem, [str(tmp_path)] * 8)) == {fs}
+    assert get_filesystem("memory://a") is get_filesystem("memory://b")
+    assert get_filesystem("memory://a") is not fs
+
+    # http filesystems bound the connection pool of their session
+    http = get_filesystem("https://example.com/a.jpg", max_connections=4)
+    assert get_filesystem("https://example.com/b.jpg", max_connections=4) is http
+    assert http.get_client.args == (4,)
+    assert get_filesystem("https://example.com/a.jpg", max_connections=8) is not http
+
+    path = str(_save(tmp_path, "rgb.png", "RGB"))
+    opened = []
+    monkeypatch.setattr(type(fs), "open", lambda self, *args, **kwargs: opened.append(self) or open(path, "rb"))
+    load_image(path)
+    assert opened == [fs]
+
+
+def test_load_images(tmp_path: Path) -> None:
+    """Images of the same shape are stacked into one array, or decoded into a preallocated one."""
+    paths = [str(_save(tmp_path, f"{i}.png", "RGB")) for i in range(5)]
+    expected = np.stack([load_image(p) for p in paths])
+
+    np.testing.assert_array_equal(load_images(paths, max_workers=2), expected)
+    out = np.zeros_like(expected)
+    assert load_images(paths, out=out) is out
+    np.testing.assert_array_equal(out, expected)
+    with pytest.raises(ValueError):
+        load_images(paths, out=out[:2])
+
+    pool = BufferPool()
+    np.testing.assert_array_equal(load_images(paths, out=pool), expected)
+    assert pool.misses == len(paths) + 1
+    assert isinstance(load_images(paths, stack=False), list)
+
+    # images of different shapes are returned as list
+    paths.append(str(_save(tmp_path, "gray.png", "L")))
+    images = load_images(paths)
+    assert isinstance(images, list)
+    assert [img.shape for img in images] == [img.shape for img in expected] + [(32, 48)]
+
+
+def test_read_ahead(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Remote files are fetched at once before decoding, local files are streamed unless read-ahead is requested."""
+    path = _save(tmp_path, "rgb.png", "RGB")
+    expected = load_image(str(path))
+    memory = get_filesystem("memory://")
+    memory.pipe_file("memory://images/rgb.png", path.read_bytes())
+
+    fetched = []
+    for fs in (memory, get_filesystem(str(tmp_path))):
+        cat_file = type(fs).cat_file
+        monkeypatch.setattr(type(fs), "cat_file", lambda self, p, *a, **kw: fetched.append(p) or cat_file(self, p))
+    np.testing.assert_array_equal(load_image("memory://images/rgb.png"), expected)
+    np.testing.assert_array_equal(load_image(str(path)), expected)
+    assert len(fetched) == 1
+    np.testing.assert_array_equal(load_image(str(path), read_ahead=True), expected)
+    assert len(fetched) == 2
+
+    # open_kwargs are passed to open instead
+    np.testing.assert_array_equal(load_image(str(path), open_kwargs={"block_size": 2**20}, read_ahead=True), expected)
+    assert len(fetched) == 2
+
+
+def test_prefetch_files(tmp_path: Path) -> None:
+    """Prefetched files keep the order of the stream and decode to the same images."""
+    paths = [str(_save(tmp_path, f"{i}.jpg", "RGB")) for i in range(10)]
+    prefetched = prefetch_files(paths, size=4).collect()
+    assert [p for p, _ in prefetched] == paths
+    for path, data in prefetched:
+        assert data == Path(path).read_bytes()
+        np.testing.assert_array_equal(decode_image(data, path), load_image(path))
+
+
+def test_fetch_urls(http_server: Callable) -> None:
+    """Urls are fetched concurrently, transient errors are retried and other errors are returned with the url."""
+    calls = Counter()
+    in_flight = [0, 0]
+
+    async def handler(request: web.Request) -> web.Response:
+        path = request.match_info["path"]
+        calls[path] += 1
+        if path.startswith("missing"):
+            return web.Response(status=404)
+        if path.startswith("flaky") and calls[path] == 1:
+            return web.Response(status=503)
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        return web.Response(body=path.encode())
+
+    url = http_server(handler)
+    names = [f"{kind}{i}" for i in range(20) for kind in ("ok", "flaky", "missing")]
+    items = [{"url": f"{url}/{name}"} for name in names]
+    fetched = fetch_urls(items, get_url=lambda x: x["url"], concurrency=30, limit_per_host=10, backoff=0.01).collect()
+
+    assert sorted(item["url"] for item, _, _ in fetched) == sorted(x["url"] for x in items)
+    for item, content, error in fetched:
+        name = item["url"].rsplit("/", 1)[1]
+        if name.startswith("missing"):
+            assert content is None and error.status == 404
+        else:
+            assert content == name.encode() and error is None
+    assert calls["missing0"] == 1 and calls["flaky0"] == 2
+    # urls are served concurrently up to the limit of connections to the host
+    assert in_flight[1] == 10
+
+    # stopping early cancels the outstanding downloads
+    assert next(iter(fetch_urls([f"{url}/ok0"] * 100, concurrency=4)))[1] == b"ok0"
+    with pytest.raises(ValueError):
+        fetch_urls([], concurrency=0)
+
+
+def test_download_cache(tmp_path: Path) -> None:
+    """Content is evicted least recently used first, failed urls are shared between processes."""
+    cache = DownloadCache(tmp_path / "cache", max_size=1000, refresh_interval=0)
+    for i, url in enumerate("abcd"):
+        cache.put(url, url.encode() * 200)
+        os.utime(cache.path(url), (i, i))
+    assert cache.get("a") == b"a" * 200
+    assert cache.get("x") is None
+    cache.put("e", b"e" * 200)
+    cache.put("f", b"f" * 200)
+    # b and c were used least recently, evicting them brings the cache below 90% of its size
+    assert [url for url in "abcdef" if cache.get(url) is not None] == ["a", "d", "e", "f"]
+    assert int((tmp_path / "cache" / "size").read_text()) == 800
+
+    # replacing cached content only adds the difference in size
+    large = DownloadCache(tmp_path / "large", max_size=10_000)
+    for _ in range(5):
+        large.put("a", b"a" * 200)
+    large.put("a", b"a" * 350)
+    assert int((tmp_path / "large" / "size").read_text()) == 350
+
+    other = pickle.loads(pickle.dumps(cache))
+    cache.add_failed("a")
+    assert cache.is_failed("a") and other.is_failed("a")
+    assert cache.get("a") is None
+    assert not other.is_failed("b")
+    other.add_failed("b")
+    assert cache.is_failed("b")
+    assert cache.evict() == 600
+
+
+def test_fetch_urls_cache(http_server: Callable, tmp_path: Path) -> None:
+    """Cached urls are not downloaded again, urls that are not found are added to the negative cache."""
+    calls = Counter()
+
+    async def handler(request: web.Request) -> web.Response:
+        path = request.match_info["path"]
+        calls[path] += 1
+        return web.Response(status=404) if path == "missing" else web.Response(body=path.encode())
+
+    url = http_server(handler)
+    urls = [f"{url}/{name}" for name in ("a", "b", "missing")]
+    cache = DownloadCache(tmp_path, refresh_interval=0)
+    for _ in range(2):
+        fetched = {u: content for u, content, _ in fetch_urls(urls, cache=cache)}
+        assert fetched == {urls[0]: b"a", urls[1]: b"b", urls[2]: None}
+    assert calls == {"a": 1, "b": 1, "missing": 2}
+    assert cache.is_failed(urls[2]) and not cache.is_failed(urls[0])
+
+
+def test_decode_images(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Images are decoded in worker processes in the order of the stream, errors are returned with the item."""
+    paths = [_save(tmp_path, f"{i}.png", "RGB") for i in range(6)]
+    data = [p.read_bytes() for p in paths] + [None, b"not an image"]
+    decoded = decode_images(data, workers=2, buffer=3).collect()
+    assert [x for x, _, _ in decoded] == data
+    for path, (_, img, error) in zip(paths, decoded):
+        np.testing.assert_array_equal(img, load_image(str(path)))
+        assert error is None
+    assert decoded[-2][1:] == (None, None)
+    assert decoded[-1][1] is None and decoded[-1][2] is not None
+
+    # images that do not fit into a slot of the shared memory are pickled
+    items = [{"data": d} for d in data[:2]]
+    resized = decode_images(items, get_data=lambda x: x["data"], workers=1, size=(16, 8), slot_size=100).collect()
+    assert [x for x, _, _ in resized] == items
+    for path, (_, img, _) in zip(paths, resized):
+        np.testing.assert_array_equal(img, resize_image(load_image(str(path)), (16, 8)))
+        assert img.shape == (16, 8, 3)
+
+    # all images are pickled if the shared memory is full
+    def no_space(*args) -> None:
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "posix_fallocate", no_space, raising=False)
+    for (_, img, error), (_, expected, _) in zip(decode_images(data[:2], workers=1).collect(), decoded):
+        np.testing.assert_array_equal(img, expected)
+        assert error is None
+
+
+def test_cached_file_path_generator(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Listings are written to a manifest, reused while the fingerprint matches and rebuilt otherwise."""
+    root = tmp_path / "data"
+    for name in ("a/1.jpg", "a/2.jpg", "b/3.jpg", "4.jpg"):
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_bytes(b"x" * len(name))
+
+    fs = get_filesystem(str(root))
+    calls = []
+    find = type(fs).find
+    monkeypatch.setattr(type(fs), "find", lambda self, *a, **kw: calls.append(a) or find(self, *a, **kw))
+
+    gen = CachedFilePathGenerator(str(root), nested=True, cache_dir=tmp_path / "cache")
+    paths = gen.collect()
+    assert paths == sorted(FilePathGenerator(str(root), nested=True).collect())
+    assert gen.manifest_path.exists()
+    assert gen.entries()[0][1:] == (len("4.jpg"), str((root / "4.jpg").stat().st_mtime))
+    assert len(calls) == 1
+
+    # reused by a new generator, rebuilt on refresh or if the top level changes
+    assert CachedFilePathGenerator(str(root), nested=True, cache_dir=tmp_path / "cache").collect() == paths
+    assert len(calls) == 1
+    CachedFilePathGenerator(str(root), nested=True, cache_dir=tmp_path / "cache", refresh=True).collect()
+    assert len(calls) == 2
+    (root / "c").mkdir()
+    (root / "c" / "5.jpg").write_bytes(b"x")
+    assert len(CachedFilePathGenerator(str(root), nested=True, cache_dir=tmp_path / "cache").collect()) == 5
+    assert len(calls) == 3
+
+    # non nested listings contain the directories and use their own manifest
+    flat = CachedFilePathGenerator(str(root), cache_dir=tmp_path / "cache")
+    assert flat.collect() == sorted(FilePathGenerator(str(root)).collect())
+    assert flat.manifest_path != gen.manifest_path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 2**20])
+def test_iter_json_lines(chunk_size: int) -> None:
+    """Json lines are parsed incrementally, independent of the chunk size, and optionally in batches."""
+    records = [{"text": "x" * i, "url": f"http://{i}"} for i in range(10)]
+    data = (
+        "\n".join(json.dumps(r) for r in records[:5]) + "\n\n" + "\n".join(json.dumps(r) for r in records[5:])
+    ).encode()
+
+    lines = [line for chunk in iter_line_chunks(io.BytesIO(data), chunk_size) for line in chunk]
+    assert lines == data.split(b"\n")
+    assert list(iter_json_lines(io.BytesIO(data), chunk_size=chunk_size)) == records
+    assert list(iter_json_lines(io.BytesIO(data + b"\n"), chunk_size=chunk_size, loads=json.loads)) == records
+    batches = list(iter_json_lines(io.BytesIO(data), batch_size=4, chunk_size=chunk_size))
+    assert [len(b) for b in batches] == [4, 4, 2]
+    assert sum(batches, []) == records
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 2**20])
+@pytest.mark.parametrize("data", [b"", b"a", b"\n\n", b"a\n\n\nb\n\n\n\nc\n", b"\nab\n\ncd\n\n", "ä\n\nö".encode()])
+def test_iter_documents(data: bytes, chunk_size: int) -> None:
+    """Documents are split like `bytes.split`, also if separators cross chunk boundaries."""
+    assert list(iter_documents(io.BytesIO(data), chunk_size=chunk_size)) == data.split(b"\n\n")
+
+
+@pytest.mark.parametrize("workers", [0, 1, 3])
+def test_open_decompressed(tmp_path: Path, workers: int) -> None:
+    """Decompressing in background threads yields the same content, blocks of xz files are located by their index."""
+    checks = (lzma.CHECK_NONE, lzma.CHECK_CRC32, lzma.CHECK_CRC64, lzma.CHECK_SHA256)
+    parts = [f"{i} ".encode() * 20_000 + b"\n" for i in range(5)]
+    xz_path, gz_path = tmp_path / "data.txt.xz", tmp_path / "data.json.gz"
+    xz_path.write_bytes(b"".join(lzma.compress(p, check=checks[i % len(checks)]) for i, p in enumerate(parts)))
+    gz_path.write_bytes(b"".join(gzip.compress(p) for p in parts))
+
+    blocks = xz_blocks(str(xz_path))
+    assert [b.uncompressed_size for b in blocks] == [len(p) for p in parts]
+    for path in (xz_path, gz_path):
+        with open_decompressed(str(path), workers=workers, chunk_size=1000) as f:
+            assert f.readline() == parts[0]
+            assert f.read() == b"".join(parts[1:])
+
+    # stream padding between xz streams and early closing
+    xz_path.write_bytes(lzma.compress(parts[0]) + b"\x00" * 8 + lzma.compress(parts[1]))
+    assert len(xz_blocks(str(xz_path))) == 2
+    if workers > 1:
+        with open_decompressed(str(xz_path), workers=workers) as f:
+            assert f.read() == parts[0] + parts[1]
+    with open_decompressed(str(xz_path), workers=workers) as f:
+        assert f.read(3) == parts[0][:3]
+    with pytest.raises(ValueError):
+        xz_blocks(str(gz_path))
+
+
+@pytest.mark.parametrize("separator", [b"\n\n", b"\n"])
+def test_shard_index(tmp_path: Path, separator: bytes) -> None:
+    """Ranges of blocks contain each document once, also if separators cross block boundaries."""
+    data = b"a\n\nbb\n\n\ncc\n\n\n\nd\nee\n\n"
+    pieces = [data[:2], data[2:3], data[3:9], data[9:10], data[10:18], data[18:]]
+    xz_path, gz_path = tmp_path / "data.txt.xz", tmp_path / "data.txt.gz"
+    xz_path.write_bytes(b"".join(lzma.compress(p) for p in pieces))
+    gz_path.write_bytes(gzip.compress(data))
+    expected = data.split(separator)
+
+    for path, n_blocks in ((xz_path, len(pieces)), (gz_path, 1)):
+        index = load_shard_index(str(path), separator=separator, cache_dir=tmp_path / "index")
+        assert (index.n_blocks, index.n_docs) == (n_blocks, len(expected))
+        for blocks_per_range in (1, 2, n_blocks):
+            docs = []
+            for start, stop in index.ranges(blocks_per_range):
+                with index.open(start, stop) as f:
+                    part = list(iter_documents(f, separator)) if index.count(start, stop) else []
+                assert len(part) == index.count(start, stop)
+                docs += part
+            assert docs == expected
+        assert [index.document(i) for i in range(index.n_docs)] == expected
+        with pytest.raises(IndexError):
+            index.document(index.n_docs)
+
+    # the index is cached
+    assert len(list((tmp_path / "index").iterdir())) == 2
+    load_shard_index(str(xz_path), separator=separator, cache_dir=tmp_path / "index")
+    assert len(list((tmp_path / "index").iterdir())) == 2
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64, 2**20])
+def test_iter_json_array(chunk_size: int) -> None:
+    """Elements of a json array are parsed incrementally, also if they are split across chunks."""
+    elements = [{"text": 'a,{"b": "ü 😀"}', "n": 0.5}, 123456, -1.5e-10, "x", None, True, [1, [2]], {}]
+    for indent in (None, 2):
+        data = json.dumps(elements, indent=indent, ensure_ascii=False).encode()
+        assert list(iter_json_array(io.BytesIO(data), chunk_size=chunk_size)) == elements
+    assert list(iter_json_array(io.BytesIO(b" [ ] "), chunk_size=chunk_size)) == []
+
+    # one object per line is parsed line by line, until a line does not hold a single object
+    objects = [{"id": i, "text": 'a,{"b": 1}'} for i in range(6)]
+    lines = (
+        [json.dumps(obj) for obj in objects[:3]]
+        + [json.dumps(objects[3], indent=2)]
+        + [json.dumps(obj) for obj in objects[4:]]
+    )
+    for sep in (",\n", "\n,"):
+        data = ("[\n" + sep.join(lines) + "\n]\n").encode()
+        assert list(iter_json_array(io.BytesIO(data), chunk_size=chunk_size)) == objects
+
+    invalid_lines = (b"[\n{},\n]", b"[\n{}\n{}\n]", b"[\n{}\n")
+    for invalid in (b"", b'{"a": 1}', b"[1,]", b"[1 2]", b'[{"a": 1}', b"[1.x]") + invalid_lines:
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_json_array(io.BytesIO(invalid), chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("simdjson", [True, False])
+def test_iter_json_array_fields(monkeypatch: pytest.MonkeyPatch, simdjson: bool) -> None:
+    """Only the requested fields are extracted, with and without a lazy parser, line by line and by raw decoding."""
+    if simdjson:
+        pytest.importorskip("simdjson")
+    else:
+        monkeypatch.setitem(sys.modules, "simdjson", None)
+    objects = [
+        {"id": 0, "user": {"id": 10, "tags": ["a", {"b": 1}]}, "text": "x"},
+        {"id": 2**70, "user": "name"},
+        [1, 2],
+    ]
+    fields = ["id", "user.id", "user.tags", "user.missing", "text"]
+    expected = [
+        {"id": 0, "user.id": 10, "user.tags": ["a", {"b": 1}], "user.missing": None, "text": "x"},
+        {"id": 2**70, "user.id": None, "user.tags": None, "user.missing": None, "text": None},
+        dict.fromkeys(fields),
+    ]
+    for indent in (None, 2):
+        data = ("[\n" + ",\n".join(json.dumps(obj, indent=indent) for obj in objects) + "\n]").encode()
+        assert list(iter_json_array(io.BytesIO(data), fields=fields)) == expected
@@ -0,0 +1,95 @@
+import random
+import string
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+from squirrel.iterstream import IterableSource
+
+from squirrel_datasets_core.preprocessing.dedup import BloomFilter, ExactDedup, MinHashDedup, deduplicate
+from squirrel_datasets_core.preprocessing.packing import WhitespaceTokenizer, pack_tokens, tokenize_and_pack
+
+
+@pytest.mark.parametrize("tokenize_batch_size", [1, 3, 1024])
+def test_tokenize_and_pack(tokenize_batch_size: int) -> None:
+    """Tokens of all documents are packed in order into arrays of shape (batch_size, seq_len)."""
+    docs = [" ".join(f"w{i}" for i in range(n)) for n in (5, 0, 13, 7, 1, 22)]
+    tokenizer = WhitespaceTokenizer()
+    tokens = sum(tokenizer(docs), [])
+
+    batches = list(
+        tokenize_and_pack(docs, WhitespaceTokenizer(), seq_len=5, batch_size=4, tokenize_batch_size=tokenize_batch_size)
+    )
+    assert [b.shape for b in batches] == [(4, 5)] * 2 + [(1, 5)]
+    assert all(b.dtype == np.int32 for b in batches)
+    assert np.concatenate(batches).ravel().tolist() == tokens[:45]
+
+    dropped = list(tokenize_and_pack(docs, WhitespaceTokenizer(), seq_len=5, batch_size=4, drop_last=True))
+    assert len(dropped) == 2
+
+
+def test_tokenize_and_pack_stage() -> None:
+    """Samples and lists of samples of a Composable are packed with an eos token after every document."""
+    samples = [{"text": "a b c"}, {"text": "b c"}, {"text": "d"}]
+    it = IterableSource([samples[:2], samples[2:]]).to(
+        tokenize_and_pack, tokenize=WhitespaceTokenizer(), seq_len=3, batch_size=2, eos_id=-1
+    )
+    assert [b.tolist() for b in it] == [[[0, 1, 2], [-1, 1, 2]], [[-1, 3, -1]]]
+
+    assert list(pack_tokens([[[1, 2]]], seq_len=3, batch_size=1)) == []
+    with pytest.raises(ValueError):
+        list(pack_tokens([], seq_len=0, batch_size=1))
+
+
+def _documents(n: int, n_words: int = 200, seed: int = 0) -> List[str]:
+    """Random documents of `n_words` words."""
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(5000)]
+    return [" ".join(rng.choices(words, k=n_words)) for _ in range(n)]
+
+
+@pytest.mark.parametrize("dedup", [ExactDedup, MinHashDedup])
+def test_deduplicate(tmp_path: Path, dedup: type) -> None:
+    """Documents that occurred before in the stream, in a batch or in a previous run are dropped."""
+    docs = _documents(50)
+    samples = [{"text": doc, "id": i} for i, doc in enumerate(docs + docs[:10] + docs[40:])]
+    state = dedup(capacity=1000)
+    kept = list(IterableSource(samples).to(deduplicate, state, batch_size=8))
+    assert [sample["id"] for sample in kept] == list(range(50))
+
+    url = str(tmp_path / "state" / "dedup.npz")
+    state.save(url)
+    batches = [[{"text": doc} for doc in docs[45:]], [{"text": doc} for doc in _documents(3, seed=1)]]
+    assert [len(b) for b in deduplicate(batches, dedup.load(url))] == [0, 3]
+
+
+def test_minhash_near_duplicates() -> None:
+    """Documents with a few changed words are near-duplicates, documents with different words are not."""
+    docs = _documents(100, n_words=300)
+    changed = []
+    for doc in docs[:50]:
+        words = doc.split()
+        words[100] = words[200] = "changed"
+        changed.append(" ".join(words))
+
+    dedup = MinHashDedup(capacity=1000)
+    assert dedup(docs).all()
+    assert not dedup(changed).any()
+    assert dedup(_documents(100, n_words=300, seed=1)).all()
+
+    signatures = dedup.signatures(docs[:2] + [""])
+    assert signatures.shape == (3, 128) and signatures.dtype == np.uint32
+    assert dedup.band_keys(signatures).shape == (3, 16)
+    assert dedup([]).shape == (0,)
+
+
+def test_bloom_filter() -> None:
+    """The false positive rate of the Bloom filter is about the error rate at its capacity."""
+    rng = np.random.default_rng(0)
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    keys = rng.integers(0, 2**64, size=10_000, dtype=np.uint64)
+    assert not bloom.add(keys).any()
+    assert bloom.contains(keys).all()
+    assert bloom.contains(rng.integers(0, 2**64, size=10_000, dtype=np.uint64)).mean() < 0.02
+    assert bloom.add(keys[:2].repeat(2)).all()
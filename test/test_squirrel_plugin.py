@@ -0,0 +1,36 @@
+import json
+import subprocess
+import sys
+
+from squirrel.catalog import Catalog
+
+from squirrel_datasets_core.datasets.cc100 import CC100Driver
+from squirrel_datasets_core.squirrel_plugin import LazyDriver, build_manifest, load_manifest, squirrel_drivers
+
+
+def test_manifest_up_to_date() -> None:
+    """The shipped manifest must match the drivers and sources declared in the dataset packages. Regenerate it with
+    `python -m squirrel_datasets_core.squirrel_plugin` if this test fails.
+    """
+    assert load_manifest() == json.loads(json.dumps(build_manifest()))
+
+
+def test_from_plugins_does_not_import_datasets() -> None:
+    """Building the catalog from plugins must not import any dataset package."""
+    code = (
+        "import sys\n"
+        "from squirrel.catalog import Catalog\n"
+        "cat = Catalog.from_plugins()\n"
+        "assert 'cc100' in cat\n"
+        "print([m for m in sys.modules if m.startswith('squirrel_datasets_core.datasets')])\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    assert out.strip() == "[]"
+
+
+def test_lazy_driver(plugin_catalog: Catalog) -> None:
+    """Drivers are resolved from their import path when the catalog instantiates them."""
+    drivers = {d.name: d for d in squirrel_drivers()}
+    assert isinstance(drivers["cc100"], LazyDriver)
+    assert drivers["cc100"].load() is CC100Driver
+    assert isinstance(plugin_catalog["cc100"].get_driver(), CC100Driver)